@@ -1,10 +1,29 @@
 import asyncio
+import contextvars
+import datetime
 import hashlib
 import json
+import math
+import re
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from decimal import Decimal
+from functools import partial
 from time import perf_counter
-from typing import Any, Dict, List, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import sqlparse
+import zstandard
 from aioch import Client
 from asgiref.sync import async_to_sync
 from clickhouse_driver import Client as SyncClient
@@ -14,19 +33,28 @@ from django.core.cache import cache
 from django.utils.timezone import now
 from sentry_sdk.api import capture_exception
 
-from ee.clickhouse.errors import wrap_query_error
-from ee.clickhouse.timer import get_timer_thread
+from ee.clickhouse.errors import MultipleQueryErrors, wrap_query_error
+from ee.clickhouse.instrumentation import get_instrumentation_context
+from ee.clickhouse.query_profiles import get_query_settings, in_query_profile
+from ee.clickhouse.replicas import ReplicaPools
+from ee.clickhouse.timer import SingleThreadedTimer, get_timer_thread
 from posthog import redis
 from posthog.constants import AnalyticsDBMS
-from posthog.internal_metrics import incr, timing
+from posthog.internal_metrics import gauge, incr, timing
 from posthog.settings import (
     CLICKHOUSE_ASYNC,
     CLICKHOUSE_CA,
+    CLICKHOUSE_CLUSTER,
     CLICKHOUSE_CONN_POOL_MAX,
     CLICKHOUSE_CONN_POOL_MIN,
     CLICKHOUSE_DATABASE,
     CLICKHOUSE_HOST,
+    CLICKHOUSE_MAX_CONCURRENT_QUERIES,
+    CLICKHOUSE_MUTATIONS_CONN_POOL_MAX,
     CLICKHOUSE_PASSWORD,
+    CLICKHOUSE_READ_HOSTS,
+    CLICKHOUSE_REPLICA_FAILURE_COOLDOWN_SECONDS,
+    CLICKHOUSE_REPLICATION,
     CLICKHOUSE_SECURE,
     CLICKHOUSE_USER,
     CLICKHOUSE_VERIFY,
@@ -36,11 +64,23 @@ from posthog.settings import (
 from posthog.utils import get_safe_cache
 
 CACHE_TTL = 60  # seconds
+# Empty results are likely to change soon, e.g. for data that's only just being ingested
+CACHE_EMPTY_RESULT_TTL = 5  # seconds
+# Cached results are JSON with types like datetime and UUID tagged, see `_to_tagged`, compressed with zstd
+CACHE_FORMAT_VERSION = b"\x02"
+# Results of single-flight queries only need to stay around for the queries waiting on them to pick them up
+SINGLE_FLIGHT_RESULT_TTL = 10  # seconds
+# Larger results aren't shared through Redis, queries waiting on them run on their own instead
+SINGLE_FLIGHT_MAX_RESULT_SIZE = 16 * 1024 * 1024  # bytes
 SLOW_QUERY_THRESHOLD_MS = 15000
+# Tables whose contents are specific to the host they're read on
+HOST_LOCAL_TABLE_REGEX = re.compile(r"\bsystem\s*\.", re.IGNORECASE)
+# How much longer than their timeout `execute_many` waits on queries, for ClickHouse to report them as timed out
+EXECUTE_MANY_TIMEOUT_GRACE = 5  # seconds
+# How long past its max_execution_time a query is left running before it's killed
+KILL_QUERY_GRACE_SECONDS = 10
 QUERY_TIMEOUT_THREAD = get_timer_thread("ee.clickhouse.client", SLOW_QUERY_THRESHOLD_MS)
 
-_request_information: Optional[Dict] = None
-
 
 def make_ch_pool(**overrides) -> ChPool:
     kwargs = {
@@ -70,12 +110,18 @@ if PRIMARY_DB != AnalyticsDBMS.CLICKHOUSE:
     def async_execute(query, args=None, settings=None, with_column_types=False):
         raise ClickHouseNotConfigured()
 
-    def sync_execute(query, args=None, settings=None, with_column_types=False):
+    def sync_execute(query, args=None, settings=None, with_column_types=False, columnar=False):
         raise ClickHouseNotConfigured()
 
     def cache_sync_execute(query, args=None, redis_client=None, ttl=None, settings=None, with_column_types=False):
         raise ClickHouseNotConfigured()
 
+    def execute_many(queries, settings=None, timeout=None, return_exceptions=False, columnar=False):
+        raise ClickHouseNotConfigured()
+
+    def stream_execute(query, args=None, settings=None, progress_callback=None):
+        raise ClickHouseNotConfigured()
+
 
 else:
     if not TEST and CLICKHOUSE_ASYNC:
@@ -117,60 +163,388 @@ else:
         def async_execute(query, args=None, settings=None, with_column_types=False):
             return sync_execute(query, args, settings=settings, with_column_types=with_column_types)
 
+    # Reads are spread across CLICKHOUSE_READ_HOSTS when there are any, see `_get_pool`
+    read_pools = ReplicaPools(
+        {host: make_ch_pool(host=host) for host in CLICKHOUSE_READ_HOSTS} or {CLICKHOUSE_HOST: ch_pool},
+        failure_cooldown=CLICKHOUSE_REPLICA_FAILURE_COOLDOWN_SECONDS,
+    )
+    mutations_pool = make_ch_pool(connections_min=0, connections_max=CLICKHOUSE_MUTATIONS_CONN_POOL_MAX)
+
     def cache_sync_execute(query, args=None, redis_client=None, ttl=CACHE_TTL, settings=None, with_column_types=False):
+        """Like `sync_execute`, but caching results in Redis for `ttl` seconds. A `ttl` of 0 skips the cache."""
+        if not ttl:
+            return sync_execute(query, args, settings=settings, with_column_types=with_column_types)
         if not redis_client:
             redis_client = redis.get_client()
         key = _key_hash(query, args)
-        if redis_client.exists(key):
-            result = _deserialize(redis_client.get(key))
-            return result
-        else:
-            result = sync_execute(query, args, settings=settings, with_column_types=with_column_types)
-            redis_client.set(key, _serialize(result), ex=ttl)
+        cached = redis_client.get(key)
+        if cached is not None:
+            try:
+                result = _deserialize(cached)
+            except ValueError:  # Written in a previous format
+                pass
+            else:
+                incr("clickhouse_cache_hit")
+                return result
+
+        incr("clickhouse_cache_miss")
+        result = sync_execute(query, args, settings=settings, with_column_types=with_column_types)
+        try:
+            serialized = _serialize(result)
+        except TypeError as err:
+            capture_exception(err)
             return result
+        gauge("clickhouse_cache_result_size", len(serialized))
+        is_empty = len(result) == 0 or (with_column_types and len(result[0]) == 0)
+        redis_client.set(key, serialized, ex=min(ttl, CACHE_EMPTY_RESULT_TTL) if is_empty else ttl)
+        return result
+
+    def sync_execute(query, args=None, settings=None, with_column_types=False, columnar=False):
+        """
+        Runs a query and returns its rows. With `columnar`, the result is a list of columns instead, each a tuple of
+        the values of every row, which saves transposing it for results that are processed column by column.
+        """
+        settings = get_query_settings(settings, is_read=_is_read_query(query, args))
+        if _is_single_flight(query, args):
+            return _single_flight_execute(
+                query, args, settings, execute=_sync_execute, with_column_types=with_column_types, columnar=columnar
+            )
+        return _sync_execute(query, args, settings=settings, with_column_types=with_column_types, columnar=columnar)
+
+    def _sync_execute(query, args=None, settings=None, with_column_types=False, columnar=False):
+        pool = _get_pool(query, args)
+        execute = partial(_execute_with_client, query, args, settings, with_column_types, columnar)
+        if isinstance(pool, ReplicaPools):
+            return pool.run(execute)
+        with pool.get_client() as client:
+            return execute(client)
+
+    def _execute_with_client(client, query, args, settings, with_column_types, columnar):
+        killable = _is_killable(query, args)
+        start_time = perf_counter()
+        tags = {}
+        if app_settings.SHELL_PLUS_PRINT_SQL:
+            print()
+            print(format_sql(query, args))
+
+        sql, tags = _annotate_tagged_query(query, args)
+        query_id = str(uuid.uuid4())
+        timeout_task = QUERY_TIMEOUT_THREAD.schedule(_notify_of_slow_query_failure, tags)
+        kill_timer = _get_kill_query_timer(settings.get("max_execution_time")) if killable else None
+        kill_task = kill_timer.schedule(_kill_query, query_id, tags) if kill_timer else None
+
+        try:
+            result = client.execute(
+                sql, args, settings=settings, with_column_types=with_column_types, columnar=columnar, query_id=query_id,
+            )
+        except Exception as err:
+            err = wrap_query_error(err)
+            tags["failed"] = True
+            tags["reason"] = type(err).__name__
+            incr("clickhouse_sync_execution_failure", tags=tags)
+
+            raise err
+        finally:
+            execution_time = perf_counter() - start_time
+
+            QUERY_TIMEOUT_THREAD.cancel(timeout_task)
+            if kill_timer and kill_task:
+                kill_timer.cancel(kill_task)
+            timing("clickhouse_sync_execution_time", execution_time * 1000.0, tags=tags)
 
-    def sync_execute(query, args=None, settings=None, with_column_types=False):
-        with ch_pool.get_client() as client:
-            start_time = perf_counter()
-            tags = {}
             if app_settings.SHELL_PLUS_PRINT_SQL:
-                print()
-                print(format_sql(query, args))
+                print("Execution time: %.6fs" % (execution_time,))
+            context = get_instrumentation_context()
+            if context is not None:
+                progress = client.last_query.progress if client.last_query else None
+                context.totals.add(
+                    execution_time * 1000.0, progress.rows if progress else 0, progress.bytes if progress else 0,
+                )
+                if context.save:
+                    save_query(query, args, execution_time)
+        return result
 
-            sql, tags = _annotate_tagged_query(query, args)
-            timeout_task = QUERY_TIMEOUT_THREAD.schedule(_notify_of_slow_query_failure, tags)
+    _query_executor = ThreadPoolExecutor(
+        max_workers=max(CLICKHOUSE_MAX_CONCURRENT_QUERIES, 1), thread_name_prefix="clickhouse-query"
+    )
 
+    def execute_many(
+        queries: Sequence[Tuple[str, Any]],
+        settings: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        return_exceptions: bool = False,
+        columnar: bool = False,
+    ) -> List[Any]:
+        """
+        Runs independent `(query, args)` pairs concurrently, each on a pooled connection of its own, and returns their
+        results in order. At most CLICKHOUSE_MAX_CONCURRENT_QUERIES queries run at once per process.
+
+        `timeout` applies to each query as ClickHouse's `max_execution_time`, and bounds how long results are waited on.
+        Queries that fail don't stop the others: once all are done, their errors are raised together as
+        `MultipleQueryErrors`, or returned in place of their results with `return_exceptions`. Results are columnar
+        with `columnar`, as for `sync_execute`.
+        """
+        if timeout is not None:
+            settings = {**(settings or {}), "max_execution_time": math.ceil(timeout)}
+
+        def execute(query: str, args: Any) -> Any:
+            return sync_execute(query, args, settings=settings, columnar=columnar)
+
+        run_concurrently = len(queries) > 1 and CLICKHOUSE_MAX_CONCURRENT_QUERIES > 1
+        futures: List[Future] = []
+        for query, args in queries:
+            if run_concurrently:
+                # Copying the context keeps the query profile, and anything else in context variables
+                futures.append(_query_executor.submit(contextvars.copy_context().run, execute, query, args))
+                continue
+            future: Future = Future()
             try:
-                result = client.execute(sql, args, settings=settings, with_column_types=with_column_types)
+                future.set_result(execute(query, args))
+            except Exception as err:
+                future.set_exception(err)
+            futures.append(future)
+
+        wait(futures, timeout=timeout + EXECUTE_MANY_TIMEOUT_GRACE if timeout is not None else None)
+
+        results: List[Any] = []
+        errors: Dict[int, Exception] = {}
+        for index, future in enumerate(futures):
+            if not future.done():
+                future.cancel()
+                errors[index] = TimeoutError(f"ClickHouse query didn't finish within {timeout} seconds")
+            elif future.exception() is not None:
+                errors[index] = future.exception()  # type: ignore
+            results.append(errors[index] if index in errors else future.result())
+
+        if errors and not return_exceptions:
+            raise MultipleQueryErrors(errors)
+        return results
+
+    def stream_execute(
+        query: str,
+        args: Any = None,
+        settings: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> Iterator[Tuple]:
+        """
+        Like `sync_execute`, but yields rows as ClickHouse sends them, a block of `max_block_size` rows at a time,
+        instead of holding the whole result in memory. `progress_callback(rows_read, total_rows_to_read)` is called
+        whenever ClickHouse reports progress.
+
+        Settings and instrumentation are taken when called, so the rows can be iterated over later, e.g. from a
+        StreamingHttpResponse once the request has been handled. The query holds on to a pooled connection until it's
+        iterated through or closed.
+        """
+        settings = get_query_settings(settings, is_read=_is_read_query(query, args))
+        sql, tags = _annotate_tagged_query(query, args)
+        context = get_instrumentation_context()
+        killable = _is_killable(query, args)
+        return _stream_rows(_get_pool(query, args), sql, args, settings, tags, context, progress_callback, killable)
+
+    def _stream_rows(pool, sql, args, settings, tags, context, progress_callback, killable) -> Iterator[Tuple]:
+        with pool.get_client() as client:
+            start_time = perf_counter()
+            query_id = str(uuid.uuid4())
+            kill_timer = _get_kill_query_timer(settings.get("max_execution_time")) if killable else None
+            kill_task = kill_timer.schedule(_kill_query, query_id, tags) if kill_timer else None
+            rows_reported = 0
+            finished = False
+
+            try:
+                for row in client.execute_iter(sql, args, settings=settings, query_id=query_id):
+                    progress = client.last_query.progress
+                    if progress_callback is not None and progress.rows != rows_reported:
+                        rows_reported = progress.rows
+                        progress_callback(progress.rows, progress.total_rows)
+                    yield row
+                finished = True
             except Exception as err:
                 err = wrap_query_error(err)
                 tags["failed"] = True
                 tags["reason"] = type(err).__name__
-                incr("clickhouse_sync_execution_failure", tags=tags)
+                incr("clickhouse_stream_execution_failure", tags=tags)
 
                 raise err
             finally:
+                if not finished:
+                    # Rows may still be on their way, which would leave the connection unusable for other queries
+                    client.disconnect()
+                if kill_timer and kill_task:
+                    kill_timer.cancel(kill_task)
                 execution_time = perf_counter() - start_time
+                timing("clickhouse_stream_execution_time", execution_time * 1000.0, tags=tags)
+                if context is not None and client.last_query is not None:
+                    progress = client.last_query.progress
+                    context.totals.add(execution_time * 1000.0, progress.rows, progress.bytes)
 
-                QUERY_TIMEOUT_THREAD.cancel(timeout_task)
-                timing("clickhouse_sync_execution_time", execution_time * 1000.0, tags=tags)
 
-                if app_settings.SHELL_PLUS_PRINT_SQL:
-                    print("Execution time: %.6fs" % (execution_time,))
-                if _request_information is not None and _request_information.get("save", False):
-                    save_query(query, args, execution_time)
-        return result
+def _deserialize(result_bytes: bytes) -> Any:
+    if not result_bytes.startswith(CACHE_FORMAT_VERSION):
+        raise ValueError("Unknown ClickHouse result cache format")
+    return json.loads(
+        zstandard.ZstdDecompressor().decompress(result_bytes[len(CACHE_FORMAT_VERSION) :]), object_hook=_from_tagged
+    )
 
 
-def _deserialize(result_bytes: bytes) -> List[Tuple]:
-    results = []
-    for x in json.loads(result_bytes):
-        results.append(tuple(x))
-    return results
+def _serialize(result: Any) -> bytes:
+    "Raises TypeError for results with values of types that aren't kept, see `_to_tagged`"
+    return CACHE_FORMAT_VERSION + zstandard.ZstdCompressor().compress(
+        json.dumps(_to_tagged(result), separators=(",", ":")).encode("utf-8")
+    )
 
 
-def _serialize(result: Any) -> bytes:
-    return json.dumps(result).encode("utf-8")
+def _to_tagged(value: Any) -> Any:
+    """
+    Makes results JSON serializable, keeping the types JSON has no notion of as objects tagged with their type.
+    Unlike pickle, reading these back can't run any code, should anyone but us write to Redis.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_to_tagged(item) for item in value]
+    if isinstance(value, tuple):
+        return {"tuple": [_to_tagged(item) for item in value]}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"uuid": str(value)}
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    if isinstance(value, dict):
+        return {"dict": [[_to_tagged(key), _to_tagged(item)] for key, item in value.items()]}
+    raise TypeError(f"Can't serialize ClickHouse results with values of type {type(value).__name__}")
+
+
+def _from_tagged(tagged: Dict[str, Any]) -> Any:
+    ((tag, value),) = tagged.items()
+    if tag == "tuple":
+        return tuple(value)
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(value)
+    if tag == "date":
+        return datetime.date.fromisoformat(value)
+    if tag == "uuid":
+        return uuid.UUID(value)
+    if tag == "decimal":
+        return Decimal(value)
+    if tag == "dict":
+        return {key: item for key, item in value}
+    raise ValueError(f"Unknown type {tag} in cached ClickHouse result")
+
+
+def _get_pool(query: str, args: Any) -> Any:
+    """
+    Where to run a query: reads on a replica, mutations on connections of their own, everything else on CLICKHOUSE_HOST.
+
+    Replicas can lag behind CLICKHOUSE_HOST, so a read right after a write may not see it yet. Reads of system
+    tables stay on CLICKHOUSE_HOST, as these differ between hosts, e.g. columns only added to its person table.
+    """
+    if _is_read_query(query, args) and not HOST_LOCAL_TABLE_REGEX.search(query):
+        return read_pools
+    if query.lstrip().upper().startswith(("ALTER", "OPTIMIZE")):
+        return mutations_pool
+    return ch_pool
+
+
+def _is_read_query(query: str, args: Any) -> bool:
+    # Inserts take a list of rows as args, and other statements mustn't be skipped by sharing a result
+    return not isinstance(args, (list, tuple)) and query.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+def _is_single_flight(query: str, args: Any) -> bool:
+    # Only reads of query profiles, e.g. insights, are often run by several people or workers at once. Others would
+    # just pay for the round trips to Redis
+    return (
+        app_settings.CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS > 0 and in_query_profile() and _is_read_query(query, args)
+    )
+
+
+def _single_flight_execute(query: str, args: Any, settings: Any, execute: Callable, **execute_kwargs) -> Any:
+    """
+    Runs a query unless the same one is already running anywhere, in which case its result is waited for instead.
+
+    The first caller takes a lock in Redis. The others register as waiting on it and poll for the result, which
+    the first caller only publishes under a key of its own if anyone is waiting. Waiters give up and run the query
+    themselves if the lock is released without a result, e.g. after an error or for too large a result, or expires
+    because its holder died, or after CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS.
+    """
+    timeout = app_settings.CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS
+    # Held until the query is killed at the latest, so slow queries don't lose it and run again
+    lock_ttl = (settings.get("max_execution_time") or timeout) + KILL_QUERY_GRACE_SECONDS
+    key = hashlib.md5(
+        _key_hash(query, args) + json.dumps([settings, execute_kwargs], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    lock_key = f"clickhouse_single_flight/lock/{key}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    is_leader = False
+
+    try:
+        redis_client = redis.get_client()
+        while time.monotonic() < deadline:
+            if redis_client.set(lock_key, token, nx=True, ex=lock_ttl):
+                is_leader = True
+                break
+            leader_token = redis_client.get(lock_key)
+            if leader_token is None:
+                continue  # Released in the meantime, so try to take it
+            waiters_key = f"{lock_key}/{leader_token.decode()}/waiters"
+            redis_client.pipeline().incr(waiters_key).expire(waiters_key, lock_ttl).execute()
+            result = _wait_for_single_flight_result(redis_client, lock_key, leader_token, deadline)
+            if result is not None:
+                incr("clickhouse_single_flight_follower")
+                return _deserialize(result)
+            break
+    except Exception as err:
+        capture_exception(err)
+
+    run = partial(execute, query, args, settings=settings, **execute_kwargs)
+    if is_leader:
+        incr("clickhouse_single_flight_leader")
+        return _run_single_flight_leader(redis_client, lock_key, token, run)
+    incr("clickhouse_single_flight_fallback")
+    return run()
+
+
+def _wait_for_single_flight_result(
+    redis_client, lock_key: str, leader_token: bytes, deadline: float
+) -> Optional[bytes]:
+    "Polls for the result of the leader holding `leader_token`, until it releases its lock or the deadline"
+    poll_interval = 0.02
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 1.5, 0.5)
+        result, current_token = redis_client.mget(f"{lock_key}/{leader_token.decode()}", lock_key)
+        if result is not None or current_token != leader_token:
+            return result
+    return None
+
+
+def _run_single_flight_leader(redis_client, lock_key: str, token: str, execute: Callable) -> Any:
+    try:
+        result = execute()
+        try:
+            # Anyone starting to wait from now on sees the lock released without a result, and runs the query itself
+            if redis_client.get(f"{lock_key}/{token}/waiters") is not None:
+                serialized = _serialize(result)
+                if len(serialized) <= SINGLE_FLIGHT_MAX_RESULT_SIZE:
+                    redis_client.set(f"{lock_key}/{token}", serialized, ex=SINGLE_FLIGHT_RESULT_TTL)
+        except Exception as err:
+            capture_exception(err)
+        return result
+    finally:
+
+        def _release(pipe):
+            if pipe.get(lock_key) == token.encode():
+                pipe.multi()
+                pipe.delete(lock_key)
+
+        try:
+            redis_client.transaction(_release, lock_key)
+        except Exception as err:
+            capture_exception(err)
 
 
 def _key_hash(query: str, args: Any) -> bytes:
@@ -179,12 +553,13 @@ def _key_hash(query: str, args: Any) -> bytes:
 
 
 def _annotate_tagged_query(query, args):
-    tags = {"kind": (_request_information or {}).get("kind"), "id": (_request_information or {}).get("id")}
+    context = get_instrumentation_context()
+    tags = context.tags() if context is not None else {"kind": None, "id": None}
     if isinstance(args, dict) and "team_id" in args:
         tags["team_id"] = args["team_id"]
     # Annotate the query with information on the request/task
-    if _request_information is not None:
-        query = f"/* {_request_information['kind']}:{_request_information['id'].replace('/', '_')} */ {query}"
+    if context is not None:
+        query = f"{context.query_comment()} {query}"
 
     return query, tags
 
@@ -195,6 +570,37 @@ def _notify_of_slow_query_failure(tags: Dict[str, Any]):
     incr("clickhouse_sync_execution_failure", tags=tags)
 
 
+def _is_killable(query: str, args: Any) -> bool:
+    # Only reads run for something in particular are killed past their deadline, not e.g. cohort inserts or mutations
+    return in_query_profile() and _is_read_query(query, args)
+
+
+def _get_kill_query_timer(max_execution_time: Optional[int]) -> Optional[SingleThreadedTimer]:
+    if not max_execution_time:
+        return None
+    return get_timer_thread(
+        f"ee.clickhouse.client.kill_query.{max_execution_time}", (max_execution_time + KILL_QUERY_GRACE_SECONDS) * 1000
+    )
+
+
+def _kill_query(query_id: str, tags: Dict[str, Any]):
+    incr("clickhouse_query_killed", tags=tags)
+    if CLICKHOUSE_REPLICATION:
+        pools = [ch_pool]
+    else:
+        # Without a cluster to kill it on, the query is killed on every host it could be running on
+        pools = list(
+            {id(pool): pool for pool in [ch_pool, *(replica.pool for replica in read_pools.replicas)]}.values()
+        )
+    on_cluster = f"ON CLUSTER {CLICKHOUSE_CLUSTER}" if CLICKHOUSE_REPLICATION else ""
+    for pool in pools:
+        try:
+            with pool.get_client() as client:
+                client.execute(f"KILL QUERY {on_cluster} WHERE query_id = %(query_id)s ASYNC", {"query_id": query_id})
+        except Exception as err:
+            capture_exception(err)
+
+
 def format_sql(sql, params, colorize=True):
     substitute_params = (
         ch_client.substitute_params if isinstance(ch_client, SyncClient) else ch_client._client.substitute_params
@@ -219,11 +625,12 @@ def save_query(sql: str, params: Dict, execution_time: float) -> None:
     """
     Save query for debugging purposes
     """
-    if _request_information is None:
+    context = get_instrumentation_context()
+    if context is None:
         return
 
     try:
-        key = "save_query_{}".format(_request_information["user_id"])
+        key = "save_query_{}".format(context.user_id)
         queries = json.loads(get_safe_cache(key) or "[]")
 
         queries.insert(
@@ -1,4 +1,5 @@
 import re
+from typing import Dict
 
 from clickhouse_driver.errors import ServerException
 
@@ -23,6 +24,18 @@ def wrap_query_error(err: Exception) -> Exception:
     return err
 
 
+class MultipleQueryErrors(Exception):
+    "Errors of queries run together by `execute_many`, by their index"
+
+    def __init__(self, errors: Dict[int, Exception]):
+        self.errors = errors
+        super().__init__(
+            "{} of the queries failed: {}".format(
+                len(errors), "; ".join(f"#{index}: {err!r}" for index, err in sorted(errors.items()))
+            )
+        )
+
+
 # From https://github.com/ClickHouse/ClickHouse/blob/master/src/Common/ErrorCodes.cpp#L15
 CLICKHOUSE_ERROR_CODE_LOOKUP = {
     0: "OK",
@@ -0,0 +1,93 @@
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+
+@dataclass
+class QueryTotals:
+    "What the ClickHouse queries of a request or task added up to"
+
+    queries: int = 0
+    wall_time_ms: float = 0
+    rows_read: int = 0
+    bytes_read: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, wall_time_ms: float, rows_read: int, bytes_read: int) -> None:
+        # Queries run by `execute_many` report from several threads at once
+        with self._lock:
+            self.queries += 1
+            self.wall_time_ms += wall_time_ms
+            self.rows_read += rows_read
+            self.bytes_read += bytes_read
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "queries": self.queries,
+            "wall_time_ms": round(self.wall_time_ms, 1),
+            "rows_read": self.rows_read,
+            "bytes_read": self.bytes_read,
+        }
+
+
+@dataclass
+class InstrumentationContext:
+    "What ClickHouse queries are being run for, e.g. a request to a route or a Celery task"
+
+    kind: str
+    id: str
+    team_id: Optional[int] = None
+    user_id: Optional[int] = None
+    insight: Optional[str] = None
+    save: bool = False  # Whether queries are kept for the debug_ch_queries endpoint
+    totals: QueryTotals = field(default_factory=QueryTotals)
+
+    def query_comment(self) -> str:
+        parts = [f"{self.kind}:{_comment_safe(self.id)}"]
+        if self.team_id is not None:
+            parts.append(f"team:{self.team_id}")
+        if self.user_id is not None:
+            parts.append(f"user:{self.user_id}")
+        if self.insight:
+            parts.append(f"insight:{_comment_safe(self.insight)}")
+        return f"/* {' '.join(parts)} */"
+
+    def tags(self) -> Dict[str, Any]:
+        "Tags for statsd. Users are left out, as they'd make for too many series"
+        return {"kind": self.kind, "id": self.id, "team_id": self.team_id, "insight": self.insight}
+
+
+_current_context: ContextVar[Optional[InstrumentationContext]] = ContextVar(
+    "clickhouse_instrumentation_context", default=None
+)
+
+
+def get_instrumentation_context() -> Optional[InstrumentationContext]:
+    return _current_context.get()
+
+
+def set_instrumentation_context(context: Optional[InstrumentationContext]) -> Token:
+    "For when setting and resetting the context happens in separate callbacks, e.g. Celery's task signals"
+    return _current_context.set(context)
+
+
+def reset_instrumentation_context(token: Token) -> None:
+    _current_context.reset(token)
+
+
+@contextmanager
+def instrumentation_context(kind: str, id: str, **kwargs) -> Iterator[InstrumentationContext]:
+    context = InstrumentationContext(kind=kind, id=id, **kwargs)
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def _comment_safe(value: str) -> str:
+    # Values can come from request parameters, so mustn't be able to end the comment
+    return re.sub(r"[^\w .:()-]", "_", str(value))
@@ -1,17 +1,16 @@
 import logging
 import re
-from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import timedelta
-from typing import Dict, Generator, List, Optional, Set, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from ee.clickhouse.client import sync_execute
 from ee.clickhouse.materialized_columns.columns import (
+    SkipIndexType,
     backfill_materialized_columns,
     get_materialized_columns,
     materialize,
 )
-from ee.clickhouse.materialized_columns.util import instance_memoize
-from ee.clickhouse.sql.person import GET_PERSON_PROPERTIES_COUNT
 from ee.settings import (
     MATERIALIZE_COLUMNS_ANALYSIS_PERIOD_HOURS,
     MATERIALIZE_COLUMNS_BACKFILL_PERIOD_DAYS,
@@ -20,34 +19,39 @@ from ee.settings import (
 )
 from posthog.models.filters.mixins.utils import cached_property
 from posthog.models.property import PropertyName, TableWithProperties
-from posthog.models.property_definition import PropertyDefinition
 from posthog.models.team import Team
+from posthog.settings import CLICKHOUSE_DATABASE, CLICKHOUSE_REPLICATION
 
 Suggestion = Tuple[TableWithProperties, PropertyName, int]
 
-logger = logging.getLogger(__name__)
-
+# How many rows are looked at to estimate the size of a property's values
+VALUE_SIZE_SAMPLE_SIZE = 100000
 
-class TeamManager:
-    @instance_memoize
-    def person_properties(self, team_id: str) -> Set[str]:
-        rows = sync_execute(GET_PERSON_PROPERTIES_COUNT, {"team_id": team_id})
-        return set(name for name, _ in rows)
+# Functions reading a property out of a JSON column, e.g. JSONExtractRaw(properties, 'key')
+JSON_FUNCTION_REGEX = re.compile(r"^(JSONExtract\w*|JSONHas|JSONType|JSONLength|visitParam\w+)$")
+SQL_TOKEN_REGEX = re.compile(
+    r"""
+    (?P<comment>/\*.*?\*/|--[^\n]*)
+    | (?P<string>'(?:[^'\\]|\\.)*')
+    | (?P<identifier>[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)
+    | (?P<punctuation>[(),])
+    | (?P<other>\S)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
 
-    @instance_memoize
-    def event_properties(self, team_id: str) -> Set[str]:
-        return set(PropertyDefinition.objects.filter(team_id=team_id).values_list("name", flat=True))
+logger = logging.getLogger(__name__)
 
 
 class Query:
-    def __init__(self, query_string: str, query_time_ms: float, min_query_time=MATERIALIZE_COLUMNS_MINIMUM_QUERY_TIME):
+    def __init__(
+        self, query_string: str, query_time_ms: float, read_rows: int = 0, read_bytes: int = 0, cpu_time_us: int = 0,
+    ):
         self.query_string = query_string
         self.query_time_ms = query_time_ms
-        self.min_query_time = min_query_time
-
-    @property
-    def cost(self) -> int:
-        return int((self.query_time_ms - self.min_query_time) / 1000) + 1
+        self.read_rows = read_rows
+        self.read_bytes = read_bytes
+        self.cpu_time_us = cpu_time_us
 
     @cached_property
     def is_valid(self):
@@ -55,23 +59,107 @@ class Query:
 
     @cached_property
     def team_id(self) -> Optional[str]:
-        matches = re.findall(r"team_id = (\d+)", self.query_string)
+        matches = re.findall(r"^/\* [^*]*\bteam:(\d+)", self.query_string) or re.findall(
+            r"team_id = (\d+)", self.query_string
+        )
         return matches[0] if matches else None
 
     @cached_property
-    def _all_properties(self) -> List[PropertyName]:
-        return re.findall(r"JSONExtract\w+\(\S+, '([^']+)'\)", self.query_string)
+    def properties(self) -> Set[Tuple[TableWithProperties, PropertyName]]:
+        "Properties the query reads out of the JSON properties of events or persons"
+        return set(parse_properties(self.query_string))
+
+
+@dataclass
+class PropertyCost:
+    """
+    What reading a property out of JSON cost queries, and what materializing it would save and take up.
+
+    Each query's cost is split evenly between the properties it reads out of JSON, as queries only stop reading the
+    whole properties column once all of them are materialized. Sizes are of uncompressed data, and all cover the
+    analysis period: storage is what the column takes up for the rows ingested over it, not for the whole table.
+    """
+
+    table: TableWithProperties
+    property: PropertyName
+    queries: int = 0
+    query_time_ms: float = 0
+    cpu_time_us: float = 0
+    read_rows: int = 0
+    read_bytes: float = 0
+    saved_read_bytes: float = 0  # Estimate of the above that reading the materialized column instead would save
+    storage_bytes: float = 0  # Estimate of the size of the materialized column for rows ingested over the period
+
+    @property
+    def net_benefit_bytes(self) -> int:
+        "Bytes that wouldn't have been read over the analysis period, less the column's size"
+        return int(self.saved_read_bytes - self.storage_bytes)
+
+
+@dataclass
+class _Scope:
+    "Part of a query between parentheses, e.g. a subquery or the arguments of a function"
+
+    is_from_subquery: bool = False
+    table: Optional[str] = None
+    # Property reads (JSON column, property) whose table is only known once the scope's FROM clause has been read
+    pending: List[Tuple[str, PropertyName]] = field(default_factory=list)
+
+
+def parse_properties(query: str) -> Iterator[Tuple[TableWithProperties, PropertyName]]:
+    """
+    Finds what properties of which table a query reads out of JSON, wherever they are in the query: in subqueries,
+    in person property filters, or wrapped in other functions like trim(BOTH '"' FROM ...) or replaceRegexpAll(...).
+
+    The `properties` column is that of the table the surrounding (sub)query selects from, or the table its FROM
+    subquery selects from. `person_props` is always person properties, as person queries alias them that way.
+    """
+    tokens = [
+        (match.lastgroup, match.group()) for match in SQL_TOKEN_REGEX.finditer(query) if match.lastgroup != "comment"
+    ]
+    scopes = [_Scope()]
+
+    for index, (kind, value) in enumerate(tokens):
+        previous = tokens[index - 1][1].upper() if index > 0 else None
+        following = tokens[index + 1][1] if index + 1 < len(tokens) else None
 
-    def properties(self, team_manager: TeamManager) -> Generator[Tuple[TableWithProperties, PropertyName], None, None]:
-        # Reverse-engineer whether a property is an "event" or "person" property by getting their event definitions.
-        # :KLUDGE: Note that the same property will be found on both tables if both are used.
-        person_props = team_manager.person_properties(self.team_id)
-        event_props = team_manager.event_properties(self.team_id)
-        for property in self._all_properties:
-            if property in person_props:
-                yield "person", property
-            if property in event_props:
-                yield "events", property
+        if value == "(":
+            scopes.append(_Scope(is_from_subquery=previous == "FROM"))
+        elif value == ")" and len(scopes) > 1:
+            scope = scopes.pop()
+            parent = scopes[-1]
+            if scope.table is None:
+                parent.pending.extend(scope.pending)
+            else:
+                yield from _resolve(scope.pending, scope.table)
+            if scope.is_from_subquery and parent.table is None:
+                parent.table = scope.table
+        elif kind == "identifier" and previous == "FROM" and following != "(":
+            # :TRICKY: Skips FROM of trim(BOTH '"' FROM JSONExtractRaw(...)), as that's followed by a function call
+            if scopes[-1].table is None:
+                scopes[-1].table = value.split(".")[-1]
+        elif kind == "identifier" and following == "(" and JSON_FUNCTION_REGEX.match(value):
+            arguments = tokens[index + 2 : index + 5]
+            if len(arguments) == 3 and arguments[1][1] == "," and arguments[2][0] == "string":
+                scopes[-1].pending.append((arguments[0][1], _unquote(arguments[2][1])))
+
+    for scope in reversed(scopes):
+        yield from _resolve(scope.pending, scope.table)
+
+
+def _resolve(
+    pending: List[Tuple[str, PropertyName]], table: Optional[str]
+) -> Iterator[Tuple[TableWithProperties, PropertyName]]:
+    for column, property in pending:
+        column = column.split(".")[-1]
+        if column == "person_props" or (column == "properties" and table == "person"):
+            yield "person", property
+        elif column == "properties":
+            yield "events", property
+
+
+def _unquote(literal: str) -> str:
+    return re.sub(r"\\(.)", r"\1", literal[1:-1])
 
 
 def get_queries(since_hours_ago: int, min_query_time: int) -> List[Query]:
@@ -81,12 +169,17 @@ def get_queries(since_hours_ago: int, min_query_time: int) -> List[Query]:
         f"""
         SELECT
             query,
-            query_duration_ms
+            query_duration_ms,
+            read_rows,
+            read_bytes,
+            arrayElement(ProfileEvents.Values, indexOf(ProfileEvents.Names, 'UserTimeMicroseconds'))
+                + arrayElement(ProfileEvents.Values, indexOf(ProfileEvents.Names, 'SystemTimeMicroseconds'))
         FROM system.query_log
         WHERE
             query NOT LIKE '%%query_log%%'
-            AND query LIKE '/* request:%%'
-            AND query NOT LIKE '%%INSERT%%'
+            AND (query LIKE '/* request:%%' OR query LIKE '/* celery:%%')
+            -- Cohort recalculations insert persons matching the cohort's person property filters
+            AND (query NOT LIKE '%%INSERT%%' OR query LIKE '%%INSERT INTO cohortpeople%%')
             AND type = 'QueryFinish'
             AND query_start_time > now() - toIntervalHour(%(since)s)
             AND query_duration_ms > %(min_query_time)s
@@ -94,29 +187,106 @@ def get_queries(since_hours_ago: int, min_query_time: int) -> List[Query]:
         """,
         {"since": since_hours_ago, "min_query_time": min_query_time},
     )
-    return [Query(query, query_duration_ms, min_query_time) for query, query_duration_ms in raw_queries]
+    return [Query(*row) for row in raw_queries]
 
 
-def analyze(queries: List[Query]) -> List[Suggestion]:
+def analyze(queries: List[Query], period_hours: int = MATERIALIZE_COLUMNS_ANALYSIS_PERIOD_HOURS) -> List[PropertyCost]:
     """
-    Analyzes query history to find which properties could get materialized.
+    Analyzes query history over the last `period_hours` to find which properties could get materialized.
 
-    Returns an ordered list of suggestions by cost.
+    Returns properties ordered by how much materializing them would save.
     """
 
-    team_manager = TeamManager()
-    costs: defaultdict = defaultdict(int)
+    costs: Dict[Tuple[TableWithProperties, PropertyName], PropertyCost] = {}
 
     for query in queries:
-        if not query.is_valid:
+        if not query.is_valid or len(query.properties) == 0:
             continue
 
-        for table, property in query.properties(team_manager):
-            costs[(table, property)] += query.cost
+        share = 1 / len(query.properties)
+        for table, property in query.properties:
+            cost = costs.setdefault((table, property), PropertyCost(table, property))
+            cost.queries += 1
+            cost.query_time_ms += query.query_time_ms * share
+            cost.cpu_time_us += query.cpu_time_us * share
+            cost.read_rows += query.read_rows
+            cost.read_bytes += query.read_bytes * share
+
+    for table in ["events", "person"]:
+        table_costs = [cost for cost in costs.values() if cost.table == table]
+        if len(table_costs) > 0:
+            _estimate_savings(table, table_costs, period_hours)
+
+    return sorted(costs.values(), key=lambda cost: -cost.net_benefit_bytes)
+
+
+def _estimate_savings(table: TableWithProperties, costs: List[PropertyCost], period_hours: int) -> None:
+    """
+    Reads that JSON extraction of a property costs are taken to be the share of the properties column in the data
+    of the table. Materializing the property replaces them with reads of the column, as big as its values.
+
+    Storage is that of the rows ingested over the period the queries ran in, so that it's weighed against savings
+    over the same period - the whole table is usually many times bigger than what queries read in a week.
+    """
+    stats_table = "sharded_events" if CLICKHOUSE_REPLICATION and table == "events" else table
+    column_sizes = dict(
+        sync_execute(
+            "SELECT name, data_uncompressed_bytes FROM system.columns WHERE database = %(database)s AND table = %(table)s",
+            {"database": CLICKHOUSE_DATABASE, "table": stats_table},
+        )
+    )
+    period_rows = sync_execute(
+        f"SELECT count() FROM {table} WHERE _timestamp > now() - toIntervalHour(%(period_hours)s)",
+        {"period_hours": period_hours},
+    )[0][0]
+    properties_share = column_sizes.get("properties", 0) / max(sum(column_sizes.values()), 1)
+
+    # String columns store a byte for the length of each value on top of the value itself
+    value_sizes = [size + 1 for size in _average_value_sizes(table, [cost.property for cost in costs])]
+    for cost, value_size in zip(costs, value_sizes):
+        cost.saved_read_bytes = max(cost.read_bytes * properties_share - cost.read_rows * value_size, 0)
+        cost.storage_bytes = period_rows * value_size
+
+
+def _average_value_sizes(table: TableWithProperties, properties: List[PropertyName]) -> List[float]:
+    rows = sync_execute(
+        f"""
+        SELECT avgForEach(arrayMap(key -> length(trim(BOTH '"' FROM JSONExtractRaw(properties, key))), %(properties)s))
+        FROM (SELECT properties FROM {table} LIMIT %(limit)s)
+        """,
+        {"properties": properties, "limit": VALUE_SIZE_SAMPLE_SIZE},
+    )
+    sizes = list(rows[0][0]) if rows else []
+    return sizes + [0.0] * (len(properties) - len(sizes))
+
 
-    return [
-        (table, property_name, cost) for (table, property_name), cost in sorted(costs.items(), key=lambda kv: -kv[1])
+def format_report(costs: List[PropertyCost]) -> str:
+    "Ranked table of properties, most worth materializing first"
+    lines = [
+        f"{'#':>3}  {'table':<6}  {'property':<40}  {'queries':>7}  {'cpu time':>9}  {'read':>9}  {'saved':>9}  {'storage':>9}  {'net':>9}"
     ]
+    for rank, cost in enumerate(costs, start=1):
+        lines.append(
+            f"{rank:>3}  {cost.table:<6}  {cost.property[:40]:<40}  {cost.queries:>7}  "
+            f"{cost.cpu_time_us / 1e6:>8.1f}s  {_format_bytes(cost.read_bytes):>9}  "
+            f"{_format_bytes(cost.saved_read_bytes):>9}  {_format_bytes(cost.storage_bytes):>9}  "
+            f"{_format_bytes(cost.net_benefit_bytes):>9}"
+        )
+    return "\n".join(lines)
+
+
+def _format_bytes(size: float) -> str:
+    if abs(size) < 1024:
+        return f"{int(size)}B"
+    for unit in ["KiB", "MiB", "GiB"]:
+        size /= 1024
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}"
+    return f"{size / 1024:.1f}TiB"
+
+
+def worth_materializing(costs: List[PropertyCost]) -> List[Suggestion]:
+    return [(cost.table, cost.property, cost.net_benefit_bytes) for cost in costs if cost.net_benefit_bytes > 0]
 
 
 def materialize_properties_task(
@@ -126,13 +296,16 @@ def materialize_properties_task(
     min_query_time: int = MATERIALIZE_COLUMNS_MINIMUM_QUERY_TIME,
     backfill_period_days: int = MATERIALIZE_COLUMNS_BACKFILL_PERIOD_DAYS,
     dry_run: bool = False,
+    index_type: Optional[SkipIndexType] = None,
 ) -> None:
     """
     Creates materialized columns for event and person properties based off of slow queries
     """
 
     if columns_to_materialize is None:
-        columns_to_materialize = analyze(get_queries(time_to_analyze_hours, min_query_time))
+        columns_to_materialize = worth_materializing(
+            analyze(get_queries(time_to_analyze_hours, min_query_time), time_to_analyze_hours)
+        )
     result = []
     for suggestion in columns_to_materialize:
         table, property_name, _ = suggestion
@@ -152,7 +325,7 @@ def materialize_properties_task(
         logger.info(f"Materializing column. table={table}, property_name={property_name}, cost={cost}")
 
         if not dry_run:
-            materialize(table, property_name)
+            materialize(table, property_name, index_type=index_type)
         properties[table].append(property_name)
 
     if backfill_period_days > 0 and not dry_run:
@@ -2,31 +2,90 @@ import random
 import re
 import string
 from datetime import timedelta
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional, Tuple
 
 from django.utils.timezone import now
 
 from ee.clickhouse.client import sync_execute
-from ee.clickhouse.materialized_columns.util import cache_for
+from ee.clickhouse.materialized_columns.util import cache_until_invalidated, invalidate
+from ee.settings import MATERIALIZED_COLUMNS_CACHE_CHECK_INTERVAL_SECONDS, MATERIALIZED_COLUMNS_CACHE_TTL_SECONDS
 from posthog.models.property import PropertyName, TableWithProperties
+from posthog.models.property_definition import PropertyDefinition
 from posthog.settings import CLICKHOUSE_CLUSTER, CLICKHOUSE_DATABASE, CLICKHOUSE_REPLICATION, TEST
 
 ColumnName = str
 
+# Bumped whenever materialized columns change, making every process reload them
+MATERIALIZED_COLUMNS_VERSION_KEY = "materialized_columns_version"
+
 TRIM_AND_EXTRACT_PROPERTY = "trim(BOTH '\"' FROM JSONExtractRaw(properties, %(property)s))"
+# Parses values the same way numeric property filters parse them at query time, see ee/clickhouse/models/property.py
+EXTRACT_NUMERIC_PROPERTY = (
+    f"toFloat64OrNull(trim(BOTH '\"' FROM replaceRegexpAll({TRIM_AND_EXTRACT_PROPERTY}, ' ', '')))"
+)
+
+NUMERIC_COLUMN_TYPE = "Nullable(Float64)"
+# JSONType() of values that are numbers
+NUMERIC_JSON_TYPES = {"Int64", "UInt64", "Double"}
+# How many values of a property are looked at to decide whether it's numeric, and from how far back
+NUMERIC_INFERENCE_SAMPLE_SIZE = 10000
+NUMERIC_INFERENCE_PERIOD_DAYS = 7
+# Columns the period is applied to. Events are partitioned by timestamp, so only recent partitions get read
+NUMERIC_INFERENCE_TIME_COLUMNS: Dict[TableWithProperties, str] = {"events": "timestamp", "person": "_timestamp"}
 
+SkipIndexType = Literal["bloom_filter", "set", "tokenbf_v1"]
+# Data skipping indexes that can be added to materialized columns, letting filters skip granules without the value
+SKIP_INDEX_DEFINITIONS: Dict[SkipIndexType, str] = {
+    # Exact filters on properties with many values, e.g. emails or ids
+    "bloom_filter": "TYPE bloom_filter(0.01) GRANULARITY 1",
+    # Exact filters on properties with few values in each granule, e.g. plans or countries
+    "set": "TYPE set(100) GRANULARITY 1",
+    # Exact and LIKE filters on properties made of words, e.g. URLs
+    "tokenbf_v1": "TYPE tokenbf_v1(512, 3, 0) GRANULARITY 1",
+}
 
-@cache_for(timedelta(minutes=15))
+
+@cache_until_invalidated(
+    MATERIALIZED_COLUMNS_VERSION_KEY,
+    check_interval=timedelta(seconds=MATERIALIZED_COLUMNS_CACHE_CHECK_INTERVAL_SECONDS),
+    max_age=timedelta(seconds=MATERIALIZED_COLUMNS_CACHE_TTL_SECONDS),
+)
 def get_materialized_columns(table: TableWithProperties) -> Dict[PropertyName, ColumnName]:
+    return _get_columns_by_comment(table, "column_materializer::")
+
+
+@cache_until_invalidated(
+    MATERIALIZED_COLUMNS_VERSION_KEY,
+    check_interval=timedelta(seconds=MATERIALIZED_COLUMNS_CACHE_CHECK_INTERVAL_SECONDS),
+    max_age=timedelta(seconds=MATERIALIZED_COLUMNS_CACHE_TTL_SECONDS),
+)
+def get_numeric_materialized_columns(table: TableWithProperties) -> Dict[PropertyName, ColumnName]:
+    """
+    Columns with properties parsed as numbers, for numeric filters and math. These are created next to the string
+    column of properties found to be numeric, see `materialize`.
+    """
+    return _get_columns_by_comment(table, "numeric_column_materializer::")
+
+
+def get_property_columns(table: TableWithProperties, property: PropertyName) -> List[ColumnName]:
+    "Returns the materialized columns of a property that queries filtering on it may read: string, then numeric"
+    return [
+        columns[property]
+        for columns in (get_materialized_columns(table), get_numeric_materialized_columns(table))
+        if property in columns
+    ]
+
+
+def _get_columns_by_comment(table: TableWithProperties, comment_prefix: str) -> Dict[PropertyName, ColumnName]:
     rows = sync_execute(
         """
         SELECT comment, name
         FROM system.columns
         WHERE database = %(database)s
           AND table = %(table)s
-          AND comment LIKE '%%column_materializer::%%'
+          AND startsWith(comment, %(comment_prefix)s)
     """,
-        {"database": CLICKHOUSE_DATABASE, "table": table},
+        {"database": CLICKHOUSE_DATABASE, "table": table, "comment_prefix": comment_prefix},
     )
     if rows:
         return {extract_property(comment): column_name for comment, column_name in rows}
@@ -34,7 +93,7 @@ def get_materialized_columns(table: TableWithProperties) -> Dict[PropertyName, C
         return {}
 
 
-def materialize(table: TableWithProperties, property: PropertyName) -> None:
+def materialize(table: TableWithProperties, property: PropertyName, index_type: Optional[SkipIndexType] = None) -> None:
     if property in get_materialized_columns(table, use_cache=False):
         if TEST:
             return
@@ -42,6 +101,91 @@ def materialize(table: TableWithProperties, property: PropertyName) -> None:
         raise ValueError(f"Property already materialized. table={table}, property={property}")
 
     column_name = materialized_column_name(table, property)
+    _add_materialized_column(
+        table, column_name, "VARCHAR", TRIM_AND_EXTRACT_PROPERTY, property, f"column_materializer::{property}"
+    )
+
+    if index_type is not None:
+        _add_skip_index(table, column_name, index_type)
+
+    if is_numeric_property(table, property):
+        materialize_numeric(table, property)
+
+
+def materialize_numeric(table: TableWithProperties, property: PropertyName) -> None:
+    """
+    Adds a column with the property parsed as a number, so numeric filters and math don't parse strings on every row.
+
+    Called by `materialize` for properties that are numeric, or directly for properties materialized before.
+    """
+    if property in get_numeric_materialized_columns(table, use_cache=False):
+        if TEST:
+            return
+
+        raise ValueError(f"Property already materialized as numeric. table={table}, property={property}")
+
+    column_name = materialized_column_name(table, property, kind_suffix="_num")
+    _add_materialized_column(
+        table,
+        column_name,
+        NUMERIC_COLUMN_TYPE,
+        EXTRACT_NUMERIC_PROPERTY,
+        property,
+        f"numeric_column_materializer::{property}",
+    )
+
+
+def is_numeric_property(table: TableWithProperties, property: PropertyName) -> bool:
+    """
+    Whether the property is numeric in the event definitions of every team that has it, or has had only numbers as
+    values lately. Columns are shared by all teams, so a single team sending strings makes the property non-numeric.
+
+    Booleans aren't numeric: filters compare them as the strings in the string column.
+    """
+    if table == "events":
+        definitions = PropertyDefinition.objects.filter(name=property)
+        if definitions.exists() and not definitions.filter(is_numerical=False).exists():
+            return True
+
+    rows = sync_execute(
+        f"""
+        SELECT DISTINCT JSONType(properties, %(property)s)
+        FROM (
+            SELECT properties
+            FROM {table}
+            WHERE {NUMERIC_INFERENCE_TIME_COLUMNS[table]} > now() - toIntervalDay(%(days)s)
+              AND JSONHas(properties, %(property)s)
+            LIMIT %(limit)s
+        )
+    """,
+        {"property": property, "days": NUMERIC_INFERENCE_PERIOD_DAYS, "limit": NUMERIC_INFERENCE_SAMPLE_SIZE},
+    )
+    observed_types = {json_type for (json_type,) in rows}
+    return len(observed_types) > 0 and observed_types <= NUMERIC_JSON_TYPES
+
+
+def materialized_column_definitions(table: TableWithProperties) -> List[Tuple[PropertyName, ColumnName, str, str]]:
+    "Returns the property, column name, type and expression of every materialized column of the table"
+    return [
+        *(
+            (property, column_name, "VARCHAR", TRIM_AND_EXTRACT_PROPERTY)
+            for property, column_name in get_materialized_columns(table, use_cache=False).items()
+        ),
+        *(
+            (property, column_name, NUMERIC_COLUMN_TYPE, EXTRACT_NUMERIC_PROPERTY)
+            for property, column_name in get_numeric_materialized_columns(table, use_cache=False).items()
+        ),
+    ]
+
+
+def _add_materialized_column(
+    table: TableWithProperties,
+    column_name: ColumnName,
+    column_type: str,
+    expression: str,
+    property: PropertyName,
+    comment: str,
+) -> None:
     # :TRICKY: On cloud, we ON CLUSTER updates to events/sharded_events but not to persons. Why? ¯\_(ツ)_/¯
     execute_on_cluster = f"ON CLUSTER {CLICKHOUSE_CLUSTER}" if table == "events" else ""
 
@@ -51,7 +195,7 @@ def materialize(table: TableWithProperties, property: PropertyName) -> None:
             ALTER TABLE sharded_{table}
             {execute_on_cluster}
             ADD COLUMN IF NOT EXISTS
-            {column_name} VARCHAR MATERIALIZED {TRIM_AND_EXTRACT_PROPERTY}
+            {column_name} {column_type} MATERIALIZED {expression}
         """,
             {"property": property},
         )
@@ -60,7 +204,7 @@ def materialize(table: TableWithProperties, property: PropertyName) -> None:
             ALTER TABLE {table}
             {execute_on_cluster}
             ADD COLUMN IF NOT EXISTS
-            {column_name} VARCHAR
+            {column_name} {column_type}
         """
         )
     else:
@@ -69,15 +213,37 @@ def materialize(table: TableWithProperties, property: PropertyName) -> None:
             ALTER TABLE {table}
             {execute_on_cluster}
             ADD COLUMN IF NOT EXISTS
-            {column_name} VARCHAR MATERIALIZED {TRIM_AND_EXTRACT_PROPERTY}
+            {column_name} {column_type} MATERIALIZED {expression}
         """,
             {"property": property},
         )
 
     sync_execute(
-        f"ALTER TABLE {table} {execute_on_cluster} COMMENT COLUMN {column_name} %(comment)s",
-        {"comment": f"column_materializer::{property}"},
+        f"ALTER TABLE {table} {execute_on_cluster} COMMENT COLUMN {column_name} %(comment)s", {"comment": comment},
     )
+    invalidate(MATERIALIZED_COLUMNS_VERSION_KEY)
+
+
+def _add_skip_index(table: TableWithProperties, column_name: ColumnName, index_type: SkipIndexType) -> None:
+    # Indexes live with the data, so on sharded_events rather than the distributed table
+    updated_table = "sharded_events" if CLICKHOUSE_REPLICATION and table == "events" else table
+    execute_on_cluster = f"ON CLUSTER {CLICKHOUSE_CLUSTER}" if table == "events" else ""
+
+    sync_execute(
+        f"""
+        ALTER TABLE {updated_table}
+        {execute_on_cluster}
+        ADD INDEX IF NOT EXISTS
+        {skip_index_name(column_name)} {column_name} {SKIP_INDEX_DEFINITIONS[index_type]}
+    """
+    )
+    # Only parts written from now on get the index. This builds it for existing parts, whether or not the column gets
+    # backfilled, and older than the backfill period. It's a mutation, so runs in the background
+    sync_execute(f"ALTER TABLE {updated_table} {execute_on_cluster} MATERIALIZE INDEX {skip_index_name(column_name)}")
+
+
+def skip_index_name(column_name: ColumnName) -> str:
+    return f"{column_name}_idx"
 
 
 def backfill_materialized_columns(
@@ -96,27 +262,25 @@ def backfill_materialized_columns(
     # :TRICKY: On cloud, we ON CLUSTER updates to events/sharded_events but not to persons. Why? ¯\_(ツ)_/¯
     execute_on_cluster = f"ON CLUSTER {CLICKHOUSE_CLUSTER}" if table == "events" else ""
 
-    materialized_columns = get_materialized_columns(table, use_cache=False)
+    columns = [definition for definition in materialized_column_definitions(table) if definition[0] in properties]
 
     # Hack from https://github.com/ClickHouse/ClickHouse/issues/19785
     # Note that for this to work all inserts should list columns explicitly
     # Improve this if https://github.com/ClickHouse/ClickHouse/issues/27730 ever gets resolved
-    for property in properties:
+    for property, column_name, column_type, expression in columns:
         sync_execute(
             f"""
             ALTER TABLE {updated_table}
             {execute_on_cluster}
             MODIFY COLUMN
-            {materialized_columns[property]} VARCHAR DEFAULT {TRIM_AND_EXTRACT_PROPERTY}
+            {column_name} {column_type} DEFAULT {expression}
             """,
             {"property": property},
             settings=test_settings,
         )
 
     # Kick off mutations which will update clickhouse partitions in the background. This will return immediately
-    assignments = ", ".join(
-        f"{materialized_columns[property]} = {materialized_columns[property]}" for property in properties
-    )
+    assignments = ", ".join(f"{column_name} = {column_name}" for _, column_name, _, _ in columns)
 
     sync_execute(
         f"""
@@ -128,15 +292,16 @@ def backfill_materialized_columns(
         {"cutoff": (now() - backfill_period).strftime("%Y-%m-%d")},
         settings=test_settings,
     )
+    invalidate(MATERIALIZED_COLUMNS_VERSION_KEY)
 
 
-def materialized_column_name(table: TableWithProperties, property: PropertyName) -> str:
+def materialized_column_name(table: TableWithProperties, property: PropertyName, kind_suffix: str = "") -> str:
     "Returns a sanitized and unique column name to use for materialized column"
 
     prefix = "mat_" if table == "events" else "pmat_"
-    property_str = re.sub("[^0-9a-zA-Z$]", "_", property)
+    property_str = re.sub("[^0-9a-zA-Z$]", "_", property) + kind_suffix
 
-    existing_materialized_columns = set(get_materialized_columns(table, use_cache=False).values())
+    existing_materialized_columns = set(column_name for _, column_name, _, _ in materialized_column_definitions(table))
     suffix = ""
 
     while f"{prefix}{property_str}{suffix}" in existing_materialized_columns:
@@ -1,55 +1,171 @@
-from ee.clickhouse.materialized_columns import materialize
-from ee.clickhouse.materialized_columns.analyze import Query, TeamManager, analyze
-from ee.clickhouse.util import ClickhouseTestMixin
-from posthog.models import Person, PropertyDefinition
+import json
+from uuid import uuid4
+
+from ee.clickhouse.client import sync_execute
+from ee.clickhouse.materialized_columns.analyze import (
+    Query,
+    analyze,
+    format_report,
+    parse_properties,
+    worth_materializing,
+)
+from ee.clickhouse.models.event import create_event
+from ee.clickhouse.util import ClickhouseDestroyTablesMixin, ClickhouseTestMixin
 from posthog.test.base import BaseTest
 
+GiB = 1024 ** 3
+
 
-class TestMaterializedColumnsAnalyze(ClickhouseTestMixin, BaseTest):
+class TestMaterializedColumnsAnalyze(ClickhouseTestMixin, ClickhouseDestroyTablesMixin, BaseTest):
     def setUp(self):
         super().setUp()
         self.DUMMY_QUERIES = [
             (
-                f"SELECT JSONExtractString(properties, 'event_prop') FROM events WHERE team_id = {self.team.pk} AND trim(BOTH '\"' FROM JSONExtractRaw(properties, 'another_prop')",
+                f"SELECT JSONExtractString(properties, 'event_prop') FROM events WHERE team_id = {self.team.pk} AND trim(BOTH '\"' FROM JSONExtractRaw(properties, 'another_prop'))",
                 6723,
             ),
             (f"SELECT JSONExtractString(properties, 'person_prop') FROM person WHERE team_id = {self.team.pk}", 9723),
         ]
 
-        # Create property definitions
-        PropertyDefinition.objects.create(team=self.team, name="event_prop")
-        PropertyDefinition.objects.create(team=self.team, name="another_prop")
-
-        Person.objects.create(
-            team_id=self.team.pk,
-            distinct_ids=["2"],
-            properties={"person_prop": "something", "$another_prop": "something"},
-        )
-
     def test_query_class(self):
-        with self.settings(MATERIALIZE_COLUMNS_MINIMUM_QUERY_TIME=3000):
-            event_query = Query(*self.DUMMY_QUERIES[0])
-            person_query = Query(*self.DUMMY_QUERIES[1])
+        event_query = Query(*self.DUMMY_QUERIES[0])
+        person_query = Query(*self.DUMMY_QUERIES[1])
 
-            self.assertTrue(event_query.is_valid)
-            self.assertTrue(person_query.is_valid)
+        self.assertTrue(event_query.is_valid)
+        self.assertTrue(person_query.is_valid)
 
-            self.assertEqual(event_query.team_id, str(self.team.pk))
-            self.assertEqual(person_query.team_id, str(self.team.pk))
+        self.assertEqual(event_query.team_id, str(self.team.pk))
+        self.assertEqual(person_query.team_id, str(self.team.pk))
 
-            self.assertEqual(
-                list(event_query.properties(TeamManager())), [("events", "event_prop"), ("events", "another_prop")]
-            )
-            self.assertEqual(list(person_query.properties(TeamManager())), [("person", "person_prop")])
-            self.assertEqual(event_query.cost, 4)
-            self.assertEqual(person_query.cost, 7)
+        self.assertEqual(event_query.properties, {("events", "event_prop"), ("events", "another_prop")})
+        self.assertEqual(person_query.properties, {("person", "person_prop")})
 
     def test_query_class_edge_cases(self):
         invalid_query = Query("SELECT * FROM events WHERE team_id = -1", 100)
         self.assertFalse(invalid_query.is_valid)
         self.assertIsNone(invalid_query.team_id)
 
-        query_with_unknown_property = Query(
-            f"SELECT JSONExtractString(properties, '$unknown_prop') FROM events WHERE team_id = {self.team.pk}", 0
+        commented_query = Query(f"/* request:api_event team:{self.team.pk} */ SELECT 1 FROM events", 100)
+        self.assertEqual(commented_query.team_id, str(self.team.pk))
+
+    def test_parse_properties(self):
+        query = """
+            SELECT count(*) FROM (
+                SELECT e.properties as properties, person.person_props as person_props
+                FROM events e
+                INNER JOIN (
+                    SELECT id, argMax(properties, _timestamp) as person_props FROM person GROUP BY id
+                ) person ON person.id = e.person_id
+                WHERE has(['x'], trim(BOTH '"' FROM JSONExtractRaw(e.properties, 'it\\'s')))
+                  AND has(['y'], replaceRegexpAll(JSONExtractRaw(person_props, 'email'), concat('^[', regexpQuoteMeta('"'), ']*|[', regexpQuoteMeta('"'), ']*$'), ''))
+            )
+            WHERE toFloat64OrNull(trim(BOTH '"' FROM replaceRegexpAll(JSONExtractRaw(properties, 'price'), ' ', ''))) > 3
+              AND distinct_id IN (
+                SELECT distinct_id FROM person_distinct_id WHERE person_id IN (
+                    SELECT id FROM (SELECT id, argMax(properties, _timestamp) as properties FROM person GROUP BY id)
+                    WHERE JSONHas(properties, 'plan') AND visitParamExtractRaw(properties, 'seats') = '3'
+                )
+              )
+              AND JSONExtractInt(snapshot_data, 'type') = 2
+        """
+
+        self.assertCountEqual(
+            set(parse_properties(query)),
+            [("events", "it's"), ("events", "price"), ("person", "email"), ("person", "plan"), ("person", "seats"),],
+        )
+
+    def test_parse_properties_of_cohort_queries(self):
+        query = """
+            INSERT INTO cohortpeople
+            SELECT id, 1 as cohort_id, 2 as team_id, 1 as _sign
+            FROM (SELECT id, sum(is_deleted) as is_deleted FROM person WHERE team_id = 2 GROUP BY id) as person
+            WHERE id IN (
+                SELECT DISTINCT p.id
+                FROM (
+                    SELECT * FROM person JOIN (
+                        SELECT id, max(_timestamp) as _timestamp FROM person WHERE team_id = 2 GROUP BY id
+                    ) as person_max ON person.id = person_max.id AND person._timestamp = person_max._timestamp
+                    WHERE team_id = 2 AND has(['x'], trim(BOTH '"' FROM JSONExtractRaw(properties, 'plan')))
+                ) AS p
+            )
+        """
+
+        self.assertEqual(list(parse_properties(query)), [("person", "plan")])
+
+    def test_analyze(self):
+        for _ in range(3):
+            create_event(
+                event_uuid=uuid4(),
+                event="$pageview",
+                team=self.team,
+                distinct_id="1",
+                properties={"cheap_prop": "a" * 10, "expensive_prop": "b", "$browser": "Chrome"},
+            )
+
+        queries = [
+            Query(
+                f"SELECT count() FROM events WHERE team_id = {self.team.pk} AND JSONExtractRaw(properties, 'expensive_prop') = 'b'",
+                5000,
+                read_rows=1000,
+                read_bytes=100 * GiB,
+                cpu_time_us=4_000_000,
+            ),
+            Query(
+                f"SELECT count() FROM events WHERE team_id = {self.team.pk} AND JSONExtractRaw(properties, 'expensive_prop') = 'b' AND JSONExtractRaw(properties, 'cheap_prop') = 'a'",
+                4000,
+                read_rows=1000,
+                read_bytes=10 * GiB,
+                cpu_time_us=2_000_000,
+            ),
+            Query("SELECT count() FROM events WHERE team_id = -1 AND JSONHas(properties, '$browser')", 4000),
+        ]
+
+        costs = analyze(queries)
+
+        self.assertEqual(
+            [(cost.table, cost.property) for cost in costs], [("events", "expensive_prop"), ("events", "cheap_prop")]
         )
-        self.assertEqual(list(query_with_unknown_property.properties(TeamManager())), [])
+        self.assertEqual([cost.queries for cost in costs], [2, 1])
+        self.assertEqual([cost.cpu_time_us for cost in costs], [5_000_000, 1_000_000])
+        self.assertEqual([cost.read_bytes for cost in costs], [105 * GiB, 5 * GiB])
+        self.assertGreater(costs[0].saved_read_bytes, costs[1].saved_read_bytes)
+        self.assertGreater(costs[1].storage_bytes, costs[0].storage_bytes)
+
+        report = format_report(costs).splitlines()
+        self.assertEqual(len(report), 3)
+        self.assertIn("expensive_prop", report[1])
+        self.assertIn("cheap_prop", report[2])
+
+    def test_analyze_weighs_storage_over_the_analysis_period(self):
+        properties = {"heavy_prop": "b" * 10, "payload": "x" * 200}
+        # A year of history, of which the last week was ingested within the analysis period
+        sync_execute(
+            """
+            INSERT INTO events (uuid, event, properties, timestamp, team_id, distinct_id, elements_chain, created_at, _timestamp, _offset)
+            SELECT generateUUIDv4(), '$pageview', %(properties)s, ingested_at, %(team_id)s, '1', '', ingested_at, ingested_at, 0
+            FROM (SELECT now() - toIntervalDay(8 + modulo(number, 357)) AS ingested_at FROM numbers(490))
+            """,
+            {"properties": json.dumps(properties), "team_id": self.team.pk},
+        )
+        for _ in range(10):
+            create_event(
+                event_uuid=uuid4(), event="$pageview", team=self.team, distinct_id="1", properties=properties,
+            )
+
+        # Queries over the last week read its rows over and over, though far less than the whole table
+        queries = [
+            Query(
+                f"SELECT count() FROM events WHERE team_id = {self.team.pk} AND JSONExtractRaw(properties, 'heavy_prop') = 'b'",
+                5000,
+                read_rows=10,
+                read_bytes=10 * 250,
+            )
+            for _ in range(5)
+        ]
+
+        costs = analyze(queries, period_hours=7 * 24)
+
+        self.assertEqual([(cost.table, cost.property) for cost in costs], [("events", "heavy_prop")])
+        self.assertEqual(costs[0].storage_bytes, 10 * 11)
+        self.assertLess(costs[0].saved_read_bytes, 500 * 11)
+        self.assertEqual(worth_materializing(costs), [("events", "heavy_prop", costs[0].net_benefit_bytes)])
@@ -7,14 +7,19 @@ from uuid import uuid4
 from freezegun import freeze_time
 
 from ee.clickhouse.client import sync_execute
+from ee.clickhouse.materialized_columns import util
 from ee.clickhouse.materialized_columns.columns import (
     backfill_materialized_columns,
     get_materialized_columns,
+    get_numeric_materialized_columns,
     materialize,
+    materialize_numeric,
 )
 from ee.clickhouse.models.event import create_event
 from ee.clickhouse.util import ClickhouseDestroyTablesMixin, ClickhouseTestMixin
 from ee.tasks.materialized_columns import mark_all_materialized
+from posthog.models.property_definition import PropertyDefinition
+from posthog.models.team import Team
 from posthog.settings import CLICKHOUSE_DATABASE
 from posthog.test.base import BaseTest
 
@@ -32,20 +37,68 @@ class TestMaterializedColumns(ClickhouseTestMixin, ClickhouseDestroyTablesMixin,
         self.assertCountEqual(get_materialized_columns("person"), [])
 
     def test_caching_and_materializing(self):
+        materialize("events", "$foo")
+        materialize("events", "$bar")
+        materialize("person", "$zeta")
+
+        self.assertCountEqual(get_materialized_columns("events", use_cache=True).keys(), ["$foo", "$bar"])
+        self.assertCountEqual(get_materialized_columns("person", use_cache=True).keys(), ["$zeta"])
+
+        materialize("events", "abc")
+
+        self.assertCountEqual(get_materialized_columns("events", use_cache=True).keys(), ["$foo", "$bar", "abc"])
+
+    def test_cache_shared_between_processes(self):
         with freeze_time("2020-01-04T13:01:01Z"):
             materialize("events", "$foo")
+            self.assertEqual(get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo"})
+
+            # A new process reuses the columns another one has loaded
+            self._reset_process_cache()
+            with patch("ee.clickhouse.materialized_columns.columns.sync_execute") as sync_execute_mock:
+                self.assertEqual(get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo"})
+                sync_execute_mock.assert_not_called()
+
+            # Another process materializes a column, which this one notices next time it checks the version
+            versions = dict(util._versions)
             materialize("events", "$bar")
-            materialize("person", "$zeta")
+            util._versions.update(versions)
+            self.assertEqual(get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo"})
+
+        with freeze_time("2020-01-04T13:01:10Z"):
+            self.assertEqual(
+                get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo", "$bar": "mat_$bar"}
+            )
+
+    def test_shared_cache_expires_from_when_columns_were_read(self):
+        with freeze_time("2020-01-04T13:00:00Z"):
+            materialize("events", "$foo")
+            get_materialized_columns("events", use_cache=True)
+
+        with freeze_time("2020-01-04T13:14:00Z"):
+            self._reset_process_cache()
+            with patch("ee.clickhouse.materialized_columns.columns.sync_execute") as sync_execute_mock:
+                get_materialized_columns("events", use_cache=True)
+                sync_execute_mock.assert_not_called()
 
-            self.assertCountEqual(get_materialized_columns("events", use_cache=True).keys(), ["$foo", "$bar"])
-            self.assertCountEqual(get_materialized_columns("person", use_cache=True).keys(), ["$zeta"])
+        with freeze_time("2020-01-04T13:16:00Z"):
+            with patch("ee.clickhouse.materialized_columns.columns.sync_execute") as sync_execute_mock:
+                get_materialized_columns("events", use_cache=True)
+                sync_execute_mock.assert_called_once()
 
-            materialize("events", "abc")
+    def test_cache_without_redis(self):
+        with patch("ee.clickhouse.materialized_columns.util.get_client") as get_client:
+            get_client.return_value.get.side_effect = ConnectionError
+            get_client.return_value.set.side_effect = ConnectionError
+            get_client.return_value.incr.side_effect = ConnectionError
+            self._reset_process_cache()
 
-            self.assertCountEqual(get_materialized_columns("events", use_cache=True).keys(), ["$foo", "$bar"])
+            materialize("events", "$foo")
+            self.assertEqual(get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo"})
 
-        with freeze_time("2020-01-04T14:00:01Z"):
-            self.assertCountEqual(get_materialized_columns("events", use_cache=True).keys(), ["$foo", "$bar", "abc"])
+            with patch("ee.clickhouse.materialized_columns.columns.sync_execute") as sync_execute_mock:
+                self.assertEqual(get_materialized_columns("events", use_cache=True), {"$foo": "mat_$foo"})
+                sync_execute_mock.assert_not_called()
 
     def test_materialized_column_naming(self):
         random.seed(0)
@@ -144,6 +197,82 @@ class TestMaterializedColumns(ClickhouseTestMixin, ClickhouseDestroyTablesMixin,
         mark_all_materialized()
         self.assertEqual(("MATERIALIZED", expr), self._get_column_types("events", "mat_myprop"))
 
+    def test_numeric_columns(self):
+        _create_event(event="some_event", distinct_id="1", team=self.team, properties={"price": 10, "name": "a"})
+        _create_event(event="some_event", distinct_id="1", team=self.team, properties={"price": 2.5, "mixed": 1})
+        _create_event(event="some_event", distinct_id="1", team=self.team, properties={"mixed": "b", "flag": True})
+        PropertyDefinition.objects.create(team=self.team, name="numeric_string", is_numerical=True)
+        # Numeric for this team only, while another team sends strings
+        other_team = Team.objects.create(organization=self.organization)
+        PropertyDefinition.objects.create(team=self.team, name="disputed", is_numerical=True)
+        PropertyDefinition.objects.create(team=other_team, name="disputed", is_numerical=False)
+
+        for property in ["price", "name", "mixed", "flag", "numeric_string", "disputed"]:
+            materialize("events", property)
+
+        self.assertEqual(
+            get_numeric_materialized_columns("events"),
+            {"price": "mat_price_num", "numeric_string": "mat_numeric_string_num"},
+        )
+        self.assertEqual(self._get_column_types("events", "mat_price_num")[0], "MATERIALIZED")
+        self.assertEqual(
+            sync_execute("SELECT mat_price, mat_price_num FROM events ORDER BY mat_price_num"),
+            [("2.5", 2.5), ("10", 10.0), ("", None)],
+        )
+
+    def test_materialize_numeric_for_existing_column(self):
+        materialize("events", "price")
+        self.assertEqual(get_numeric_materialized_columns("events"), {})
+
+        materialize_numeric("events", "price")
+        self.assertEqual(get_materialized_columns("events"), {"price": "mat_price"})
+        self.assertEqual(get_numeric_materialized_columns("events"), {"price": "mat_price_num"})
+
+        backfill_materialized_columns("events", ["price"], timedelta(days=50))
+        self.assertEqual(self._get_column_types("events", "mat_price_num")[0], "DEFAULT")
+
+        mark_all_materialized()
+        self.assertEqual(self._get_column_types("events", "mat_price_num")[0], "MATERIALIZED")
+
+    def test_skip_indexes(self):
+        _create_event(event="some_event", distinct_id="1", team=self.team, properties={"plan": "free"})
+        _create_event(event="some_event", distinct_id="1", team=self.team, properties={"plan": "paid"})
+
+        materialize("events", "plan", index_type="bloom_filter")
+        materialize("person", "email", index_type="tokenbf_v1")
+        backfill_materialized_columns("events", ["plan"], timedelta(days=50))
+
+        self.assertEqual(self._get_skip_index("events", "mat_plan_idx"), ("bloom_filter", "mat_plan"))
+        self.assertEqual(self._get_skip_index("person", "pmat_email_idx"), ("tokenbf_v1", "pmat_email"))
+        self.assertEqual(self._get_skip_index("events", "event_name_idx"), ("bloom_filter", "event"))
+        self.assertEqual(sync_execute("SELECT count() FROM events WHERE mat_plan IN ('paid')"), [(1,)])
+        # Existing parts get the index too
+        self.assertEqual(
+            sync_execute(
+                """
+                SELECT DISTINCT command
+                FROM system.mutations
+                WHERE database = %(database)s AND table = 'events' AND command LIKE 'MATERIALIZE INDEX%%'
+                """,
+                {"database": CLICKHOUSE_DATABASE},
+            ),
+            [("MATERIALIZE INDEX mat_plan_idx",)],
+        )
+
+    def _get_skip_index(self, table: str, name: str):
+        return sync_execute(
+            """
+            SELECT type, expr
+            FROM system.data_skipping_indices
+            WHERE database = %(database)s AND table = %(table)s AND name = %(name)s
+            """,
+            {"table": table, "database": CLICKHOUSE_DATABASE, "name": name},
+        )[0]
+
+    def _reset_process_cache(self):
+        util._versions.clear()
+        getattr(get_materialized_columns, "__cache").clear()
+
     def _count_materialized_rows(self, column):
         return sync_execute(
             """
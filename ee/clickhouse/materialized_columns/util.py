@@ -1,13 +1,27 @@
-from datetime import timedelta
+import json
+from datetime import datetime, timedelta
 from functools import wraps
-from typing import no_type_check
+from typing import Any, Dict, Optional, Tuple, no_type_check
 
 from django.utils.timezone import now
+from sentry_sdk import capture_exception
 
+from posthog.redis import get_client
 from posthog.settings import TEST
 
+# Version key => (when it was last read from redis, version)
+_versions: Dict[str, Tuple[datetime, Optional[int]]] = {}
+
+
+def cache_until_invalidated(version_key: str, check_interval: timedelta, max_age: timedelta):
+    """
+    Caches results in-process and in redis, shared between processes, until `invalidate(version_key)` is called.
+
+    Each process reads the version from redis at most every `check_interval`, which is cheap compared to calling
+    the function. Results are recomputed after `max_age` regardless, to pick up changes made without invalidating.
+    Without redis, results are only cached in-process, for `max_age`.
+    """
 
-def cache_for(cache_time: timedelta):
     def wrapper(fn):
         @wraps(fn)
         @no_type_check
@@ -16,9 +30,23 @@ def cache_for(cache_time: timedelta):
                 return fn(*args)
 
             current_time = now()
-            if args not in memoized_fn.__cache or current_time - memoized_fn.__cache[args][0] > cache_time:
-                memoized_fn.__cache[args] = (current_time, fn(*args))
-            return memoized_fn.__cache[args][1]
+            version = _get_version(version_key, check_interval, current_time)
+            if args in memoized_fn.__cache:
+                cached_version, computed_at, result = memoized_fn.__cache[args]
+                if cached_version == version and current_time.timestamp() - computed_at <= max_age.total_seconds():
+                    return result
+
+            shared_key = f"{version_key}:{fn.__name__}:{':'.join(map(str, args))}:{version}"
+            computed_at, result = (
+                _get_shared_result(shared_key, current_time, max_age) if version is not None else (None, None)
+            )
+            if computed_at is None:
+                computed_at, result = current_time.timestamp(), fn(*args)
+                if version is not None:
+                    _set_shared_result(shared_key, computed_at, result, max_age)
+
+            memoized_fn.__cache[args] = (version, computed_at, result)
+            return result
 
         memoized_fn.__cache = {}
         return memoized_fn
@@ -26,6 +54,51 @@ def cache_for(cache_time: timedelta):
     return wrapper
 
 
+def invalidate(version_key: str) -> None:
+    "Makes every process drop results cached under `version_key` next time it checks the version"
+    try:
+        get_client().incr(version_key)
+    except Exception as err:
+        capture_exception(err)
+    # No need to wait for the next check in this process
+    _versions.pop(version_key, None)
+
+
+def _get_version(version_key: str, check_interval: timedelta, current_time: datetime) -> Optional[int]:
+    "Returns None if redis can't be reached, unless the version is known from an earlier check"
+    if version_key not in _versions or current_time - _versions[version_key][0] > check_interval:
+        try:
+            version = int(get_client().get(version_key) or 0)
+        except Exception as err:
+            capture_exception(err)
+            version = _versions[version_key][1] if version_key in _versions else None
+        _versions[version_key] = (current_time, version)
+    return _versions[version_key][1]
+
+
+def _get_shared_result(key: str, current_time: datetime, max_age: timedelta) -> Tuple[Optional[float], Any]:
+    "Returns (when the result was computed, result), or (None, None) if there's none recent enough in redis"
+    try:
+        shared = get_client().get(key)
+    except Exception as err:
+        capture_exception(err)
+        return None, None
+    if shared is None:
+        return None, None
+    computed_at, result = json.loads(shared)
+    # The redis entry expires after `max_age` since it was written, which can be well after the result was computed
+    if current_time.timestamp() - computed_at > max_age.total_seconds():
+        return None, None
+    return computed_at, result
+
+
+def _set_shared_result(key: str, computed_at: float, result: Any, max_age: timedelta) -> None:
+    try:
+        get_client().set(key, json.dumps([computed_at, result]), ex=int(max_age.total_seconds()))
+    except Exception as err:
+        capture_exception(err)
+
+
 def instance_memoize(callback):
     name = f"_{callback.__name__}_memo"
 
@@ -1,3 +1,5 @@
+import json
+
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 from django.urls.base import resolve
@@ -6,6 +8,9 @@ from loginas.utils import is_impersonated_session
 from posthog.internal_metrics import incr
 from posthog.utils import is_clickhouse_enabled
 
+# Returned to staff and in DEBUG, with how many ClickHouse queries the request ran and how much they read
+CLICKHOUSE_QUERY_TOTALS_HEADER = "X-ClickHouse-Query-Totals"
+
 
 class CHQueries(object):
     def __init__(self, get_response):
@@ -18,26 +23,29 @@ class CHQueries(object):
         then do it now.
 
         """
-        from ee.clickhouse import client
+        from ee.clickhouse.instrumentation import instrumentation_context
 
         route = resolve(request.path)
         route_id = f"{route.route} ({route.func.__name__})"
-        client._request_information = {
-            "save": (
-                is_clickhouse_enabled()
-                and request.user.pk
-                and (request.user.is_staff or is_impersonated_session(request) or settings.DEBUG)
-            ),
-            "user_id": request.user.pk,
-            "kind": "request",
-            "id": route_id,
-        }
-
-        response: HttpResponse = self.get_response(request)
+        is_debugging = bool(
+            is_clickhouse_enabled()
+            and request.user.pk
+            and (request.user.is_staff or is_impersonated_session(request) or settings.DEBUG)
+        )
+        with instrumentation_context(
+            "request",
+            route_id,
+            team_id=getattr(request.user, "current_team_id", None),
+            user_id=request.user.pk,
+            insight=request.GET.get("insight"),
+            save=is_debugging,
+        ) as context:
+            response: HttpResponse = self.get_response(request)
+
+        if is_debugging and context.totals.queries:
+            response[CLICKHOUSE_QUERY_TOTALS_HEADER] = json.dumps(context.totals.to_dict())
 
         if "api/" in route_id and "capture" not in route_id:
             incr("http_api_request_response", tags={"id": route_id, "status_code": response.status_code})
 
-        client._request_information = None
-
         return response
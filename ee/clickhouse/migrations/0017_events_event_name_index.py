@@ -0,0 +1,12 @@
+from infi.clickhouse_orm import migrations
+
+from ee.clickhouse.sql.events import EVENT_NAME_INDEX, EVENT_NAME_INDEX_DEFINITION
+from posthog.settings import CLICKHOUSE_CLUSTER
+
+operations = [
+    migrations.RunSQL(
+        f"ALTER TABLE events ON CLUSTER {CLICKHOUSE_CLUSTER} ADD INDEX IF NOT EXISTS {EVENT_NAME_INDEX_DEFINITION}"
+    ),
+    # Builds the index for existing parts. It's a mutation, so runs in the background
+    migrations.RunSQL(f"ALTER TABLE events ON CLUSTER {CLICKHOUSE_CLUSTER} MATERIALIZE INDEX {EVENT_NAME_INDEX}"),
+]
@@ -1,11 +1,17 @@
 import re
 from typing import Any, Dict, List, Optional, Set, Tuple, cast
 
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import exceptions
 
-from ee.clickhouse.client import sync_execute
-from ee.clickhouse.materialized_columns.columns import TableWithProperties, get_materialized_columns
+from ee.clickhouse.client import cache_sync_execute
+from ee.clickhouse.materialized_columns.columns import (
+    TableWithProperties,
+    get_materialized_columns,
+    get_numeric_materialized_columns,
+    get_property_columns,
+)
 from ee.clickhouse.models.cohort import format_filter_query
 from ee.clickhouse.models.util import is_json
 from ee.clickhouse.sql.events import SELECT_PROP_VALUES_SQL, SELECT_PROP_VALUES_SQL_WITH_FILTER
@@ -51,8 +57,6 @@ def parse_prop_clauses(
                     "AND {table_name}distinct_id IN ({clause})".format(table_name=table_name, clause=person_id_query)
                 )
         elif prop.type == "person":
-            # :TODO: Clean this up by using ClickhousePersonQuery over GET_DISTINCT_IDS_BY_PROPERTY_SQL to have access
-            #   to materialized columns
             # :TODO: (performance) Avoid subqueries whenever possible, use joins instead
             is_direct_query = is_person_query or person_properties_column is not None
             filter_query, filter_params = prop_filter_json_extract(
@@ -60,7 +64,8 @@ def parse_prop_clauses(
                 idx,
                 "{}person".format(prepend),
                 prop_var=(person_properties_column or "properties") if is_direct_query else "properties",
-                allow_denormalized_props=allow_denormalized_props and is_direct_query,
+                # The subquery below reads persons itself, so can use their materialized columns whatever the query
+                allow_denormalized_props=allow_denormalized_props or not is_direct_query,
             )
             if is_direct_query:
                 final.append(filter_query)
@@ -68,7 +73,9 @@ def parse_prop_clauses(
             else:
                 final.append(
                     "AND {table_name}distinct_id IN ({filter_query})".format(
-                        filter_query=GET_DISTINCT_IDS_BY_PROPERTY_SQL.format(filters=filter_query),
+                        filter_query=GET_DISTINCT_IDS_BY_PROPERTY_SQL.format(
+                            filters=filter_query, person_fields=_get_person_fields(prop.key)
+                        ),
                         table_name=table_name,
                     )
                 )
@@ -165,18 +172,20 @@ def prop_filter_json_extract(
         )
     elif operator == "gt":
         params = {"k{}_{}".format(prepend, idx): prop.key, "v{}_{}".format(prepend, idx): prop.value}
+        numeric_expr = get_property_numeric_expr(
+            property_table(prop), prop.key, f"%(k{prepend}_{idx})s", prop_var, allow_denormalized_props
+        )
         return (
-            "AND toFloat64OrNull(trim(BOTH '\"' FROM replaceRegexpAll({left}, ' ', ''))) > %(v{prepend}_{idx})s".format(
-                idx=idx, prepend=prepend, left=property_expr,
-            ),
+            "AND {left} > %(v{prepend}_{idx})s".format(idx=idx, prepend=prepend, left=numeric_expr),
             params,
         )
     elif operator == "lt":
         params = {"k{}_{}".format(prepend, idx): prop.key, "v{}_{}".format(prepend, idx): prop.value}
+        numeric_expr = get_property_numeric_expr(
+            property_table(prop), prop.key, f"%(k{prepend}_{idx})s", prop_var, allow_denormalized_props
+        )
         return (
-            "AND toFloat64OrNull(trim(BOTH '\"' FROM replaceRegexpAll({left}, ' ', ''))) < %(v{prepend}_{idx})s".format(
-                idx=idx, prepend=prepend, left=property_expr,
-            ),
+            "AND {left} < %(v{prepend}_{idx})s".format(idx=idx, prepend=prepend, left=numeric_expr),
             params,
         )
     else:
@@ -186,6 +195,10 @@ def prop_filter_json_extract(
                 "k{}_{}".format(prepend, idx): prop.key,
                 "v{}_{}".format(prepend, idx): box_value(prop.value, remove_spaces=True),
             }
+        elif is_denormalized and len(box_value(prop.value)) > 0:
+            # :TRICKY: Unlike has(), IN can use data skipping indexes on the materialized column
+            clause = "AND {left} IN %(v{prepend}_{idx})s"
+            params = {"k{}_{}".format(prepend, idx): prop.key, "v{}_{}".format(prepend, idx): box_value(prop.value)}
         else:
             clause = "AND has(%(v{prepend}_{idx})s, {left})"
             params = {"k{}_{}".format(prepend, idx): prop.key, "v{}_{}".format(prepend, idx): box_value(prop.value)}
@@ -195,6 +208,12 @@ def prop_filter_json_extract(
         )
 
 
+def _get_person_fields(property_name: PropertyName) -> str:
+    "Latest values of the person columns a filter on the property reads: its materialized columns if any"
+    columns = get_property_columns("person", property_name) or ["properties"]
+    return ", ".join(f"argMax({column}, person._timestamp) as {column}" for column in columns)
+
+
 def property_table(property: Property) -> TableWithProperties:
     if property.type == "event":
         return "events"
@@ -219,6 +238,23 @@ def get_property_string_expr(
     return f"trim(BOTH '\"' FROM JSONExtractRaw({prop_var}, {var}))", False
 
 
+def get_property_numeric_expr(
+    table: TableWithProperties,
+    property_name: PropertyName,
+    var: str,
+    prop_var: str,
+    allow_denormalized_props: bool = True,
+) -> str:
+    "Returns an expression for the property as a Nullable(Float64), using its numeric materialized column if any"
+    numeric_columns = get_numeric_materialized_columns(table) if allow_denormalized_props else {}
+
+    if property_name in numeric_columns:
+        return numeric_columns[property_name]
+
+    string_expr, _ = get_property_string_expr(table, property_name, var, prop_var, allow_denormalized_props)
+    return f"toFloat64OrNull(trim(BOTH '\"' FROM replaceRegexpAll({string_expr}, ' ', '')))"
+
+
 def box_value(value: Any, remove_spaces=False) -> List[Any]:
     if not isinstance(value, List):
         value = [value]
@@ -231,13 +267,15 @@ def get_property_values_for_key(key: str, team: Team, value: Optional[str] = Non
     parsed_date_to = "AND timestamp <= '{}'".format(timezone.now().strftime("%Y-%m-%d 23:59:59"))
 
     if value:
-        return sync_execute(
+        return cache_sync_execute(
             SELECT_PROP_VALUES_SQL_WITH_FILTER.format(parsed_date_from=parsed_date_from, parsed_date_to=parsed_date_to),
             {"team_id": team.pk, "key": key, "value": "%{}%".format(value)},
+            ttl=settings.CLICKHOUSE_VALUES_CACHE_TTL_SECONDS,
         )
-    return sync_execute(
+    return cache_sync_execute(
         SELECT_PROP_VALUES_SQL.format(parsed_date_from=parsed_date_from, parsed_date_to=parsed_date_to),
         {"team_id": team.pk, "key": key},
+        ttl=settings.CLICKHOUSE_VALUES_CACHE_TTL_SECONDS,
     )
 
 
@@ -8,6 +8,7 @@ from django.utils import timezone
 from freezegun import freeze_time
 
 from ee.clickhouse.client import sync_execute
+from ee.clickhouse.materialized_columns import materialize
 from ee.clickhouse.models.cohort import format_filter_query, get_person_ids_by_cohort_id, recalculate_cohortpeople
 from ee.clickhouse.models.event import create_event
 from ee.clickhouse.models.person import create_person, create_person_distinct_id
@@ -84,6 +85,26 @@ class TestCohort(ClickhouseTestMixin, BaseTest):
         result = sync_execute(final_query, {**params, "team_id": self.team.pk})
         self.assertEqual(len(result), 1)
 
+    def test_prop_cohort_with_materialized_person_property(self):
+        _create_person(distinct_ids=["some_id"], team_id=self.team.pk, properties={"$some_prop": "something"})
+        _create_person(distinct_ids=["other_id"], team_id=self.team.pk, properties={"$some_prop": "other"})
+        _create_event(event="$pageview", team=self.team, distinct_id="some_id")
+        _create_event(event="$pageview", team=self.team, distinct_id="other_id")
+        materialize("person", "$some_prop")
+
+        cohort = Cohort.objects.create(
+            team=self.team, groups=[{"properties": {"$some_prop": "something"}}], name="cohort1",
+        )
+
+        filter = Filter(data={"properties": [{"key": "id", "value": cohort.pk, "type": "cohort"}],})
+        query, params = parse_prop_clauses(filter.properties, self.team.pk)
+        self.assertIn("pmat_$some_prop", query)
+        self.assertNotIn("JSONExtract", query)
+
+        final_query = "SELECT uuid FROM events WHERE team_id = %(team_id)s {}".format(query)
+        result = sync_execute(final_query, {**params, "team_id": self.team.pk})
+        self.assertEqual(len(result), 1)
+
     def test_prop_cohort_basic_action(self):
 
         _create_person(distinct_ids=["some_other_id"], team_id=self.team.pk, properties={"$some_prop": "something"})
@@ -1,5 +1,4 @@
 from typing import List
-from unittest.case import skip
 from uuid import UUID, uuid4
 
 import pytest
@@ -367,7 +366,6 @@ class TestPropDenormalized(ClickhouseTestMixin, BaseTest):
         filter = Filter(data={"properties": [{"key": "test_prop", "value": "_other_", "operator": "not_icontains"}],})
         self.assertEqual(len(self._run_query(filter)), 1)
 
-    @skip("denormalized person properties are not (yet) handled")
     def test_prop_person_denormalized(self):
         _create_person(distinct_ids=["some_id"], team_id=self.team.pk, properties={"email": "test@posthog.com"})
         _create_event(event="$pageview", team=self.team, distinct_id="some_id")
@@ -405,6 +403,21 @@ class TestPropDenormalized(ClickhouseTestMixin, BaseTest):
         filter = Filter(data={"properties": [{"key": "test_prop", "value": 0}],})
         self.assertEqual(len(self._run_query(filter)), 1)
 
+    def test_prop_event_denormalized_numeric_column(self):
+        _create_event(event="$pageview", team=self.team, distinct_id="whatever", properties={"test_prop": 0.5})
+        _create_event(event="$pageview", team=self.team, distinct_id="whatever", properties={"test_prop": 2})
+
+        materialize("events", "test_prop")
+
+        query, _ = prop_filter_json_extract(Property(key="test_prop", value=1, operator="gt"), 0)
+        self.assertEqual(query, "AND mat_test_prop_num > %(vglobal_0)s")
+
+        filter = Filter(data={"properties": [{"key": "test_prop", "value": 1, "operator": "gt"}],})
+        self.assertEqual(len(self._run_query(filter)), 1)
+
+        filter = Filter(data={"properties": [{"key": "test_prop", "value": "1", "operator": "lt"}],})
+        self.assertEqual(len(self._run_query(filter)), 1)
+
 
 @pytest.fixture
 def test_events(db, team) -> List[UUID]:
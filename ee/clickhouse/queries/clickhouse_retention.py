@@ -73,19 +73,21 @@ class ClickhouseRetention(Retention):
                 target_event_query=target_event_query,
             ),
             all_params,
+            columnar=True,
         )
 
         initial_interval_result = sync_execute(
-            INITIAL_INTERVAL_SQL.format(reference_event_sql=target_event_query, trunc_func=trunc_func,), all_params
+            INITIAL_INTERVAL_SQL.format(reference_event_sql=target_event_query, trunc_func=trunc_func,),
+            all_params,
+            columnar=True,
         )
 
-        result_dict = {}
-        for initial_res in initial_interval_result:
-            result_dict.update({(initial_res[0], 0): {"count": initial_res[1], "people": []}})
-
-        for res in result:
-            result_dict.update({(res[0], res[1]): {"count": res[2], "people": []}})
-
+        result_dict = {
+            (interval, 0): {"count": count, "people": []} for interval, count in zip(*initial_interval_result[:2])
+        }
+        result_dict.update(
+            {(interval, period): {"count": count, "people": []} for interval, period, count in zip(*result[:3])}
+        )
         return result_dict
 
     def _get_condition(self, target_entity: Entity, table: str, prepend: str = "") -> Tuple[str, Dict]:
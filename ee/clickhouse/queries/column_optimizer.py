@@ -1,6 +1,6 @@
 from typing import List, Set, Tuple, Union, cast
 
-from ee.clickhouse.materialized_columns.columns import ColumnName, get_materialized_columns
+from ee.clickhouse.materialized_columns.columns import ColumnName, get_materialized_columns, get_property_columns
 from ee.clickhouse.models.action import get_action_tables_and_properties, uses_elements_chain
 from ee.clickhouse.models.property import extract_tables_and_properties
 from posthog.constants import TREND_FILTER_TYPE_ACTIONS
@@ -9,7 +9,7 @@ from posthog.models.filters import Filter
 from posthog.models.filters.mixins.utils import cached_property
 from posthog.models.filters.path_filter import PathFilter
 from posthog.models.filters.retention_filter import RetentionFilter
-from posthog.models.property import Property, PropertyName, PropertyType
+from posthog.models.property import Property, PropertyName, PropertyType, TableWithProperties
 from posthog.models.team import Team
 
 
@@ -28,31 +28,23 @@ class ColumnOptimizer:
     def materialized_event_columns_to_query(self) -> List[ColumnName]:
         "Returns a list of event table columns containing materialized properties that this query needs"
 
-        materialized_columns = get_materialized_columns("events")
-        return [
-            materialized_columns[property_name]
-            for property_name, type in self._used_properties_with_type("event")
-            if property_name in materialized_columns
-        ]
+        return self._materialized_columns_to_query("events", "event")
 
     @cached_property
     def materialized_person_columns_to_query(self) -> List[ColumnName]:
         "Returns a list of person table columns containing materialized properties that this query needs"
 
-        materialized_columns = get_materialized_columns("person")
-        return [
-            materialized_columns[property_name]
-            for property_name, type in self._used_properties_with_type("person")
-            if property_name in materialized_columns
-        ]
+        return self._materialized_columns_to_query("person", "person")
 
     @cached_property
     def should_query_event_properties_column(self) -> bool:
-        return len(self.materialized_event_columns_to_query) != len(self._used_properties_with_type("event"))
+        materialized_columns = get_materialized_columns("events")
+        return any(name not in materialized_columns for name, _ in self._used_properties_with_type("event"))
 
     @cached_property
     def should_query_person_properties_column(self) -> bool:
-        return len(self.materialized_person_columns_to_query) != len(self._used_properties_with_type("person"))
+        materialized_columns = get_materialized_columns("person")
+        return any(name not in materialized_columns for name, _ in self._used_properties_with_type("person"))
 
     @cached_property
     def is_using_person_properties(self) -> bool:
@@ -123,5 +115,14 @@ class ColumnOptimizer:
 
         return result
 
+    def _materialized_columns_to_query(
+        self, table: TableWithProperties, property_type: PropertyType
+    ) -> List[ColumnName]:
+        return [
+            column_name
+            for property_name, _ in self._used_properties_with_type(property_type)
+            for column_name in get_property_columns(table, property_name)
+        ]
+
     def _used_properties_with_type(self, property_type: PropertyType) -> Set[Tuple[PropertyName, PropertyType]]:
         return set((name, type) for name, type in self.properties_used_in_filter if type == property_type)
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from ee.clickhouse.materialized_columns.columns import ColumnName
 from ee.clickhouse.models.cohort import format_person_query, get_precalculated_query, is_precalculated_query
@@ -24,6 +24,7 @@ class ClickhouseEventQuery(metaclass=ABCMeta):
     _should_join_distinct_ids = False
     _should_join_persons = False
     _should_round_interval = False
+    _sampling_factor: Optional[float]
     _extra_fields: List[ColumnName]
     _extra_person_fields: List[ColumnName]
 
@@ -37,6 +38,8 @@ class ClickhouseEventQuery(metaclass=ABCMeta):
         # Extra events/person table columns to fetch since parent query needs them
         extra_fields: List[ColumnName] = [],
         extra_person_fields: List[ColumnName] = [],
+        # Fraction of events to read, for queries whose results are scaled back up from a sample
+        sampling_factor: Optional[float] = None,
         **kwargs,
     ) -> None:
         self._filter = filter
@@ -50,6 +53,7 @@ class ClickhouseEventQuery(metaclass=ABCMeta):
         self._should_join_persons = should_join_persons
         self._extra_fields = extra_fields
         self._extra_person_fields = extra_person_fields
+        self._sampling_factor = sampling_factor
 
         if not self._should_join_distinct_ids:
             self._determine_should_join_distinct_ids()
@@ -67,6 +71,9 @@ class ClickhouseEventQuery(metaclass=ABCMeta):
     def _determine_should_join_distinct_ids(self) -> None:
         pass
 
+    def _get_sample_clause(self) -> str:
+        return f"SAMPLE {self._sampling_factor}" if self._sampling_factor else ""
+
     def _get_disintct_id_query(self) -> str:
         if self._should_join_distinct_ids:
             return f"""
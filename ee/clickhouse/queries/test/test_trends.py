@@ -1,9 +1,10 @@
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from django.utils import timezone
 from freezegun import freeze_time
 from rest_framework.exceptions import ValidationError
 
+from ee.clickhouse.materialized_columns import materialize
 from ee.clickhouse.models.event import create_event
 from ee.clickhouse.models.person import create_person_distinct_id
 from ee.clickhouse.queries.trends.clickhouse_trends import ClickhouseTrends
@@ -575,6 +576,31 @@ class TestClickhouseTrends(ClickhouseTestMixin, trend_test_factory(ClickhouseTre
         result = ClickhouseTrends().run(filter, self.team,)
         self.assertEqual(result[0]["data"], [3.0, 2.0, 2.0, 0.0, 0.0, 0.0, 0.0, 0.0])
 
+    def test_math_uses_numeric_materialized_column(self):
+        for timestamp, price in [
+            ("2020-01-09T12:00:00Z", 10),
+            ("2020-01-09T13:00:00Z", 2.5),
+            ("2020-01-10T12:00:00Z", 4),
+        ]:
+            _create_event(
+                team=self.team, event="$pageview", distinct_id="p1", timestamp=timestamp, properties={"price": price}
+            )
+        materialize("events", "price")
+
+        data = {
+            "date_from": "2020-01-09T00:00:00Z",
+            "date_to": "2020-01-11T00:00:00Z",
+            "events": [{"id": "$pageview", "type": "events", "order": 0, "math": "sum", "math_property": "price"}],
+        }
+
+        with self.capture_select_queries() as sqls:
+            result = ClickhouseTrends().run(Filter(data=data), self.team)
+
+        trend_query = next(sql for sql in sqls if "FROM events" in sql)
+        self.assertEqual(result[0]["data"], [12.5, 4.0, 0.0])
+        self.assertIn("sum(mat_price_num)", trend_query)
+        self.assertNotIn("JSONExtract", trend_query)
+
     @test_with_materialized_columns(["key"])
     def test_breakdown_active_user_math(self):
 
@@ -859,3 +885,27 @@ class TestClickhouseTrends(ClickhouseTestMixin, trend_test_factory(ClickhouseTre
             ClickhouseTrends().run(
                 Filter(data={"events": [{"id": "sign up", "math": "sum"}]}), self.team,
             )
+
+    @freeze_time("2020-01-04T13:00:01Z")
+    def test_sampled_trends_are_scaled(self):
+        Person.objects.create(team_id=self.team.pk, distinct_ids=["blabla"])
+        # Events are sampled by uuid, so a half of them holds the 6 lowest uuids and none of the 4 highest
+        for uuid in [UUID(int=i) for i in range(1, 7)] + [UUID(int=2 ** 128 - i) for i in range(1, 5)]:
+            create_event(
+                event_uuid=uuid,
+                team=self.team,
+                event="sign up",
+                distinct_id="blabla",
+                timestamp="2020-01-03T12:00:00Z",
+            )
+
+        filter_data = {"date_from": "-7d", "sampling_factor": 0.5}
+        count_response = ClickhouseTrends().run(Filter(data={**filter_data, "events": [{"id": "sign up"}]}), self.team,)
+        dau_response = ClickhouseTrends().run(
+            Filter(data={**filter_data, "events": [{"id": "sign up", "math": "dau"}]}), self.team,
+        )
+
+        # The 6 sampled events are counted twice, as each stands for two
+        self.assertEqual(count_response[0]["count"], 12)
+        # Unique users can't be estimated from a sample of events, so aren't sampled
+        self.assertEqual(dau_response[0]["count"], 1)
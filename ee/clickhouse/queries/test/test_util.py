@@ -1,16 +1,21 @@
+import os
+import time
 from datetime import datetime
+from unittest.mock import patch
 from uuid import uuid4
 
 import pytz
+from django.test import override_settings
 from freezegun.api import freeze_time
 
 from ee.clickhouse.client import sync_execute
 from ee.clickhouse.models.event import create_event
 from ee.clickhouse.queries.breakdown_props import _parse_breakdown_cohorts
-from ee.clickhouse.queries.util import get_earliest_timestamp
+from ee.clickhouse.queries.util import get_earliest_timestamp, is_relative_date, parse_timestamps, round_timestamp
 from posthog.models.action import Action
 from posthog.models.action_step import ActionStep
 from posthog.models.cohort import Cohort
+from posthog.models.filters import Filter
 
 
 def _create_event(**kwargs):
@@ -41,3 +46,72 @@ def test_parse_breakdown_cohort_query(db, team):
     queries, params = _parse_breakdown_cohorts([cohort1])
     assert len(queries) == 1
     sync_execute(queries[0], params)
+
+
+def test_round_timestamp():
+    timestamp = datetime(2021, 1, 21, 12, 34, 56, 789, tzinfo=pytz.UTC)
+
+    assert round_timestamp(timestamp, 0) == datetime(2021, 1, 21, 12, 34, 56, tzinfo=pytz.UTC)
+    assert round_timestamp(timestamp, 60) == datetime(2021, 1, 21, 12, 34, tzinfo=pytz.UTC)
+    assert round_timestamp(timestamp, 300, round_up=True) == datetime(2021, 1, 21, 12, 35, tzinfo=pytz.UTC)
+    # Already on a boundary, e.g. an hour being drilled into
+    assert round_timestamp(datetime(2021, 1, 21, 12, tzinfo=pytz.UTC), 300, round_up=True) == datetime(
+        2021, 1, 21, 12, tzinfo=pytz.UTC
+    )
+
+    # Naive timestamps are in UTC, whatever the time zone of the server
+    try:
+        with patch.dict(os.environ, {"TZ": "Asia/Kolkata"}):
+            time.tzset()
+            assert round_timestamp(datetime(2021, 1, 21, 12, 34, 56), 3600) == datetime(2021, 1, 21, 12)
+    finally:
+        time.tzset()
+
+
+def test_is_relative_date():
+    assert is_relative_date("-7d")
+    assert is_relative_date("all")
+    assert is_relative_date(None)
+    assert not is_relative_date("2021-01-21")
+    assert not is_relative_date("2021-01-21T12:34:56")
+    assert not is_relative_date(datetime(2021, 1, 21, 12, 34, 56, tzinfo=pytz.UTC))
+
+
+@override_settings(CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS=300)
+def test_parse_timestamps_buckets_relative_dates(db, team):
+    filter = Filter(data={"date_from": "-1d", "interval": "hour"})
+
+    with freeze_time("2021-01-21T12:31:12Z"):
+        first = parse_timestamps(filter=filter, team_id=team.pk)
+    with freeze_time("2021-01-21T12:34:59Z"):
+        second = parse_timestamps(filter=Filter(data=filter.to_dict()), team_id=team.pk)
+
+    assert first == second
+    assert first[2] == {"date_from": "2021-01-20 12:30:00", "date_to": "2021-01-21 12:35:00"}
+
+
+@override_settings(CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS=300)
+def test_parse_timestamps_granularity_is_capped_by_interval(db, team):
+    filter = Filter(data={"date_from": "2021-01-21 12:31:00", "date_to": "2021-01-21 12:32:00", "interval": "minute"})
+
+    _, _, params = parse_timestamps(filter=filter, team_id=team.pk)
+
+    assert params == {"date_from": "2021-01-21 12:31:00", "date_to": "2021-01-21 12:32:00"}
+
+
+@override_settings(CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS=300)
+def test_parse_timestamps_keeps_absolute_dates(db, team):
+    filter = Filter(data={"date_from": "2021-01-20T12:31:12", "date_to": "2021-01-21T12:34:59", "interval": "hour"})
+
+    assert parse_timestamps(filter=filter, team_id=team.pk)[2] == {
+        "date_from": "2021-01-20 12:31:12",
+        "date_to": "2021-01-21 12:34:59",
+    }
+
+    # Only the relative bound is rounded
+    filter = Filter(data={"date_from": "2021-01-20T12:31:12", "interval": "hour"})
+    with freeze_time("2021-01-21T12:34:59Z"):
+        assert parse_timestamps(filter=filter, team_id=team.pk)[2] == {
+            "date_from": "2021-01-20 12:31:12",
+            "date_to": "2021-01-21 12:35:00",
+        }
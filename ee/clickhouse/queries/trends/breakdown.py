@@ -10,7 +10,12 @@ from ee.clickhouse.queries.breakdown_props import (
 )
 from ee.clickhouse.queries.column_optimizer import ColumnOptimizer
 from ee.clickhouse.queries.person_query import ClickhousePersonQuery
-from ee.clickhouse.queries.trends.util import enumerate_time_range, get_active_user_params, parse_response, process_math
+from ee.clickhouse.queries.trends.util import (
+    enumerate_time_range,
+    get_active_user_params,
+    parse_response_columns,
+    process_math,
+)
 from ee.clickhouse.queries.util import date_from_clause, get_time_diff, get_trunc_func_ch, parse_timestamps
 from ee.clickhouse.sql.events import EVENT_JOIN_PERSON_SQL
 from ee.clickhouse.sql.person import GET_TEAM_PERSON_DISTINCT_IDS
@@ -199,23 +204,27 @@ class ClickhouseTrendsBreakdown:
         self, filter: Filter, entity: Entity, additional_values: Dict[str, Any]
     ) -> Callable:
         def _parse(result: List) -> List:
-            parsed_results = []
-            for idx, stats in enumerate(result):
-                result_descriptors = self._breakdown_result_descriptors(stats[1], filter, entity)
-                parsed_result = {"aggregated_value": stats[0], **result_descriptors, **additional_values}
-                parsed_results.append(parsed_result)
-
-            return parsed_results
+            if not result:
+                return []
+            return [
+                {
+                    "aggregated_value": aggregated_value,
+                    **self._breakdown_result_descriptors(breakdown_value, filter, entity),
+                    **additional_values,
+                }
+                for aggregated_value, breakdown_value in zip(result[0], result[1])
+            ]
 
         return _parse
 
     def _parse_trend_result(self, filter: Filter, entity: Entity) -> Callable:
         def _parse(result: List) -> List:
-            parsed_results = []
-            for idx, stats in enumerate(result):
-                result_descriptors = self._breakdown_result_descriptors(stats[2], filter, entity)
-                parsed_result = parse_response(stats, filter, result_descriptors)
-                parsed_results.append(parsed_result)
+            if not result:
+                return []
+            result_descriptors = [
+                self._breakdown_result_descriptors(breakdown_value, filter, entity) for breakdown_value in result[2]
+            ]
+            parsed_results = parse_response_columns(result, filter, result_descriptors)
 
             return sorted(parsed_results, key=lambda x: 0 if x.get("breakdown_value") != "all" else 1)
 
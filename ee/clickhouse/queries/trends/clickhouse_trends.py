@@ -1,11 +1,11 @@
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from django.conf import settings
 from django.db.models.query import Prefetch
 from django.utils import timezone
 from sentry_sdk.api import capture_exception
 
-from ee.clickhouse.client import sync_execute
+from ee.clickhouse.client import execute_many
 from ee.clickhouse.queries.trends.breakdown import ClickhouseTrendsBreakdown
 from ee.clickhouse.queries.trends.formula import ClickhouseTrendsFormula
 from ee.clickhouse.queries.trends.lifecycle import ClickhouseLifecycle
@@ -16,7 +16,7 @@ from posthog.models.action_step import ActionStep
 from posthog.models.entity import Entity
 from posthog.models.filters import Filter
 from posthog.models.team import Team
-from posthog.queries.base import handle_compare
+from posthog.queries.base import convert_to_comparison, determine_compared_filter
 from posthog.queries.trends import Trends
 from posthog.utils import relative_date_parse
 
@@ -42,22 +42,22 @@ class ClickhouseTrends(ClickhouseTrendsTotalVolume, ClickhouseLifecycle, Clickho
 
         return sql, params, parse_function
 
-    def _run_query(self, filter: Filter, entity: Entity, team_id: int) -> List[Dict[str, Any]]:
+    def _get_serialized_query(self, filter: Filter, entity: Entity, team_id: int) -> Tuple[str, Dict, Callable]:
         sql, params, parse_function = self._get_sql_for_entity(filter, entity, team_id)
-        try:
-            result = sync_execute(sql, params)
-        except Exception as e:
-            capture_exception(e)
-            if settings.TEST or settings.DEBUG:
-                raise e
-            result = []
 
-        result = parse_function(result)
-        serialized_data = self._format_serialized(entity, result)
+        def serialize(result) -> List[Dict[str, Any]]:
+            serialized_data = self._format_serialized(entity, parse_function(result))
+            if filter.display == TRENDS_CUMULATIVE:
+                serialized_data = self._handle_cumulative(serialized_data)
+            return serialized_data
 
-        if filter.display == TRENDS_CUMULATIVE:
-            serialized_data = self._handle_cumulative(serialized_data)
-        return serialized_data
+        return sql, params, serialize
+
+    def _compared_filters(self, filter: Filter) -> List[Tuple[Filter, Optional[str]]]:
+        "Like `handle_compare`, but returning the filters to query along with their period label when comparing"
+        if filter.compare:
+            return [(filter, "current"), (determine_compared_filter(filter), "previous")]
+        return [(filter, None)]
 
     def run(self, filter: Filter, team: Team, *args, **kwargs) -> List[Dict[str, Any]]:
         actions = Action.objects.filter(team_id=team.pk).order_by("-id")
@@ -67,17 +67,40 @@ class ClickhouseTrends(ClickhouseTrendsTotalVolume, ClickhouseLifecycle, Clickho
 
         filter = self._set_default_dates(filter, team.pk)
 
+        # Queries are built first, then run all at once, so a trend with several series or compared periods takes
+        # about as long as its slowest query
+        queries: List[Tuple[str, Dict, Callable, Filter, Optional[str]]] = []
         if filter.formula:
-            return handle_compare(filter, self._run_formula_query, team)
-
-        result = []
-        for entity in filter.entities:
-            if entity.type == TREND_FILTER_TYPE_ACTIONS:
-                try:
-                    entity.name = actions.get(id=entity.id).name
-                except Action.DoesNotExist:
-                    continue
-            entities_list = handle_compare(filter, self._run_query, team, entity=entity)
-            result.extend(entities_list)
-
-        return result
+            for compared_filter, label in self._compared_filters(filter):
+                queries.append((*self._get_formula_query(compared_filter, team.pk), compared_filter, label))
+        else:
+            for entity in filter.entities:
+                if entity.type == TREND_FILTER_TYPE_ACTIONS:
+                    try:
+                        entity.name = actions.get(id=entity.id).name
+                    except Action.DoesNotExist:
+                        continue
+                for compared_filter, label in self._compared_filters(filter):
+                    queries.append(
+                        (*self._get_serialized_query(compared_filter, entity, team.pk), compared_filter, label)
+                    )
+
+        # Results are parsed column by column, as trends with many breakdown values have as many rows
+        results = execute_many([(sql, params) for sql, params, *_ in queries], return_exceptions=True, columnar=True)
+
+        response = []
+        for (_, _, serialize, compared_filter, label), result in zip(queries, results):
+            if isinstance(result, Exception):
+                if filter.formula:
+                    raise result
+                # A failing series shouldn't keep the others from showing
+                capture_exception(result)
+                if settings.TEST or settings.DEBUG:
+                    raise result
+                result = []
+
+            serialized = serialize(result)
+            if label is not None:
+                serialized = convert_to_comparison(serialized, compared_filter, label)
+            response.extend(serialized)
+        return response
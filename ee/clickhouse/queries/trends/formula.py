@@ -1,17 +1,16 @@
 import math
 from itertools import accumulate
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Tuple
 
-from ee.clickhouse.client import sync_execute
 from ee.clickhouse.queries.breakdown_props import get_breakdown_cohort_name
-from ee.clickhouse.queries.trends.util import parse_response
+from ee.clickhouse.queries.trends.util import parse_response_columns
 from posthog.constants import TRENDS_CUMULATIVE, TRENDS_DISPLAY_BY_VALUE
 from posthog.models.cohort import Cohort
 from posthog.models.filters.filter import Filter
 
 
 class ClickhouseTrendsFormula:
-    def _run_formula_query(self, filter: Filter, team_id: int):
+    def _get_formula_query(self, filter: Filter, team_id: int) -> Tuple[str, Dict, Callable]:
         letters = [chr(65 + i) for i in range(0, len(filter.entities))]
         queries = []
         params: Dict[str, Any] = {}
@@ -65,28 +64,28 @@ class ClickhouseTrendsFormula:
                 [" CROSS JOIN ({}) as sub_{}".format(query, letters[i + 1]) for i, query in enumerate(queries[1:])]
             ),
         )
-        result = sync_execute(sql, params)
-        response = []
-        for item in result:
-            additional_values: Dict[str, Any] = {
-                "label": self._label(filter, item, team_id),
-            }
+        return sql, params, lambda result: self._parse_formula_result(filter, result, is_aggregate)
+
+    def _parse_formula_result(self, filter: Filter, result: List, is_aggregate: bool) -> List[Dict]:
+        if not result:
+            return []
+        additional_values = []
+        for index, values in enumerate(result[1]):
+            series: Dict[str, Any] = {"label": self._label(filter, result[2][index] if filter.breakdown else None)}
             if is_aggregate:
-                additional_values["data"] = []
-                additional_values["aggregated_value"] = item[1][0]
+                series["data"] = []
+                series["aggregated_value"] = values[0]
             else:
-                additional_values["data"] = [
-                    round(number, 2) if not math.isnan(number) and not math.isinf(number) else 0.0 for number in item[1]
-                ]
+                series["data"] = [round(number, 2) if math.isfinite(number) else 0.0 for number in values]
                 if filter.display == TRENDS_CUMULATIVE:
-                    additional_values["data"] = list(accumulate(additional_values["data"]))
-            additional_values["count"] = float(sum(additional_values["data"]))
-            response.append(parse_response(item, filter, additional_values))
-        return response
+                    series["data"] = list(accumulate(series["data"]))
+            series["count"] = float(sum(series["data"]))
+            additional_values.append(series)
+        return parse_response_columns(result, filter, additional_values)
 
-    def _label(self, filter: Filter, item: List, team_id: int) -> str:
+    def _label(self, filter: Filter, breakdown_value: Any) -> str:
         if filter.breakdown:
             if filter.breakdown_type == "cohort":
-                return get_breakdown_cohort_name(item[2])
-            return item[2]
+                return get_breakdown_cohort_name(breakdown_value)
+            return breakdown_value
         return "Formula ({})".format(filter.formula)
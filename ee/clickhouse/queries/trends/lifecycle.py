@@ -10,7 +10,7 @@ from ee.clickhouse.client import sync_execute
 from ee.clickhouse.models.action import format_action_filter
 from ee.clickhouse.models.person import get_persons_by_uuids
 from ee.clickhouse.models.property import parse_prop_clauses
-from ee.clickhouse.queries.trends.util import parse_response
+from ee.clickhouse.queries.trends.util import parse_response_columns
 from ee.clickhouse.queries.util import get_earliest_timestamp, get_time_diff, get_trunc_func_ch, parse_timestamps
 from ee.clickhouse.sql.person import GET_TEAM_PERSON_DISTINCT_IDS
 from ee.clickhouse.sql.trends.lifecycle import LIFECYCLE_PEOPLE_SQL, LIFECYCLE_SQL
@@ -92,14 +92,12 @@ class ClickhouseLifecycle(LifecycleTrend):
 
     def _parse_result(self, filter: Filter, entity: Entity) -> Callable:
         def _parse(result: List) -> List:
-            res = []
-            for val in result:
-                label = "{} - {}".format(entity.name, val[2])
-                additional_values = {"label": label, "status": val[2]}
-                parsed_result = parse_response(val, filter, additional_values)
-                res.append(parsed_result)
-
-            return res
+            if not result:
+                return []
+            additional_values = [
+                {"label": "{} - {}".format(entity.name, status), "status": status} for status in result[2]
+            ]
+            return parse_response_columns(result, filter, additional_values)
 
         return _parse
 
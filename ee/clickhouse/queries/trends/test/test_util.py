@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from ee.clickhouse.queries.trends.util import parse_response_columns
+from posthog.models.filters import Filter
+
+
+def test_parse_response_columns():
+    dates = [datetime(2021, 6, 1), datetime(2021, 6, 2)]
+    columns = [(dates, list(dates)), ([1, 2], [0, 5]), ("Chrome", "Safari")]
+
+    result = parse_response_columns(
+        columns, Filter(data={"interval": "day"}), [{"label": "Chrome"}, {"label": "Safari"}]
+    )
+
+    assert result == [
+        {
+            "data": [1.0, 2.0],
+            "count": 3.0,
+            "labels": ["1-Jun-2021", "2-Jun-2021"],
+            "days": ["2021-06-01", "2021-06-02"],
+            "label": "Chrome",
+        },
+        {
+            "data": [0.0, 5.0],
+            "count": 5.0,
+            "labels": ["1-Jun-2021", "2-Jun-2021"],
+            "days": ["2021-06-01", "2021-06-02"],
+            "label": "Safari",
+        },
+    ]
+    # Series share their formatted dates, but not the lists holding them
+    assert result[0]["labels"] is not result[1]["labels"]
+
+
+def test_parse_response_columns_by_hour():
+    columns = [([datetime(2021, 6, 1, 13)],), ([4],)]
+
+    result = parse_response_columns(columns, Filter(data={"interval": "hour"}))
+
+    assert result[0]["labels"] == ["1-Jun-2021 13:00"]
+    assert result[0]["days"] == ["2021-06-01 13:00:00"]
+
+
+def test_parse_empty_response_columns():
+    assert parse_response_columns([], Filter(data={"interval": "day"})) == []
@@ -1,7 +1,12 @@
 from typing import Any, Callable, Dict, List, Tuple
 
 from ee.clickhouse.queries.trends.trend_event_query import TrendsEventQuery
-from ee.clickhouse.queries.trends.util import enumerate_time_range, parse_response, process_math
+from ee.clickhouse.queries.trends.util import (
+    enumerate_time_range,
+    get_entity_sampling_factor,
+    parse_response_columns,
+    process_math,
+)
 from ee.clickhouse.queries.util import (
     format_ch_timestamp,
     get_earliest_timestamp,
@@ -22,7 +27,8 @@ class ClickhouseTrendsTotalVolume:
         trunc_func = get_trunc_func_ch(filter.interval)
         interval_func = get_interval_func_ch(filter.interval)
         _, seconds_in_interval, _ = get_time_diff(filter.interval, filter.date_from, filter.date_to, team_id=team_id)
-        aggregate_operation, join_condition, math_params = process_math(entity)
+        sampling_factor = get_entity_sampling_factor(filter, entity)
+        aggregate_operation, join_condition, math_params = process_math(entity, sampling_factor)
 
         trend_event_query = TrendsEventQuery(
             filter=filter,
@@ -31,6 +37,7 @@ class ClickhouseTrendsTotalVolume:
             should_join_distinct_ids=True
             if join_condition != "" or entity.math in [WEEKLY_ACTIVE, MONTHLY_ACTIVE]
             else False,
+            sampling_factor=sampling_factor,
         )
         event_query, event_query_params = trend_event_query.get_query()
 
@@ -75,11 +82,6 @@ class ClickhouseTrendsTotalVolume:
 
     def _parse_total_volume_result(self, filter: Filter) -> Callable:
         def _parse(result: List) -> List:
-            parsed_results = []
-            for _, stats in enumerate(result):
-                parsed_result = parse_response(stats, filter)
-                parsed_results.append(parsed_result)
-
-            return parsed_results
+            return parse_response_columns(result, filter)
 
         return _parse
@@ -57,7 +57,7 @@ class TrendsEventQuery(ClickhouseEventQuery):
         self.params.update(entity_params)
 
         query = f"""
-            SELECT {_fields} FROM events {self.EVENT_TABLE_ALIAS}
+            SELECT {_fields} FROM events {self.EVENT_TABLE_ALIAS} {self._get_sample_clause()}
             {self._get_disintct_id_query()}
             {self._get_person_query()}
             WHERE team_id = %(team_id)s
@@ -1,12 +1,12 @@
 from datetime import timedelta
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from rest_framework.exceptions import ValidationError
 
-from ee.clickhouse.models.property import get_property_string_expr
-from ee.clickhouse.queries.util import format_ch_timestamp, get_earliest_timestamp
+from ee.clickhouse.models.property import get_property_numeric_expr
+from ee.clickhouse.queries.util import format_ch_timestamp, get_earliest_timestamp, get_sampling_factor
 from ee.clickhouse.sql.events import EVENT_JOIN_PERSON_SQL
-from posthog.constants import WEEKLY_ACTIVE
+from posthog.constants import MONTHLY_ACTIVE, TRENDS_LIFECYCLE, WEEKLY_ACTIVE
 from posthog.models.entity import Entity
 from posthog.models.filters import Filter, PathFilter
 
@@ -21,8 +21,23 @@ MATH_FUNCTIONS = {
     "p99": "quantile(0.99)",
 }
 
+# Math whose results grow with the number of events, so that of a sample is scaled to estimate that of all events
+SCALED_MATH = [None, "total", "sum"]
+UNIQUE_USERS_MATH = ["dau", WEEKLY_ACTIVE, MONTHLY_ACTIVE]
 
-def process_math(entity: Entity) -> Tuple[str, str, Dict[str, str]]:
+
+def get_entity_sampling_factor(filter: Filter, entity: Entity) -> Optional[float]:
+    """
+    Fraction of events to compute a series over, with `sampling_factor`. Only series of event counts and property math
+    without breakdown are sampled: events are sampled by uuid, so the number of unique users in a sample can't be
+    scaled back up to an estimate, and breakdowns and lifecycles don't read events through `TrendsEventQuery`.
+    """
+    if entity.math in UNIQUE_USERS_MATH or filter.breakdown or filter.shown_as == TRENDS_LIFECYCLE:
+        return None
+    return get_sampling_factor(filter)
+
+
+def process_math(entity: Entity, sampling_factor: Optional[float] = None) -> Tuple[str, str, Dict[str, str]]:
     aggregate_operation = "count(*)"
     join_condition = ""
     params = {}
@@ -33,41 +48,54 @@ def process_math(entity: Entity) -> Tuple[str, str, Dict[str, str]]:
         if entity.math_property is None:
             raise ValidationError({"math_property": "This field is required when `math` is set."}, code="required")
 
-        value, _ = get_property_string_expr("events", entity.math_property, f"%(e_{entity.index}_math)s", "properties")
-        aggregate_operation = f"{MATH_FUNCTIONS[entity.math]}(toFloat64OrNull({value}))"
+        value = get_property_numeric_expr("events", entity.math_property, f"%(e_{entity.index}_math)s", "properties")
+        aggregate_operation = f"{MATH_FUNCTIONS[entity.math]}({value})"
         params["join_property_key"] = entity.math_property
         params[f"e_{entity.index}_math"] = entity.math_property
 
+    if sampling_factor and entity.math in SCALED_MATH:
+        # Other math, e.g. averages or percentiles, is estimated as is from a sample
+        aggregate_operation = f"{aggregate_operation} / {sampling_factor}"
+
     return aggregate_operation, join_condition, params
 
 
-def parse_response(stats: Dict, filter: Filter, additional_values: Dict = {}) -> Dict[str, Any]:
-    counts = stats[1]
-    dates = [
-        item.strftime(
-            "%Y-%m-%d{}".format(", %H:%M" if filter.interval == "hour" or filter.interval == "minute" else "")
-        )
-        for item in stats[0]
-    ]
-    labels = [
-        item.strftime(
-            "%-d-%b-%Y{}".format(" %H:%M" if filter.interval == "hour" or filter.interval == "minute" else "")
-        )
-        for item in stats[0]
-    ]
-    days = [
-        item.strftime(
-            "%Y-%m-%d{}".format(" %H:%M:%S" if filter.interval == "hour" or filter.interval == "minute" else "")
+def parse_response_columns(
+    columns: Sequence[Sequence], filter: Filter, additional_values: Sequence[Dict] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Formats every series of a trend from a result fetched with `columnar=True`, whose first two columns are the dates
+    and counts of each series. `additional_values` are merged into the series at the same index.
+
+    Series mostly share their dates, e.g. all values of a breakdown, so each distinct range of dates is only formatted
+    once rather than for every series.
+    """
+    if not columns:
+        return []
+    has_time = filter.interval == "hour" or filter.interval == "minute"
+    formatted_dates: Dict[Tuple, Tuple[List[str], List[str]]] = {}
+    response = []
+    for index, (dates, counts) in enumerate(zip(columns[0], columns[1])):
+        dates = tuple(dates)
+        if dates not in formatted_dates:
+            formatted_dates[dates] = _format_dates(dates, has_time)
+        labels, days = formatted_dates[dates]
+        response.append(
+            {
+                "data": list(map(float, counts)),
+                "count": float(sum(counts)),
+                "labels": list(labels),
+                "days": list(days),
+                **(additional_values[index] if additional_values else {}),
+            }
         )
-        for item in stats[0]
-    ]
-    return {
-        "data": [float(c) for c in counts],
-        "count": float(sum(counts)),
-        "labels": labels,
-        "days": days,
-        **additional_values,
-    }
+    return response
+
+
+def _format_dates(dates: Tuple, has_time: bool) -> Tuple[List[str], List[str]]:
+    label_format = "%-d-%b-%Y %H:%M" if has_time else "%-d-%b-%Y"
+    day_format = "%Y-%m-%d %H:%M:%S" if has_time else "%Y-%m-%d"
+    return [date.strftime(label_format) for date in dates], [date.strftime(day_format) for date in dates]
 
 
 def get_active_user_params(filter: Union[Filter, PathFilter], entity: Entity, team_id: int) -> Dict[str, Any]:
@@ -1,7 +1,10 @@
-from datetime import datetime
-from typing import Dict, Optional, Tuple, Union
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple, Union
 
+import pytz
+from dateutil.parser import isoparse
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
@@ -34,22 +37,57 @@ def parse_timestamps(
 
     _date_to = filter.date_to
 
-    date_to = "AND {table}timestamp <= '{}'".format(format_ch_timestamp(_date_to, filter, " 23:59:59"), table=table,)
-    params.update({"date_to": format_ch_timestamp(_date_to, filter, " 23:59:59")})
+    date_to = "AND {table}timestamp <= '{}'".format(
+        format_ch_timestamp(_date_to, filter, " 23:59:59", round_up=True), table=table,
+    )
+    params.update({"date_to": format_ch_timestamp(_date_to, filter, " 23:59:59", round_up=True)})
 
     return date_from or "", date_to or "", params
 
 
-def format_ch_timestamp(timestamp: datetime, filter, default_hour_min: str = " 00:00:00"):
+def format_ch_timestamp(timestamp: datetime, filter, default_hour_min: str = " 00:00:00", round_up: bool = False):
     is_hour_or_min = (
         (filter.interval and filter.interval.lower() == "hour")
         or (filter.interval and filter.interval.lower() == "minute")
         or (filter._date_from == "-24h")
         or (filter._date_from == "-48h")
     )
+    # Relative dates resolve to the current second, which would make every query, and so its cache key, unique.
+    # Days are truncated anyway, and the granularity is never coarser than the interval, so buckets are unaffected
+    if is_hour_or_min and is_relative_date(filter._date_to if round_up else filter._date_from):
+        interval_seconds = TIME_IN_SECONDS.get((filter.interval or "day").lower(), TIME_IN_SECONDS["minute"])
+        granularity = min(settings.CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS, interval_seconds)
+        timestamp = round_timestamp(timestamp, granularity, round_up=round_up)
     return timestamp.strftime("%Y-%m-%d{}".format(" %H:%M:%S" if is_hour_or_min else default_hour_min))
 
 
+def round_timestamp(timestamp: datetime, granularity_seconds: int, round_up: bool = False) -> datetime:
+    """Rounds down, or up, to a multiple of `granularity_seconds` since the epoch, dropping microseconds."""
+    timestamp = timestamp.replace(microsecond=0)
+    if granularity_seconds <= 1:
+        return timestamp
+    # Naive timestamps, like the ones ClickHouse returns, are in UTC rather than in the server's time zone
+    aware_timestamp = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=pytz.UTC)
+    remainder = int(aware_timestamp.timestamp()) % granularity_seconds
+    if remainder == 0:
+        return timestamp
+    rounded = timestamp - timedelta(seconds=remainder)
+    return rounded + timedelta(seconds=granularity_seconds) if round_up else rounded
+
+
+def is_relative_date(date: Optional[Union[str, datetime]]) -> bool:
+    """Whether a raw `date_from` or `date_to` of a filter resolves relative to now, e.g. "-7d" or a missing one."""
+    if isinstance(date, datetime):
+        return False
+    if not date:
+        return True
+    try:
+        isoparse(date)  # Absolute dates are the ones relative_date_parse reads as ISO 8601
+    except ValueError:
+        return True
+    return False
+
+
 def get_earliest_timestamp(team_id: int) -> datetime:
     results = sync_execute(GET_EARLIEST_TIMESTAMP_SQL, {"team_id": team_id})
     if len(results) > 0:
@@ -126,3 +164,13 @@ def date_from_clause(interval_annotation: str, round_interval: bool) -> str:
         return "AND {interval}(timestamp) >= {interval}(toDateTime(%(date_from)s))".format(interval=interval_annotation)
     else:
         return "AND timestamp >= %(date_from)s"
+
+
+def get_sampling_factor(filter: Any) -> Optional[float]:
+    """
+    Fraction of events an insight is computed over, if sampled. The events table only has a sampling key outside of
+    DEBUG, see EVENTS_TABLE_SQL, so insights are never sampled there.
+    """
+    if settings.DEBUG:
+        return None
+    return getattr(filter, "sampling_factor", None)
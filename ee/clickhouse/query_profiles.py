@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+
+GiB = 1024 ** 3
+
+# ClickHouse settings for reads by what they're run for. Reads within a `query_profile` get the "default" profile's
+# settings, overridden by those of their profile, then by settings passed to them explicitly. Other queries, e.g.
+# inserts, mutations and migrations, only get the latter, so that long maintenance writes don't time out. Settings are
+# also overridable per profile with CLICKHOUSE_QUERY_PROFILES, e.g. {"trends": {"max_memory_usage": 21474836480}}
+QUERY_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "trends": {"max_execution_time": 180, "max_memory_usage": 10 * GiB},
+    "funnels": {"max_execution_time": 180, "max_memory_usage": 10 * GiB},
+    "paths": {"max_execution_time": 180, "max_memory_usage": 10 * GiB},
+    "persons": {"max_execution_time": 120, "max_memory_usage": 5 * GiB},
+    # Exports run in the background and read a lot, so can take longer but shouldn't take over the cluster
+    "exports": {"max_execution_time": 600, "max_threads": 4, "max_memory_usage": 5 * GiB},
+}
+
+_current_profile: ContextVar[Optional[str]] = ContextVar("clickhouse_query_profile", default=None)
+
+
+@contextmanager
+def query_profile(name: str) -> Iterator[None]:
+    """
+    Runs ClickHouse queries within the block, or the decorated function, under the named profile.
+
+    As it's a context variable, the profile also applies to queries `execute_many` runs in other threads.
+    """
+    if name not in QUERY_PROFILES:
+        raise ValueError(f"Unknown ClickHouse query profile {name}")
+    token = _current_profile.set(name)
+    try:
+        yield
+    finally:
+        _current_profile.reset(token)
+
+
+def get_current_profile() -> str:
+    return _current_profile.get() or "default"
+
+
+def in_query_profile() -> bool:
+    "Whether queries run now are within a `query_profile`"
+    return _current_profile.get() is not None
+
+
+def get_query_settings(explicit_settings: Any = None, is_read: bool = False) -> Dict[str, Any]:
+    "Settings for a query run now: for reads within a profile, those of the default and current profiles first"
+    if not is_read or not in_query_profile():
+        return dict(explicit_settings or {})
+    overrides = settings.CLICKHOUSE_QUERY_PROFILES
+    profile = get_current_profile()
+    return {
+        **QUERY_PROFILES["default"],
+        **overrides.get("default", {}),
+        **QUERY_PROFILES[profile],
+        **overrides.get(profile, {}),
+        **(explicit_settings or {}),
+    }
@@ -0,0 +1,119 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+from clickhouse_driver import Client as SyncClient
+from clickhouse_driver.errors import NetworkError, SocketTimeoutError
+from clickhouse_pool import ChPool
+from clickhouse_pool.pool import TooManyConnections
+
+from posthog.internal_metrics import incr
+
+# Errors meaning a replica couldn't be reached, rather than that a query failed on it
+CONNECTION_ERRORS = (NetworkError, SocketTimeoutError, EOFError, OSError)
+
+T = TypeVar("T")
+
+
+@dataclass
+class Replica:
+    host: str
+    pool: ChPool
+    in_flight: int = 0
+    failed_until: float = 0  # time.monotonic() until which the replica is only used if no other is healthy
+
+    @property
+    def healthy(self) -> bool:
+        return self.failed_until <= time.monotonic()
+
+
+class ReplicaPools:
+    """
+    Connection pools to ClickHouse replicas serving the same data, for spreading read queries across them.
+
+    Clients are taken from the replica running the fewest queries from this process, taking turns between those
+    equally busy. A replica that can't be connected to, or that can't be reached midway through a query, is left out
+    for `failure_cooldown` seconds, after which it's tried again.
+    """
+
+    def __init__(self, pools: Dict[str, ChPool], failure_cooldown: float) -> None:
+        if not pools:
+            raise ValueError("At least one ClickHouse replica is needed")
+        self.replicas = [Replica(host=host, pool=pool) for host, pool in pools.items()]
+        self.failure_cooldown = failure_cooldown
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get_client(self) -> Iterator[SyncClient]:
+        last_error: Optional[Exception] = None
+        for replica in self._by_preference():
+            try:
+                client = replica.pool.pull()
+            except TooManyConnections as err:
+                last_error = err
+                continue
+            try:
+                if not client.connection.connected:
+                    client.connection.connect()
+            except CONNECTION_ERRORS as err:
+                replica.pool.push(client, close=True)
+                self._mark_failed(replica)
+                last_error = err
+                continue
+            break
+        else:
+            raise last_error  # type: ignore
+
+        with self._lock:
+            replica.in_flight += 1
+        broken = False
+        try:
+            yield client
+        except CONNECTION_ERRORS:
+            broken = True
+            self._mark_failed(replica)
+            raise
+        finally:
+            with self._lock:
+                replica.in_flight -= 1
+            # A connection that failed mid-query can't be reused
+            replica.pool.push(client, close=broken)
+
+    def run(self, func: Callable[[SyncClient], T]) -> T:
+        """
+        Runs `func` with a client, then again with one of another replica if the first replica couldn't be reached
+        midway, e.g. as it went down or timed out. So `func` must be safe to run twice, like a read.
+        """
+        try:
+            with self.get_client() as client:
+                return func(client)
+        except CONNECTION_ERRORS:
+            if not self._has_healthy_replica():
+                raise
+        incr("clickhouse_replica_retry")
+        with self.get_client() as client:
+            return func(client)
+
+    def _has_healthy_replica(self) -> bool:
+        with self._lock:
+            return any(replica.healthy for replica in self.replicas)
+
+    def _by_preference(self) -> List[Replica]:
+        "Healthy replicas first, least busy first, then the rest by how soon they're due to be tried again"
+        turn = next(self._turns)
+        with self._lock:
+            # Rotating the replicas every time makes the sort, which is stable, take turns between equally busy ones
+            offset = turn % len(self.replicas)
+            rotated = self.replicas[offset:] + self.replicas[:offset]
+            healthy = sorted((replica for replica in rotated if replica.healthy), key=lambda r: r.in_flight)
+            failed = sorted((replica for replica in rotated if not replica.healthy), key=lambda r: r.failed_until)
+        return healthy + failed
+
+    def _mark_failed(self, replica: Replica) -> None:
+        incr("clickhouse_replica_failure", tags={"host": replica.host})
+        with self._lock:
+            replica.failed_until = time.monotonic() + self.failure_cooldown
@@ -27,7 +27,7 @@ INSERT INTO cohortpeople
 SELECT person_id, cohort_id, %(team_id)s as team_id,  -1 as _sign
 FROM cohortpeople
 JOIN (
-    SELECT id, argMax(properties, person._timestamp) as properties, sum(is_deleted) as is_deleted FROM person WHERE team_id = %(team_id)s GROUP BY id
+    SELECT id, sum(is_deleted) as is_deleted FROM person WHERE team_id = %(team_id)s GROUP BY id
 ) as person ON (person.id = cohortpeople.person_id)
 WHERE cohort_id = %(cohort_id)s
 AND
@@ -40,7 +40,7 @@ INSERT_PEOPLE_MATCHING_COHORT_ID_SQL = """
 INSERT INTO cohortpeople
     SELECT id, %(cohort_id)s as cohort_id, %(team_id)s as team_id, 1 as _sign
     FROM (
-        SELECT id, argMax(properties, person._timestamp) as properties, sum(is_deleted) as is_deleted FROM person WHERE team_id = %(team_id)s GROUP BY id
+        SELECT id, sum(is_deleted) as is_deleted FROM person WHERE team_id = %(team_id)s GROUP BY id
     ) as person
     LEFT JOIN (
         SELECT person_id, sum(sign) AS sign FROM cohortpeople WHERE cohort_id = %(cohort_id)s AND team_id = %(team_id)s GROUP BY person_id
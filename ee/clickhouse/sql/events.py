@@ -21,9 +21,14 @@ CREATE TABLE {table_name} ON CLUSTER {cluster}
     created_at DateTime64(6, 'UTC')
     {materialized_columns}
     {extra_fields}
+    {indexes}
 ) ENGINE = {engine} 
 """
 
+# Data skipping index on event names, so filters on events sent rarely skip most granules of a team's date range
+EVENT_NAME_INDEX = "event_name_idx"
+EVENT_NAME_INDEX_DEFINITION = f"{EVENT_NAME_INDEX} event TYPE bloom_filter(0.01) GRANULARITY 1"
+
 EVENTS_TABLE_MATERIALIZED_COLUMNS = """
     , properties_issampledevent VARCHAR materialized trim(BOTH '\"' FROM JSONExtractRaw(properties, 'isSampledEvent'))
     , properties_currentscreen VARCHAR materialized trim(BOTH '\"' FROM JSONExtractRaw(properties, 'currentScreen'))
@@ -44,6 +49,7 @@ ORDER BY (team_id, toDate(timestamp), distinct_id, uuid)
     engine=table_engine(EVENTS_TABLE, "_timestamp", REPLACING_MERGE_TREE),
     extra_fields=KAFKA_COLUMNS,
     materialized_columns=EVENTS_TABLE_MATERIALIZED_COLUMNS,
+    indexes=f", INDEX {EVENT_NAME_INDEX_DEFINITION}",
     sample_by_uuid="SAMPLE BY uuid" if not DEBUG else "",  # https://github.com/PostHog/posthog/issues/5684
     storage_policy=STORAGE_POLICY,
 )
@@ -54,6 +60,7 @@ KAFKA_EVENTS_TABLE_SQL = EVENTS_TABLE_BASE_SQL.format(
     engine=kafka_engine(topic=KAFKA_EVENTS, serialization="Protobuf", proto_schema="events:Event"),
     extra_fields="",
     materialized_columns="",
+    indexes="",
 )
 
 # You must include the database here because of a bug in clickhouse
@@ -268,7 +268,7 @@ WHERE person_id IN
 (
     SELECT id
     FROM (
-        SELECT id, argMax(properties, person._timestamp) as properties, max(is_deleted) as is_deleted
+        SELECT id, {person_fields}, max(is_deleted) as is_deleted
         FROM person
         WHERE team_id = %(team_id)s
         GROUP BY id
@@ -277,7 +277,7 @@ WHERE person_id IN
     WHERE 1 = 1 {filters}
 )
 """.format(
-    filters="{filters}", GET_TEAM_PERSON_DISTINCT_IDS=GET_TEAM_PERSON_DISTINCT_IDS,
+    filters="{filters}", person_fields="{person_fields}", GET_TEAM_PERSON_DISTINCT_IDS=GET_TEAM_PERSON_DISTINCT_IDS,
 )
 
 GET_PERSON_PROPERTIES_COUNT = """
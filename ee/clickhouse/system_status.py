@@ -11,9 +11,9 @@ from dateutil.relativedelta import relativedelta
 from django.utils import timezone
 from sentry_sdk.api import capture_exception
 
-from ee.clickhouse.client import make_ch_pool, sync_execute
+from ee.clickhouse.client import make_ch_pool, read_pools, sync_execute
 from ee.clickhouse.models.event import get_event_count, get_event_count_for_last_month, get_event_count_month_to_date
-from posthog.settings import CLICKHOUSE_PASSWORD, CLICKHOUSE_STABLE_HOST, CLICKHOUSE_USER
+from posthog.settings import CLICKHOUSE_PASSWORD, CLICKHOUSE_READ_HOSTS, CLICKHOUSE_STABLE_HOST, CLICKHOUSE_USER
 
 SLOW_THRESHOLD_MS = 10000
 SLOW_AFTER = relativedelta(hours=6)
@@ -31,6 +31,14 @@ def system_status() -> Generator[SystemStatusRow, None, None]:
     if not alive:
         return
 
+    if CLICKHOUSE_READ_HOSTS:
+        for replica in read_pools.replicas:
+            yield {
+                "key": f"clickhouse_replica_{replica.host}_healthy",
+                "metric": f"Clickhouse replica {replica.host} healthy",
+                "value": replica.healthy,
+            }
+
     yield {"key": "clickhouse_event_count", "metric": "Events in ClickHouse", "value": get_event_count()}
     yield {
         "key": "clickhouse_event_count_last_month",
@@ -1,10 +1,34 @@
 import datetime
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest.mock import patch
+from uuid import UUID
 
 import fakeredis
-from django.test import TestCase
+import zstandard
+from django.test import TestCase, override_settings
 from freezegun import freeze_time
 
-from ee.clickhouse.client import CACHE_TTL, _deserialize, _key_hash, cache_sync_execute
+from ee.clickhouse.client import (
+    CACHE_EMPTY_RESULT_TTL,
+    CACHE_FORMAT_VERSION,
+    CACHE_TTL,
+    KILL_QUERY_GRACE_SECONDS,
+    _deserialize,
+    _get_pool,
+    _key_hash,
+    _serialize,
+    cache_sync_execute,
+    ch_pool,
+    execute_many,
+    read_pools,
+    stream_execute,
+    sync_execute,
+)
+from ee.clickhouse.errors import MultipleQueryErrors
+from ee.clickhouse.query_profiles import query_profile
 
 
 class ClickhouseClientTestCase(TestCase):
@@ -43,3 +67,207 @@ class ClickhouseClientTestCase(TestCase):
         with freeze_time(start + datetime.timedelta(seconds=CACHE_TTL + 10)):
             exists = self.redis_client.exists(_key_hash(query, args=args))
             self.assertFalse(exists)
+
+    def test_cache_hit_is_a_single_get(self):
+        cache_sync_execute("select 1", redis_client=self.redis_client)
+
+        with patch.object(self.redis_client, "get", wraps=self.redis_client.get) as get, patch.object(
+            self.redis_client, "exists"
+        ) as exists, patch("ee.clickhouse.client.sync_execute") as sync_execute:
+            self.assertEqual(cache_sync_execute("select 1", redis_client=self.redis_client), [(1,)])
+
+        get.assert_called_once()
+        exists.assert_not_called()
+        sync_execute.assert_not_called()
+
+    def test_cache_keeps_types(self):
+        query = "select toDateTime('2021-01-01 12:00:00', 'UTC'), toUUID('00000000-0000-0000-0000-000000000001'), 'x'"
+        result = cache_sync_execute(query, redis_client=self.redis_client)
+        cached = cache_sync_execute(query, redis_client=self.redis_client)
+
+        self.assertEqual(cached, result)
+        self.assertIsInstance(cached[0][0], datetime.datetime)
+        self.assertEqual(cached[0][1], UUID("00000000-0000-0000-0000-000000000001"))
+
+    def test_serialized_results_are_compressed(self):
+        result = [(i, "some repeated property value") for i in range(1000)]
+
+        self.assertEqual(_deserialize(_serialize(result)), result)
+        self.assertLess(len(_serialize(result)), len(str(result)) / 5)
+
+    def test_serialization_keeps_types(self):
+        result = (
+            [
+                (
+                    datetime.datetime(2021, 1, 1, 12, tzinfo=datetime.timezone.utc),
+                    datetime.datetime(2021, 1, 1, 12, 0, 0, 123456),
+                    datetime.date(2021, 1, 1),
+                    UUID("00000000-0000-0000-0000-000000000001"),
+                    Decimal("1.10"),
+                    ["a", ("b", 1), {"key": 1.5, ("tuple", "key"): None}],
+                    True,
+                )
+            ],
+            [("column", "String")],
+        )
+
+        self.assertEqual(_deserialize(_serialize(result)), result)
+        self.assertIsInstance(_deserialize(_serialize(result))[0][0][5][1], tuple)
+
+    def test_serialized_results_are_not_executable(self):
+        # Results used to be pickled, which would run code from anyone able to write to Redis
+        pickled = b"\x01" + zstandard.ZstdCompressor().compress(pickle.dumps([(1,)]))
+
+        with self.assertRaises(ValueError):
+            _deserialize(pickled)
+        with self.assertRaises(ValueError):
+            _deserialize(CACHE_FORMAT_VERSION + zstandard.ZstdCompressor().compress(b'[{"pickle": "..."}]'))
+
+    def test_results_of_other_types_are_not_cached(self):
+        query = "select toIPv4('127.0.0.1')"
+        result = cache_sync_execute(query, redis_client=self.redis_client)
+
+        self.assertEqual(str(result[0][0]), "127.0.0.1")
+        self.assertFalse(self.redis_client.exists(_key_hash(query, None)))
+
+    def test_empty_results_are_cached_briefly(self):
+        query = "select 1 where 0"
+        cache_sync_execute(query, redis_client=self.redis_client)
+
+        self.assertLessEqual(self.redis_client.ttl(_key_hash(query, None)), CACHE_EMPTY_RESULT_TTL)
+
+    def test_entries_in_other_formats_are_misses(self):
+        self.redis_client.set(_key_hash("select 1", None), b"[[2]]")
+
+        self.assertEqual(cache_sync_execute("select 1", redis_client=self.redis_client), [(1,)])
+        self.assertEqual(_deserialize(self.redis_client.get(_key_hash("select 1", None))), [(1,)])
+
+    def test_zero_ttl_skips_cache(self):
+        cache_sync_execute("select 1", redis_client=self.redis_client, ttl=0)
+
+        self.assertFalse(self.redis_client.exists(_key_hash("select 1", None)))
+
+    def test_execute_many_returns_results_in_order(self):
+        results = execute_many([("select sleep(0.2), %(x)s", {"x": x}) for x in range(3)])
+
+        self.assertEqual(results, [[(0, 0)], [(0, 1)], [(0, 2)]])
+
+    def test_execute_many_runs_all_queries_before_raising(self):
+        with self.assertRaises(MultipleQueryErrors) as context:
+            execute_many([("select 1", None), ("select nonexistent", None), ("select throwIf(1)", None)])
+
+        self.assertEqual(list(context.exception.errors.keys()), [1, 2])
+
+    def test_execute_many_can_return_exceptions(self):
+        results = execute_many([("select 1", None), ("select nonexistent", None)], return_exceptions=True)
+
+        self.assertEqual(results[0], [(1,)])
+        self.assertIsInstance(results[1], Exception)
+
+    def test_execute_many_timeout(self):
+        results = execute_many([("select sleep(2)", None), ("select 1", None)], timeout=1, return_exceptions=True)
+
+        self.assertIsInstance(results[0], Exception)
+        self.assertEqual(results[1], [(1,)])
+
+    def test_columnar_results(self):
+        self.assertEqual(
+            sync_execute("select number, toString(number) from numbers(3)", columnar=True),
+            [(0, 1, 2), ("0", "1", "2")],
+        )
+
+    def test_stream_execute_yields_rows_and_reports_progress(self):
+        progress = []
+        rows = stream_execute(
+            "select number from numbers(10000)",
+            settings={"max_block_size": 1000},
+            progress_callback=lambda rows, total: progress.append((rows, total)),
+        )
+
+        self.assertEqual([row[0] for row in rows], list(range(10000)))
+        self.assertTrue(progress)
+        self.assertEqual(progress[-1][0], 10000)
+
+    def test_reads_of_system_tables_stay_on_the_main_host(self):
+        self.assertIs(_get_pool("SELECT count() FROM events WHERE team_id = %(team_id)s", {"team_id": 1}), read_pools)
+        self.assertIs(_get_pool("SELECT name FROM system.columns WHERE table = 'person'", {}), ch_pool)
+        self.assertIs(_get_pool("SELECT query FROM clusterAllReplicas(posthog, SYSTEM.query_log)", {}), ch_pool)
+        self.assertIs(_get_pool("INSERT INTO events VALUES", [{}]), ch_pool)
+
+    def test_stream_execute_can_be_closed_early(self):
+        rows = stream_execute("select number from numbers(1000000)", settings={"max_block_size": 1000})
+        self.assertEqual(next(rows), (0,))
+        rows.close()
+
+        # The connection went back to the pool usable
+        self.assertEqual(sync_execute("select 1"), [(1,)])
+
+
+@override_settings(CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS=10)
+class ClickhouseSingleFlightTestCase(TestCase):
+    def _run_concurrently(self, query, execute, count=5):
+        def execute_in_profile():
+            with query_profile("trends"):
+                return sync_execute(query)
+
+        with patch("ee.clickhouse.client._sync_execute", side_effect=execute) as mock_execute:
+            with ThreadPoolExecutor(max_workers=count) as executor:
+                futures = [executor.submit(execute_in_profile) for _ in range(count)]
+            return [future.exception() or future.result() for future in futures], mock_execute.call_count
+
+    def test_identical_queries_run_once(self):
+        def execute(*args, **kwargs):
+            time.sleep(0.5)
+            return [(1,)]
+
+        results, call_count = self._run_concurrently("select 1", execute)
+
+        self.assertEqual(results, [[(1,)]] * 5)
+        self.assertEqual(call_count, 1)
+
+    def test_results_are_only_published_when_waited_on(self):
+        redis_client = fakeredis.FakeStrictRedis()
+        with patch("ee.clickhouse.client.redis.get_client", return_value=redis_client), patch.object(
+            redis_client, "set", wraps=redis_client.set
+        ) as redis_set, query_profile("trends"):
+            self.assertEqual(sync_execute("select 1"), [(1,)])
+
+        # Only the lock was set
+        redis_set.assert_called_once()
+
+    def test_reads_outside_query_profiles_are_not_deduplicated(self):
+        redis_client = fakeredis.FakeStrictRedis()
+        with patch("ee.clickhouse.client.redis.get_client", return_value=redis_client), patch.object(
+            redis_client, "set", wraps=redis_client.set
+        ) as redis_set:
+            self.assertEqual(sync_execute("select 1"), [(1,)])
+
+        redis_set.assert_not_called()
+
+    def test_lock_is_held_until_the_query_is_killed(self):
+        redis_client = fakeredis.FakeStrictRedis()
+
+        def execute(*args, **kwargs):
+            lock_key = next(key for key in redis_client.keys() if key.startswith(b"clickhouse_single_flight/lock/"))
+            self.assertAlmostEqual(redis_client.ttl(lock_key), 180 + KILL_QUERY_GRACE_SECONDS, delta=1)
+            return [(1,)]
+
+        with patch("ee.clickhouse.client.redis.get_client", return_value=redis_client), patch(
+            "ee.clickhouse.client._sync_execute", side_effect=execute
+        ), query_profile("trends"):
+            self.assertEqual(sync_execute("select 1"), [(1,)])
+
+    def test_queries_run_on_their_own_when_leader_fails(self):
+        def execute(*args, **kwargs):
+            time.sleep(0.5)
+            raise ValueError("Query failed")
+
+        results, call_count = self._run_concurrently("select 1", execute)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(call_count, 5)
+
+    def test_writes_are_not_deduplicated(self):
+        _, call_count = self._run_concurrently("ALTER TABLE events DELETE WHERE 0", lambda *args, **kwargs: [], count=2)
+
+        self.assertEqual(call_count, 2)
@@ -0,0 +1,34 @@
+from unittest.mock import ANY, patch
+
+from django.test import TestCase
+
+from ee.clickhouse.client import execute_many, sync_execute
+from ee.clickhouse.instrumentation import get_instrumentation_context, instrumentation_context
+
+
+class TestInstrumentationContext(TestCase):
+    def test_queries_are_annotated(self):
+        with instrumentation_context("request", "api/insight/trend/ (trend)", team_id=2, user_id=3, insight="TRENDS"):
+            with patch("ee.clickhouse.client.timing") as timing:
+                query = sync_execute("SELECT query FROM system.processes WHERE query LIKE '%%insight:TRENDS%%'")[0][0]
+
+        self.assertTrue(query.startswith("/* request:api_insight_trend_ (trend) team:2 user:3 insight:TRENDS */"))
+        timing.assert_called_once_with(
+            "clickhouse_sync_execution_time",
+            ANY,
+            tags={"kind": "request", "id": "api/insight/trend/ (trend)", "team_id": 2, "insight": "TRENDS"},
+        )
+
+    def test_comment_cannot_be_closed_early(self):
+        with instrumentation_context("request", "route", insight="*/ DROP TABLE events /*") as context:
+            self.assertEqual(context.query_comment(), "/* request:route insight:__ DROP TABLE events __ */")
+
+    def test_totals_add_up_across_threads(self):
+        with instrumentation_context("celery", "some_task") as context:
+            sync_execute("SELECT number FROM numbers(10)")
+            execute_many([("SELECT number FROM numbers(100)", None), ("SELECT number FROM numbers(1000)", None)])
+
+        self.assertEqual(context.totals.queries, 3)
+        self.assertEqual(context.totals.rows_read, 1110)
+        self.assertGreater(context.totals.bytes_read, 0)
+        self.assertIsNone(get_instrumentation_context())
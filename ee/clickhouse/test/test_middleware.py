@@ -1,4 +1,7 @@
+import json
+
 from ee.api.test.base import APILicensedTest
+from ee.clickhouse.middleware import CLICKHOUSE_QUERY_TOTALS_HEADER
 from posthog.models import User
 
 
@@ -18,3 +21,18 @@ class TestQueryMiddleware(APILicensedTest):
 
         response = self.client.get("/api/debug_ch_queries/").json()
         self.assertIn("SELECT", response[0]["query"])  # type: ignore
+
+    def test_query_totals_header(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get('/api/insight/trend/?events=[{"id": "$pageview"}]&refresh=true')
+
+        totals = json.loads(response[CLICKHOUSE_QUERY_TOTALS_HEADER])
+        self.assertGreater(totals["queries"], 0)
+        self.assertGreaterEqual(totals["wall_time_ms"], 0)
+
+    def test_no_query_totals_header_for_users(self):
+        response = self.client.get('/api/insight/trend/?events=[{"id": "$pageview"}]&refresh=true')
+
+        self.assertNotIn(CLICKHOUSE_QUERY_TOTALS_HEADER, response)
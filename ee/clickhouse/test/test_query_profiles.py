@@ -0,0 +1,103 @@
+from unittest.mock import ANY, MagicMock, patch
+
+from django.test import TestCase, override_settings
+
+from ee.clickhouse.client import (
+    KILL_QUERY_GRACE_SECONDS,
+    _get_kill_query_timer,
+    _kill_query,
+    execute_many,
+    stream_execute,
+    sync_execute,
+)
+from ee.clickhouse.query_profiles import GiB, get_current_profile, get_query_settings, query_profile
+
+
+class TestQueryProfiles(TestCase):
+    def test_settings_of_profile(self):
+        self.assertEqual(get_query_settings(is_read=True), {})
+        self.assertEqual(get_query_settings({"max_threads": 8}, is_read=True), {"max_threads": 8})
+
+        with query_profile("exports"):
+            self.assertEqual(get_current_profile(), "exports")
+            self.assertEqual(
+                get_query_settings({"max_threads": 8}, is_read=True),
+                {"max_execution_time": 600, "max_threads": 8, "max_memory_usage": 5 * GiB},
+            )
+            # Writes only get the settings given explicitly
+            self.assertEqual(get_query_settings({"max_threads": 8}), {"max_threads": 8})
+
+        self.assertEqual(get_current_profile(), "default")
+
+    @override_settings(
+        CLICKHOUSE_QUERY_PROFILES={"default": {"max_bytes_to_read": 1000}, "persons": {"max_threads": 2}}
+    )
+    def test_settings_overrides(self):
+        with query_profile("persons"):
+            self.assertEqual(
+                get_query_settings(is_read=True),
+                {"max_execution_time": 120, "max_bytes_to_read": 1000, "max_memory_usage": 5 * GiB, "max_threads": 2},
+            )
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            with query_profile("nonexistent"):
+                pass
+
+    def test_queries_run_with_settings_of_profile(self):
+        query = "SELECT getSetting('max_execution_time'), getSetting('max_threads')"
+
+        with query_profile("exports"):
+            self.assertEqual(sync_execute(query), [(600, 4)])
+            # Including queries in other threads
+            self.assertEqual(execute_many([(query, None), (query, None)]), [[(600, 4)], [(600, 4)]])
+
+    def test_queries_are_killed_after_their_deadline(self):
+        kill_timer = MagicMock()
+        with patch("ee.clickhouse.client._get_kill_query_timer", return_value=kill_timer) as get_kill_query_timer:
+            with query_profile("trends"):
+                sync_execute("SELECT 1")
+
+        get_kill_query_timer.assert_called_once_with(180)
+        kill_timer.schedule.assert_called_once_with(_kill_query, ANY, ANY)
+        # The query finished in time
+        kill_timer.cancel.assert_called_once_with(kill_timer.schedule.return_value)
+
+    def test_queries_outside_profiles_run_without_deadline(self):
+        sync_execute("CREATE TABLE test_query_profiles (value UInt8) ENGINE = MergeTree() ORDER BY value")
+        try:
+            with patch("ee.clickhouse.client._get_kill_query_timer") as get_kill_query_timer:
+                self.assertEqual(sync_execute("SELECT getSetting('max_execution_time')"), [(0,)])
+                sync_execute("INSERT INTO test_query_profiles SELECT 1")
+                sync_execute("ALTER TABLE test_query_profiles DELETE WHERE value = 1")
+                with query_profile("trends"):
+                    # Even within a profile, only reads get its settings
+                    sync_execute("INSERT INTO test_query_profiles (value) VALUES", [(2,)])
+                    sync_execute("ALTER TABLE test_query_profiles DELETE WHERE value = 2")
+
+            get_kill_query_timer.assert_not_called()
+        finally:
+            sync_execute("DROP TABLE test_query_profiles")
+
+    def test_writes_get_no_profile_settings(self):
+        with patch("ee.clickhouse.client._sync_execute") as mock_sync_execute:
+            sync_execute("INSERT INTO events SELECT * FROM events LIMIT 0")
+            sync_execute("ALTER TABLE events DELETE WHERE 0")
+            with query_profile("trends"):
+                sync_execute("INSERT INTO events SELECT * FROM events LIMIT 0")
+
+        self.assertEqual(mock_sync_execute.call_count, 3)
+        for call in mock_sync_execute.call_args_list:
+            self.assertNotIn("max_execution_time", call[1]["settings"])
+
+    def test_kill_query_timer(self):
+        kill_timer = _get_kill_query_timer(180)
+
+        self.assertEqual(kill_timer.timeout_ms, (180 + KILL_QUERY_GRACE_SECONDS) * 1000)
+        self.assertIsNone(_get_kill_query_timer(None))
+        # Queries run with the timer
+        self.assertEqual(sync_execute("SELECT 1"), [(1,)])
+        self.assertEqual(list(stream_execute("SELECT 1")), [(1,)])
+
+    def test_kill_query(self):
+        _kill_query("nonexistent", {})
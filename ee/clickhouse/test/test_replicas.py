@@ -0,0 +1,107 @@
+from unittest.mock import MagicMock, patch
+
+from clickhouse_driver.errors import NetworkError, SocketTimeoutError
+from clickhouse_pool.pool import TooManyConnections
+from django.test import SimpleTestCase
+
+from ee.clickhouse.replicas import ReplicaPools
+
+
+def _pool(connect_error=None, pull_error=None):
+    pool = MagicMock()
+    client = MagicMock()
+    client.connection.connected = False
+    client.connection.connect.side_effect = connect_error
+    pool.pull.side_effect = pull_error
+    pool.pull.return_value = client
+    return pool
+
+
+class TestReplicaPools(SimpleTestCase):
+    def test_takes_turns_between_idle_replicas(self):
+        pools = {"a": _pool(), "b": _pool()}
+        replicas = ReplicaPools(pools, failure_cooldown=30)
+
+        used = []
+        for _ in range(4):
+            with replicas.get_client() as client:
+                used.append(next(host for host, pool in pools.items() if pool.pull.return_value is client))
+
+        self.assertEqual(sorted(used), ["a", "a", "b", "b"])
+
+    def test_prefers_least_busy_replica(self):
+        pools = {"a": _pool(), "b": _pool()}
+        replicas = ReplicaPools(pools, failure_cooldown=30)
+
+        with replicas.get_client() as first:
+            with replicas.get_client() as second:
+                self.assertIsNot(first, second)
+
+        self.assertEqual([replica.in_flight for replica in replicas.replicas], [0, 0])
+        pools["a"].push.assert_called_once_with(pools["a"].pull.return_value, close=False)
+        pools["b"].push.assert_called_once_with(pools["b"].pull.return_value, close=False)
+
+    def test_fails_over_replicas_that_cannot_be_connected_to(self):
+        pools = {"down": _pool(connect_error=NetworkError("Connection refused")), "up": _pool()}
+        replicas = ReplicaPools(pools, failure_cooldown=30)
+
+        for _ in range(3):
+            with replicas.get_client() as client:
+                self.assertIs(client, pools["up"].pull.return_value)
+
+        # Left out until its cooldown is over
+        self.assertEqual(pools["down"].pull.call_count, 1)
+        self.assertFalse(replicas.replicas[0].healthy)
+
+        with patch("time.monotonic", return_value=replicas.replicas[0].failed_until + 1):
+            self.assertTrue(replicas.replicas[0].healthy)
+
+    def test_skips_full_pools(self):
+        pools = {"full": _pool(pull_error=TooManyConnections()), "free": _pool()}
+        replicas = ReplicaPools(pools, failure_cooldown=30)
+
+        for _ in range(2):
+            with replicas.get_client() as client:
+                self.assertIs(client, pools["free"].pull.return_value)
+
+    def test_raises_when_no_replica_can_be_connected_to(self):
+        replicas = ReplicaPools({"down": _pool(connect_error=NetworkError("Connection refused"))}, failure_cooldown=30)
+
+        with self.assertRaises(NetworkError):
+            with replicas.get_client():
+                pass
+
+    def test_errors_reaching_a_replica_mid_query_mark_it_failed(self):
+        replicas = ReplicaPools({"a": _pool(), "b": _pool()}, failure_cooldown=30)
+
+        with self.assertRaises(NetworkError):
+            with replicas.get_client():
+                raise NetworkError("Connection reset")
+
+        self.assertEqual(sum(not replica.healthy for replica in replicas.replicas), 1)
+        failed = next(replica for replica in replicas.replicas if not replica.healthy)
+        failed.pool.push.assert_called_once_with(failed.pool.pull.return_value, close=True)
+
+    def test_runs_again_on_another_replica_when_one_fails_mid_query(self):
+        pools = {"a": _pool(), "b": _pool()}
+        replicas = ReplicaPools(pools, failure_cooldown=30)
+        clients = []
+
+        def execute(client):
+            clients.append(client)
+            if len(clients) == 1:
+                raise SocketTimeoutError("Timed out reading from socket")
+            return [(1,)]
+
+        self.assertEqual(replicas.run(execute), [(1,)])
+        self.assertEqual({id(client) for client in clients}, {id(pool.pull.return_value) for pool in pools.values()})
+        self.assertEqual(sum(not replica.healthy for replica in replicas.replicas), 1)
+
+    def test_does_not_run_again_without_another_healthy_replica(self):
+        replicas = ReplicaPools({"a": _pool()}, failure_cooldown=30)
+        execute = MagicMock(side_effect=NetworkError("Connection reset"))
+
+        with self.assertRaises(NetworkError):
+            replicas.run(execute)
+
+        self.assertEqual(execute.call_count, 1)
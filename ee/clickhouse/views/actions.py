@@ -11,6 +11,7 @@ from rest_framework_csv import renderers as csvrenderers
 from ee.clickhouse.client import sync_execute
 from ee.clickhouse.models.action import format_action_filter
 from ee.clickhouse.queries.trends.person import TrendsPersonQuery
+from ee.clickhouse.query_profiles import query_profile
 from ee.clickhouse.sql.person import INSERT_COHORT_ALL_PEOPLE_THROUGH_PERSON_ID, PERSON_STATIC_COHORT_TABLE
 from posthog.api.action import ActionSerializer, ActionViewSet
 from posthog.api.utils import get_target_entity
@@ -40,6 +41,7 @@ class ClickhouseActionsViewSet(ActionViewSet):
         return Response({"results": actions_list})
 
     @action(methods=["GET"], detail=False)
+    @query_profile("persons")
     def people(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         team = self.team
         filter = Filter(request=request)
@@ -1,20 +1,24 @@
 import json
 from datetime import timedelta
-from typing import Any, Dict, List, Optional, Union
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils.timezone import now
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from ee.clickhouse.client import sync_execute
+from ee.clickhouse.client import cache_sync_execute, stream_execute, sync_execute
 from ee.clickhouse.models.action import format_action_filter
 from ee.clickhouse.models.event import ClickhouseEventSerializer, determine_event_conditions
 from ee.clickhouse.models.person import get_persons_by_distinct_ids
 from ee.clickhouse.models.property import get_property_values_for_key, parse_prop_clauses
 from ee.clickhouse.queries.clickhouse_session_recording import SessionRecording
 from ee.clickhouse.queries.sessions.list import ClickhouseSessionsList
+from ee.clickhouse.query_profiles import query_profile
 from ee.clickhouse.sql.events import (
     GET_CUSTOM_EVENTS,
     SELECT_EVENT_BY_TEAM_AND_CONDITIONS_FILTERS_SQL,
@@ -22,6 +26,7 @@ from ee.clickhouse.sql.events import (
     SELECT_ONE_EVENT_SQL,
 )
 from posthog.api.event import EventViewSet
+from posthog.api.streaming import JSONLinesRenderer, streaming_export_response
 from posthog.models import Filter, Person, Team
 from posthog.models.action import Action
 from posthog.models.filters.sessions_filter import SessionEventsFilter, SessionsFilter
@@ -29,9 +34,13 @@ from posthog.models.session_recording_event import SessionRecordingViewed
 from posthog.models.utils import UUIDT
 from posthog.utils import convert_property_value, flatten
 
+# Exported events are serialized in chunks of this many, to look up their people together
+EXPORT_CHUNK_SIZE = 1000
+
 
 class ClickhouseEventsViewSet(EventViewSet):
 
+    renderer_classes = EventViewSet.renderer_classes + (JSONLinesRenderer,)
     serializer_class = ClickhouseEventSerializer  # type: ignore
 
     def _get_people(self, query_result: List[Dict], team: Team) -> Dict[str, Any]:
@@ -46,7 +55,14 @@ class ClickhouseEventsViewSet(EventViewSet):
     def _query_events_list(
         self, filter: Filter, team: Team, request: Request, long_date_from: bool = False, limit: int = 100
     ) -> List:
-        limit += 1
+        query = self._events_list_query(filter, team, request, long_date_from, limit + 1)
+        if query is None:
+            return []
+        return sync_execute(*query)
+
+    def _events_list_query(
+        self, filter: Filter, team: Team, request: Request, long_date_from: bool, limit: int
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
         limit_sql = "LIMIT %(limit)s"
         conditions, condition_params = determine_event_conditions(
             team,
@@ -63,42 +79,70 @@ class ClickhouseEventsViewSet(EventViewSet):
             try:
                 action = Action.objects.get(pk=request.GET["action_id"], team_id=team.pk)
             except Action.DoesNotExist:
-                return []
+                return None
             if action.steps.count() == 0:
-                return []
+                return None
             action_query, params = format_action_filter(action)
             prop_filters += " AND {}".format(action_query)
             prop_filter_params = {**prop_filter_params, **params}
 
         if prop_filters != "":
-            return sync_execute(
+            return (
                 SELECT_EVENT_BY_TEAM_AND_CONDITIONS_FILTERS_SQL.format(
                     conditions=conditions, limit=limit_sql, filters=prop_filters
                 ),
                 {"team_id": team.pk, "limit": limit, **condition_params, **prop_filter_params},
             )
         else:
-            return sync_execute(
+            return (
                 SELECT_EVENT_BY_TEAM_AND_CONDITIONS_SQL.format(conditions=conditions, limit=limit_sql),
                 {"team_id": team.pk, "limit": limit, **condition_params},
             )
 
+    def _export_events(self, filter: Filter, team: Team, request: Request, limit: int) -> StreamingHttpResponse:
+        # Unlike pages of events, exports aren't tried over the last day first, as they're read in a single query
+        query = self._events_list_query(filter, team, request, not request.GET.get("after"), limit)
+        with query_profile("exports"):
+            rows = stream_execute(*query) if query is not None else iter([])
+
+        def serialized_events() -> Iterator[Dict[str, Any]]:
+            while True:
+                chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+                if not chunk:
+                    return
+                serializer = ClickhouseEventSerializer(context={"people": self._get_people(chunk, team)})
+                for event in chunk:
+                    yield {
+                        "id": serializer.get_id(event),
+                        "distinct_id": serializer.get_distinct_id(event),
+                        "event": serializer.get_event(event),
+                        "timestamp": serializer.get_timestamp(event),
+                        "person": serializer.get_person(event),
+                        "properties": serializer.get_properties(event),
+                        "elements_chain": serializer.get_elements_chain(event),
+                    }
+
+        return streaming_export_response(serialized_events(), self.request.accepted_renderer.format, filename="events")
+
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        is_csv_request = self.request.accepted_renderer.format == "csv"
+        is_export_request = self.request.accepted_renderer.format in ("csv", "jsonl")
 
         if self.request.GET.get("limit", None):
             limit = int(self.request.GET.get("limit"))  # type: ignore
-        elif is_csv_request:
+        elif is_export_request:
             limit = self.CSV_EXPORT_DEFAULT_LIMIT
         else:
             limit = 100
 
-        if is_csv_request:
+        if is_export_request:
             limit = min(limit, self.CSV_EXPORT_MAXIMUM_LIMIT)
 
         team = self.team
         filter = Filter(request=request)
 
+        if is_export_request:
+            return self._export_events(filter, team, request, limit)
+
         query_result = self._query_events_list(filter, team, request, limit=limit)
 
         # Retry the query without the 1 day optimization
@@ -110,7 +154,7 @@ class ClickhouseEventsViewSet(EventViewSet):
         ).data
 
         next_url: Optional[str] = None
-        if not is_csv_request and len(query_result) > limit:
+        if len(query_result) > limit:
             path = request.get_full_path()
             reverse = request.GET.get("orderBy", "-timestamp") != "-timestamp"
             next_url = request.build_absolute_uri(
@@ -140,7 +184,9 @@ class ClickhouseEventsViewSet(EventViewSet):
         result = []
         flattened = []
         if key == "custom_event":
-            events = sync_execute(GET_CUSTOM_EVENTS, {"team_id": team.pk})
+            events = cache_sync_execute(
+                GET_CUSTOM_EVENTS, {"team_id": team.pk}, ttl=settings.CLICKHOUSE_VALUES_CACHE_TTL_SECONDS
+            )
             return Response([{"name": event[0]} for event in events])
         elif key:
             result = get_property_values_for_key(key, team, value=request.GET.get("value"))
@@ -17,7 +17,9 @@ from ee.clickhouse.queries.funnels import (
 )
 from ee.clickhouse.queries.sessions.clickhouse_sessions import ClickhouseSessions
 from ee.clickhouse.queries.trends.clickhouse_trends import ClickhouseTrends
+from ee.clickhouse.queries.trends.util import get_entity_sampling_factor
 from ee.clickhouse.queries.util import get_earliest_timestamp
+from ee.clickhouse.query_profiles import query_profile
 from posthog.api.insight import InsightViewSet
 from posthog.constants import (
     INSIGHT_FUNNELS,
@@ -39,21 +41,26 @@ from posthog.models.filters.stickiness_filter import StickinessFilter
 
 class ClickhouseInsightsViewSet(InsightViewSet):
     @cached_function
+    @query_profile("trends")
     def calculate_trends(self, request: Request) -> Dict[str, Any]:
         team = self.team
         filter = Filter(request=request)
 
+        response: Dict[str, Any] = {}
         if filter.insight == INSIGHT_STICKINESS or filter.shown_as == TRENDS_STICKINESS:
             stickiness_filter = StickinessFilter(
                 request=request, team=team, get_earliest_timestamp=get_earliest_timestamp
             )
-            result = ClickhouseStickiness().run(stickiness_filter, team)
+            response["result"] = ClickhouseStickiness().run(stickiness_filter, team)
         else:
             trends_query = ClickhouseTrends()
-            result = trends_query.run(filter, team)
+            response["result"] = trends_query.run(filter, team)
+            if any(get_entity_sampling_factor(filter, entity) for entity in filter.entities):
+                # The precise result is the one without `sampling_factor`
+                response.update({"is_approximate": True, "sampling_factor": filter.sampling_factor})
 
         self._refresh_dashboard(request=request)
-        return {"result": result}
+        return response
 
     @cached_function
     def calculate_session(self, request: Request) -> Dict[str, Any]:
@@ -64,6 +71,7 @@ class ClickhouseInsightsViewSet(InsightViewSet):
         }
 
     @cached_function
+    @query_profile("paths")
     def calculate_path(self, request: Request) -> Dict[str, Any]:
         team = self.team
         filter = PathFilter(request=request, data={"insight": INSIGHT_PATHS})
@@ -80,6 +88,7 @@ class ClickhouseInsightsViewSet(InsightViewSet):
         return Response(response)
 
     @cached_function
+    @query_profile("funnels")
     def calculate_funnel(self, request: Request) -> Dict[str, Any]:
         team = self.team
         filter = Filter(request=request, data={"insight": INSIGHT_FUNNELS})
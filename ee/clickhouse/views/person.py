@@ -12,6 +12,7 @@ from ee.clickhouse.queries.clickhouse_stickiness import ClickhouseStickiness
 from ee.clickhouse.queries.funnels import ClickhouseFunnelPersons, ClickhouseFunnelTrendsPersons
 from ee.clickhouse.queries.paths import ClickhousePathsPersons
 from ee.clickhouse.queries.trends.lifecycle import ClickhouseLifecycle
+from ee.clickhouse.query_profiles import query_profile
 from ee.clickhouse.sql.person import GET_PERSON_PROPERTIES_COUNT
 from posthog.api.person import PersonViewSet
 from posthog.api.utils import format_offset_absolute_url
@@ -50,6 +51,7 @@ class ClickhousePersonViewSet(PersonViewSet):
         )
 
     @cached_function
+    @query_profile("persons")
     def calculate_funnel_persons(self, request: Request) -> Dict[str, Tuple[list, Optional[str], Optional[str]]]:
         if request.user.is_anonymous or not request.user.team:
             return {"result": ([], None, None)}
@@ -96,6 +98,7 @@ class ClickhousePersonViewSet(PersonViewSet):
         )
 
     @cached_function
+    @query_profile("persons")
     def calculate_path_persons(self, request: Request) -> Dict[str, Tuple[list, Optional[str], Optional[str]]]:
         if request.user.is_anonymous or not request.user.team:
             return {"result": ([], None, None)}
@@ -0,0 +1,57 @@
+import json
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.test.client import Client
+from rest_framework import status
+
+from ee.clickhouse.util import ClickhouseTestMixin
+from ee.idl.gen import ingestion_event_pb2
+from ee.kafka_client.topics import KAFKA_EVENTS_PLUGIN_INGESTION
+from posthog.test.base import BaseTest
+
+
+class TestCaptureKafkaMessages(ClickhouseTestMixin, BaseTest):
+    CLASS_DATA_LEVEL_SETUP = False
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def _capture(self):
+        with patch("ee.kafka_client.client.TestKafkaProducer.send") as send:
+            response = self.client.post(
+                "/batch/",
+                data={
+                    "api_key": self.team.api_token,
+                    "sent_at": "2021-01-01T00:00:00Z",
+                    "batch": [{"event": "$pageview", "properties": {"distinct_id": "xxx", "name": "ü"}}],
+                },
+                content_type="application/json",
+                REMOTE_ADDR="1.2.3.4",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(send.call_count, 1)
+        topic, value = send.call_args[0]
+        self.assertEqual(topic, KAFKA_EVENTS_PLUGIN_INGESTION)
+        return value
+
+    def test_json_messages(self):
+        message = json.loads(self._capture())
+
+        self.assertEqual(message["distinct_id"], "xxx")
+        self.assertEqual(message["team_id"], self.team.pk)
+        self.assertEqual(message["ip"], "1.2.3.4")
+        self.assertEqual(json.loads(message["data"])["properties"]["name"], "ü")
+
+    @override_settings(KAFKA_EVENTS_PLUGIN_INGESTION_ENCODING="protobuf")
+    def test_protobuf_messages(self):
+        message = ingestion_event_pb2.IngestionEvent.FromString(self._capture())
+
+        self.assertEqual(message.version, 1)
+        self.assertEqual(message.distinct_id, "xxx")
+        self.assertEqual(message.team_id, self.team.pk)
+        self.assertEqual(message.ip, "1.2.3.4")
+        self.assertEqual(message.site_url, "http://testserver")
+        self.assertTrue(message.sent_at.startswith("2021-01-01T00:00:00"))
+        self.assertEqual(json.loads(message.data)["properties"]["name"], "ü")
@@ -1,3 +1,6 @@
+import csv
+import io
+import json
 from unittest.mock import patch
 from uuid import uuid4
 
@@ -44,3 +47,31 @@ class ClickhouseTestEventApi(
         patch_sync_execute.return_value = [("event", "d", "{}", timezone.now(), "d", "d", "d") for _ in range(0, 100)]
         response = self.client.get("/api/event/").json()
         self.assertEqual(patch_sync_execute.call_count, 3)
+
+    def test_events_jsonl_export(self):
+        person = _create_person(team=self.team, distinct_ids=["2"], properties={"email": "tim@posthog.com"})
+        for index in range(3):
+            _create_event(team=self.team, event="5th action", distinct_id="2", properties={"index": index})
+
+        response = self.client.get("/api/event.jsonl?event=5th%20action")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn('filename="events.jsonl"', response["Content-Disposition"])
+        events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(event["properties"]["index"] for event in events), [0, 1, 2])
+        self.assertEqual({event["person"]["distinct_ids"][0] for event in events}, {"2"})
+        self.assertEqual(events[0]["person"]["properties"], person.properties)
+
+    def test_events_csv_export_flattens_properties(self):
+        _create_person(team=self.team, distinct_ids=["2"], properties={"email": "tim@posthog.com"})
+        _create_event(team=self.team, event="5th action", distinct_id="2", properties={"$os": "Windows 95"})
+        _create_event(team=self.team, event="5th action", distinct_id="2", properties={"index": 1})
+
+        response = self.client.get("/api/event.csv?event=5th%20action")
+
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(sorted(row["properties.$os"] for row in rows), ["", "Windows 95"])
+        self.assertEqual(sorted(row["properties.index"] for row in rows), ["", "1"])
+        self.assertEqual({row["person.properties.email"] for row in rows}, {"tim@posthog.com"})
+        self.assertNotIn("properties", rows[0])
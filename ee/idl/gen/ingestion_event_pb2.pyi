@@ -0,0 +1,65 @@
+# @generated by generate_proto_mypy_stubs.py.  Do not edit!
+from typing import Optional as typing___Optional
+from typing import Text as typing___Text
+
+from google.protobuf.descriptor import Descriptor as google___protobuf___descriptor___Descriptor
+from google.protobuf.descriptor import FileDescriptor as google___protobuf___descriptor___FileDescriptor
+from google.protobuf.message import Message as google___protobuf___message___Message
+from typing_extensions import Literal as typing_extensions___Literal
+
+builtin___bool = bool
+builtin___bytes = bytes
+builtin___float = float
+builtin___int = int
+
+DESCRIPTOR: google___protobuf___descriptor___FileDescriptor = ...
+
+class IngestionEvent(google___protobuf___message___Message):
+    DESCRIPTOR: google___protobuf___descriptor___Descriptor = ...
+    version: builtin___int = ...
+    uuid: typing___Text = ...
+    distinct_id: typing___Text = ...
+    ip: typing___Text = ...
+    site_url: typing___Text = ...
+    team_id: builtin___int = ...
+    now: typing___Text = ...
+    sent_at: typing___Text = ...
+    data: builtin___bytes = ...
+    def __init__(
+        self,
+        *,
+        version: typing___Optional[builtin___int] = None,
+        uuid: typing___Optional[typing___Text] = None,
+        distinct_id: typing___Optional[typing___Text] = None,
+        ip: typing___Optional[typing___Text] = None,
+        site_url: typing___Optional[typing___Text] = None,
+        team_id: typing___Optional[builtin___int] = None,
+        now: typing___Optional[typing___Text] = None,
+        sent_at: typing___Optional[typing___Text] = None,
+        data: typing___Optional[builtin___bytes] = None,
+    ) -> None: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions___Literal[
+            "data",
+            b"data",
+            "distinct_id",
+            b"distinct_id",
+            "ip",
+            b"ip",
+            "now",
+            b"now",
+            "sent_at",
+            b"sent_at",
+            "site_url",
+            b"site_url",
+            "team_id",
+            b"team_id",
+            "uuid",
+            b"uuid",
+            "version",
+            b"version",
+        ],
+    ) -> None: ...
+
+type___IngestionEvent = IngestionEvent
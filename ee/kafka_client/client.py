@@ -1,16 +1,28 @@
 import io
 import json
-from typing import Any, Callable, Dict, Optional
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
 
 import kafka_helper
 from google.protobuf.internal.encoder import _VarintBytes  # type: ignore
 from google.protobuf.json_format import MessageToJson
 from kafka import KafkaProducer as KP
+from kafka.future import Future
+from sentry_sdk import capture_exception
+from statshog.defaults.django import statsd
 
 from ee.clickhouse.client import async_execute, sync_execute
 from ee.kafka_client import helper
 from ee.settings import KAFKA_ENABLED
-from posthog.settings import IS_HEROKU, KAFKA_BASE64_KEYS, KAFKA_HOSTS, TEST
+from posthog.settings import (
+    IS_HEROKU,
+    KAFKA_BASE64_KEYS,
+    KAFKA_HOSTS,
+    KAFKA_PRODUCER_BATCH_SIZE,
+    KAFKA_PRODUCER_COMPRESSION_TYPE,
+    KAFKA_PRODUCER_LINGER_MS,
+    TEST,
+)
 from posthog.utils import SingletonDecorator
 
 
@@ -19,33 +31,94 @@ class TestKafkaProducer:
         pass
 
     def send(self, topic: str, data: Any):
-        return
+        # Resolve immediately so that delivery callbacks behave the same as with a real broker
+        return Future().success(None)
 
     def flush(self):
         return
 
 
+def get_producer_config() -> Dict[str, Any]:
+    return {
+        "linger_ms": KAFKA_PRODUCER_LINGER_MS,
+        "batch_size": KAFKA_PRODUCER_BATCH_SIZE,
+        "compression_type": KAFKA_PRODUCER_COMPRESSION_TYPE,
+    }
+
+
 class _KafkaProducer:
     def __init__(self):
         if TEST:
             self.producer = TestKafkaProducer()
         elif IS_HEROKU:
-            self.producer = kafka_helper.get_kafka_producer(value_serializer=lambda d: d)
+            # :TRICKY: kafka_helper.get_kafka_producer takes no other producer config, so the producer is built from
+            # its brokers and SSL context instead, which read the KAFKA_* config vars Heroku provides
+            self.producer = KP(
+                bootstrap_servers=kafka_helper.get_kafka_brokers(),
+                security_protocol="SSL",
+                ssl_context=kafka_helper.get_kafka_ssl_context(),
+                value_serializer=lambda d: d,
+                acks="all",
+                **get_producer_config(),
+            )
         elif KAFKA_BASE64_KEYS:
-            self.producer = helper.get_kafka_producer(value_serializer=lambda d: d)
+            self.producer = helper.get_kafka_producer(value_serializer=lambda d: d, **get_producer_config())
         else:
-            self.producer = KP(bootstrap_servers=KAFKA_HOSTS)
+            self.producer = KP(bootstrap_servers=KAFKA_HOSTS, **get_producer_config())
+        self._pending_messages = 0
+        self._pending_messages_lock = threading.Lock()
+
+    @property
+    def pending_messages(self) -> int:
+        """Number of messages sent to the producer that Kafka hasn't acknowledged yet (nor failed to)."""
+        return self._pending_messages
 
     @staticmethod
     def json_serializer(d):
         b = json.dumps(d).encode("utf-8")
         return b
 
+    @staticmethod
+    def on_send_error(topic: str, error: Exception):
+        statsd.incr("posthog_cloud_kafka_send_failure", tags={"topic": topic})
+        capture_exception(error)
+
+    def _on_send_done(self, _result_or_error: Any):
+        with self._pending_messages_lock:
+            self._pending_messages -= 1
+
+    def _send(self, topic: str, b: bytes):
+        # Counted before handing the message over, so that load shedding never sees fewer than the producer holds
+        with self._pending_messages_lock:
+            self._pending_messages += 1
+        try:
+            future = self.producer.send(topic, b)
+        except Exception:
+            self._on_send_done(None)
+            raise
+        future.add_errback(self.on_send_error, topic)
+        future.add_both(self._on_send_done)
+
     def produce(self, topic: str, data: Any, value_serializer: Optional[Callable[[Any], Any]] = None):
         if not value_serializer:
             value_serializer = self.json_serializer
         b = value_serializer(data)
-        self.producer.send(topic, b)
+        self._send(topic, b)
+
+    def produce_many(
+        self, topic: str, data: Iterable[Any], value_serializer: Optional[Callable[[Any], Any]] = None
+    ) -> int:
+        """
+        Produces all messages of `data` to `topic` without waiting in between, so that the producer can batch
+        (and compress) them together according to the KAFKA_PRODUCER_* settings. Returns the number of messages sent.
+        """
+        if not value_serializer:
+            value_serializer = self.json_serializer
+        count = 0
+        for item in data:
+            self._send(topic, value_serializer(item))
+            count += 1
+        return count
 
     def close(self):
         self.producer.flush()
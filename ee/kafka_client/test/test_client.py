@@ -0,0 +1,138 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+from kafka.errors import KafkaTimeoutError
+from kafka.future import Future
+
+from ee.kafka_client.client import _KafkaProducer
+
+
+class FakeBroker:
+    """Stands in for kafka-python's KafkaProducer, resolving every send immediately."""
+
+    def __init__(self, fail_with: Optional[Exception] = None):
+        self.fail_with = fail_with
+        self.messages: List[Tuple[str, Any]] = []
+
+    def send(self, topic: str, data: Any):
+        self.messages.append((topic, data))
+        if self.fail_with:
+            return Future().failure(self.fail_with)
+        return Future().success(None)
+
+    def flush(self):
+        return
+
+
+def _producer(broker: FakeBroker) -> _KafkaProducer:
+    producer = _KafkaProducer()
+    producer.producer = broker
+    return producer
+
+
+def test_produce_many_sends_every_message():
+    broker = FakeBroker()
+
+    sent = _producer(broker).produce_many("some_topic", ({"index": i} for i in range(100)))
+
+    assert sent == 100
+    assert len(broker.messages) == 100
+    assert broker.messages[0] == ("some_topic", json.dumps({"index": 0}).encode("utf-8"))
+    assert broker.messages[99] == ("some_topic", json.dumps({"index": 99}).encode("utf-8"))
+
+
+def test_produce_many_with_custom_serializer():
+    broker = FakeBroker()
+
+    _producer(broker).produce_many("some_topic", ["a", "b"], value_serializer=lambda d: d.encode("utf-8"))
+
+    assert broker.messages == [("some_topic", b"a"), ("some_topic", b"b")]
+
+
+def test_delivery_failures_are_reported(mocker):
+    mock_incr = mocker.patch("ee.kafka_client.client.statsd.incr")
+    mock_capture_exception = mocker.patch("ee.kafka_client.client.capture_exception")
+    error = KafkaTimeoutError()
+
+    _producer(FakeBroker(fail_with=error)).produce_many("some_topic", [{}, {}])
+
+    mock_incr.assert_called_with("posthog_cloud_kafka_send_failure", tags={"topic": "some_topic"})
+    assert mock_incr.call_count == 2
+    mock_capture_exception.assert_called_with(error)
+
+
+def test_pending_messages_are_counted_until_acknowledged():
+    futures: List[Future] = []
+
+    class SlowBroker(FakeBroker):
+        def send(self, topic: str, data: Any):
+            futures.append(Future())
+            return futures[-1]
+
+    producer = _producer(SlowBroker())
+    producer.produce_many("some_topic", [{}, {}, {}])
+    assert producer.pending_messages == 3
+
+    futures[0].success(None)
+    futures[1].failure(KafkaTimeoutError())
+    assert producer.pending_messages == 1
+
+
+def test_pending_messages_are_counted_when_send_resolves_or_fails_immediately():
+    producer = _producer(FakeBroker())
+    producer.produce_many("some_topic", [{}, {}])
+    assert producer.pending_messages == 0
+
+    class BrokenBroker(FakeBroker):
+        def send(self, topic: str, data: Any):
+            pending_during_send.append(producer.pending_messages)
+            raise KafkaTimeoutError()
+
+    pending_during_send: List[int] = []
+    producer = _producer(BrokenBroker())
+    try:
+        producer.produce("some_topic", {})
+    except KafkaTimeoutError:
+        pass
+    assert pending_during_send == [1]
+    assert producer.pending_messages == 0
+
+
+def test_producer_config_is_passed_to_kafka(mocker):
+    mocker.patch("ee.kafka_client.client.TEST", False)
+    mocker.patch("ee.kafka_client.client.IS_HEROKU", False)
+    mocker.patch("ee.kafka_client.client.KAFKA_BASE64_KEYS", False)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_LINGER_MS", 50)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_BATCH_SIZE", 1_000_000)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_COMPRESSION_TYPE", "lz4")
+    mock_kafka_producer = mocker.patch("ee.kafka_client.client.KP")
+
+    _KafkaProducer()
+
+    mock_kafka_producer.assert_called_once_with(
+        bootstrap_servers=mocker.ANY, linger_ms=50, batch_size=1_000_000, compression_type="lz4"
+    )
+
+
+def test_producer_config_is_passed_to_kafka_on_heroku(mocker):
+    mocker.patch("ee.kafka_client.client.TEST", False)
+    mocker.patch("ee.kafka_client.client.IS_HEROKU", True)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_LINGER_MS", 50)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_BATCH_SIZE", 1_000_000)
+    mocker.patch("ee.kafka_client.client.KAFKA_PRODUCER_COMPRESSION_TYPE", "lz4")
+    mocker.patch("ee.kafka_client.client.kafka_helper.get_kafka_brokers", return_value=["kafka:9096"])
+    ssl_context = mocker.patch("ee.kafka_client.client.kafka_helper.get_kafka_ssl_context").return_value
+    mock_kafka_producer = mocker.patch("ee.kafka_client.client.KP")
+
+    _KafkaProducer()
+
+    mock_kafka_producer.assert_called_once_with(
+        bootstrap_servers=["kafka:9096"],
+        security_protocol="SSL",
+        ssl_context=ssl_context,
+        value_serializer=mocker.ANY,
+        acks="all",
+        linger_ms=50,
+        batch_size=1_000_000,
+        compression_type="lz4",
+    )
@@ -3,7 +3,15 @@ import logging
 from django.core.management.base import BaseCommand
 
 from ee.clickhouse.materialized_columns import materialize
-from ee.clickhouse.materialized_columns.analyze import logger, materialize_properties_task
+from ee.clickhouse.materialized_columns.analyze import (
+    analyze,
+    format_report,
+    get_queries,
+    logger,
+    materialize_properties_task,
+    worth_materializing,
+)
+from ee.clickhouse.materialized_columns.columns import SKIP_INDEX_DEFINITIONS
 from posthog.settings import (
     MATERIALIZE_COLUMNS_ANALYSIS_PERIOD_HOURS,
     MATERIALIZE_COLUMNS_BACKFILL_PERIOD_DAYS,
@@ -22,6 +30,11 @@ class Command(BaseCommand):
         parser.add_argument(
             "--property-table", type=str, default="events", choices=["events", "person"], help="Table of --property"
         )
+        parser.add_argument(
+            "--index-type",
+            choices=list(SKIP_INDEX_DEFINITIONS.keys()),
+            help="Data skipping index to add to the materialized columns. By default none is added.",
+        )
         parser.add_argument(
             "--backfill-period",
             type=int,
@@ -61,12 +74,18 @@ class Command(BaseCommand):
                 columns_to_materialize=[(options["property_table"], options["property"], 0)],
                 backfill_period_days=options["backfill_period"],
                 dry_run=options["dry_run"],
+                index_type=options["index_type"],
             )
         else:
+            costs = analyze(
+                get_queries(options["analyze_period"], options["min_query_time"]), options["analyze_period"]
+            )
+            self.stdout.write(format_report(costs))
+
             materialize_properties_task(
-                time_to_analyze_hours=options["analyze_period"],
+                columns_to_materialize=worth_materializing(costs),
                 maximum=options["max_columns"],
-                min_query_time=options["min_query_time"],
                 backfill_period_days=options["backfill_period"],
                 dry_run=options["dry_run"],
+                index_type=options["index_type"],
             )
@@ -82,3 +82,9 @@ MATERIALIZE_COLUMNS_ANALYSIS_PERIOD_HOURS = get_from_env(
 MATERIALIZE_COLUMNS_BACKFILL_PERIOD_DAYS = get_from_env("MATERIALIZE_COLUMNS_BACKFILL_PERIOD_DAYS", 90, type_cast=int)
 # Maximum number of columns to materialize at once. Avoids running into resource bottlenecks (storage + ingest + backfilling).
 MATERIALIZE_COLUMNS_MAX_AT_ONCE = get_from_env("MATERIALIZE_COLUMNS_MAX_AT_ONCE", 10, type_cast=int)
+# How often each process checks whether materialized columns have changed, by reading a version number from redis
+MATERIALIZED_COLUMNS_CACHE_CHECK_INTERVAL_SECONDS = get_from_env(
+    "MATERIALIZED_COLUMNS_CACHE_CHECK_INTERVAL_SECONDS", 5, type_cast=int
+)
+# How long materialized columns are cached for at most. Picks up columns changed by migrations or by hand
+MATERIALIZED_COLUMNS_CACHE_TTL_SECONDS = get_from_env("MATERIALIZED_COLUMNS_CACHE_TTL_SECONDS", 15 * 60, type_cast=int)
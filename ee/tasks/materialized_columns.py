@@ -1,7 +1,7 @@
 from celery.utils.log import get_task_logger
 
 from ee.clickhouse.client import sync_execute
-from ee.clickhouse.materialized_columns.columns import TRIM_AND_EXTRACT_PROPERTY, ColumnName, get_materialized_columns
+from ee.clickhouse.materialized_columns.columns import ColumnName, materialized_column_definitions
 from posthog.settings import CLICKHOUSE_CLUSTER, CLICKHOUSE_DATABASE, CLICKHOUSE_REPLICATION
 
 logger = get_task_logger(__name__)
@@ -12,7 +12,13 @@ def mark_all_materialized() -> None:
         logger.info("There are running mutations, skipping marking as materialized")
         return
 
-    for table, property_name, column_name in get_materialized_columns_with_default_expression():
+    for (
+        table,
+        property_name,
+        column_name,
+        column_type,
+        expression,
+    ) in get_materialized_columns_with_default_expression():
         updated_table = "sharded_events" if CLICKHOUSE_REPLICATION and table == "events" else table
 
         # :TRICKY: On cloud, we ON CLUSTER updates to events/sharded_events but not to persons. Why? ¯\_(ツ)_/¯
@@ -23,7 +29,7 @@ def mark_all_materialized() -> None:
             ALTER TABLE {updated_table}
             {execute_on_cluster}
             MODIFY COLUMN
-            {column_name} VARCHAR MATERIALIZED {TRIM_AND_EXTRACT_PROPERTY}
+            {column_name} {column_type} MATERIALIZED {expression}
             """,
             {"property": property_name},
         )
@@ -31,10 +37,9 @@ def mark_all_materialized() -> None:
 
 def get_materialized_columns_with_default_expression():
     for table in ["events", "person"]:
-        materialized_columns = get_materialized_columns(table, use_cache=False)
-        for property_name, column_name in materialized_columns.items():
+        for property_name, column_name, column_type, expression in materialized_column_definitions(table):
             if is_default_expression(table, column_name):
-                yield table, property_name, column_name
+                yield table, property_name, column_name, column_type, expression
 
 
 def any_ongoing_mutations() -> bool:
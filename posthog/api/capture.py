@@ -1,11 +1,25 @@
+import asyncio
 import json
+import math
 import re
 from datetime import datetime
-from typing import Any, Dict, Optional
-
+from functools import wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from asgiref.sync import sync_to_async
 from dateutil import parser
 from django.conf import settings
-from django.http import JsonResponse
+from django.db import close_old_connections
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
@@ -16,17 +30,29 @@ from posthog.api.utils import get_token
 from posthog.celery import app as celery_app
 from posthog.constants import ENVIRONMENT_TEST
 from posthog.exceptions import RequestParsingError, generate_exception_response
-from posthog.helpers.session_recording import preprocess_session_recording_events
+from posthog.helpers.session_recording import (
+    compress_and_chunk_snapshots,
+    compress_and_chunk_snapshots_in_background,
+    group_session_recording_events,
+)
 from posthog.models import Team, User
-from posthog.models.feature_flag import get_active_feature_flags
+from posthog.models.feature_flag import get_cached_active_feature_flags_for_distinct_ids
 from posthog.models.utils import UUIDT
+from posthog.rate_limiting import (
+    acquire_in_flight_request,
+    get_capture_rate_limit_retry_after,
+    release_in_flight_request,
+)
 from posthog.utils import cors_response, get_ip_address, is_clickhouse_enabled, load_data_from_request
 
 if is_clickhouse_enabled():
+    from ee.idl.gen import ingestion_event_pb2
     from ee.kafka_client.client import KafkaProducer
     from ee.kafka_client.topics import KAFKA_EVENTS_PLUGIN_INGESTION
 
-    def log_event(
+    INGESTION_EVENT_VERSION = 1
+
+    def _kafka_message(
         distinct_id: str,
         ip: Optional[str],
         site_url: str,
@@ -35,12 +61,8 @@ if is_clickhouse_enabled():
         now: datetime,
         sent_at: Optional[datetime],
         event_uuid: UUIDT,
-        *,
-        topic: str = KAFKA_EVENTS_PLUGIN_INGESTION,
-    ) -> None:
-        if settings.DEBUG:
-            print(f'Logging event {data["event"]} to Kafka topic {topic}')
-        data = {
+    ) -> Dict[str, Any]:
+        return {
             "uuid": str(event_uuid),
             "distinct_id": distinct_id,
             "ip": ip,
@@ -50,7 +72,82 @@ if is_clickhouse_enabled():
             "now": now.isoformat(),
             "sent_at": sent_at.isoformat() if sent_at else "",
         }
-        KafkaProducer().produce(topic=topic, data=data)
+
+    def _ingestion_event(
+        distinct_id: str,
+        ip: Optional[str],
+        site_url: str,
+        data: dict,
+        team_id: int,
+        now: datetime,
+        sent_at: Optional[datetime],
+        event_uuid: UUIDT,
+    ) -> ingestion_event_pb2.IngestionEvent:
+        """Like `_kafka_message`, but with the event data serialized only once."""
+        return ingestion_event_pb2.IngestionEvent(
+            version=INGESTION_EVENT_VERSION,
+            uuid=str(event_uuid),
+            distinct_id=distinct_id,
+            ip=ip or "",
+            site_url=site_url,
+            team_id=team_id,
+            now=now.isoformat(),
+            sent_at=sent_at.isoformat() if sent_at else "",
+            data=json.dumps(data).encode("utf-8"),
+        )
+
+    def _serialize_proto(message: Any) -> bytes:
+        return message.SerializeToString()
+
+    def _kafka_message_encoding() -> Tuple[Callable[..., Any], Optional[Callable[[Any], bytes]]]:
+        """Returns how to build and serialize ingestion messages according to KAFKA_EVENTS_PLUGIN_INGESTION_ENCODING."""
+        if settings.KAFKA_EVENTS_PLUGIN_INGESTION_ENCODING == "protobuf":
+            return _ingestion_event, _serialize_proto
+        return _kafka_message, None
+
+    def log_event(
+        distinct_id: str,
+        ip: Optional[str],
+        site_url: str,
+        data: dict,
+        team_id: int,
+        now: datetime,
+        sent_at: Optional[datetime],
+        event_uuid: UUIDT,
+        *,
+        topic: str = KAFKA_EVENTS_PLUGIN_INGESTION,
+    ) -> None:
+        if settings.DEBUG:
+            print(f'Logging event {data["event"]} to Kafka topic {topic}')
+        build_message, value_serializer = _kafka_message_encoding()
+        KafkaProducer().produce(
+            topic=topic,
+            data=build_message(distinct_id, ip, site_url, data, team_id, now, sent_at, event_uuid),
+            value_serializer=value_serializer,
+        )
+
+    def log_events(
+        events: Iterable[Tuple[Dict[str, Any], str]],
+        ip: Optional[str],
+        site_url: str,
+        team_id: int,
+        now: datetime,
+        sent_at: Optional[datetime],
+        *,
+        topic: str = KAFKA_EVENTS_PLUGIN_INGESTION,
+    ) -> None:
+        """Bulk variant of `log_event` for batch requests. Takes (event, distinct_id) pairs."""
+        if settings.DEBUG:
+            print(f"Logging batch of events to Kafka topic {topic}")
+        build_message, value_serializer = _kafka_message_encoding()
+        KafkaProducer().produce_many(
+            topic=topic,
+            data=(
+                build_message(distinct_id, ip, site_url, event, team_id, now, sent_at, UUIDT())
+                for event, distinct_id in events
+            ),
+            value_serializer=value_serializer,
+        )
 
 
 def _datetime_from_seconds_or_millis(timestamp: str) -> datetime:
@@ -104,19 +201,18 @@ def _get_distinct_id(data: Dict[str, Any]) -> str:
     return str(raw_value)[0:200]
 
 
-def _ensure_web_feature_flags_in_properties(event: Dict[str, Any], team: Team, distinct_id: str):
-    """If the event comes from web, ensure that it contains property $active_feature_flags."""
-    if event["properties"].get("$lib") == "web" and "$active_feature_flags" not in event["properties"]:
-        flags = get_active_feature_flags(team, distinct_id)
-        event["properties"]["$active_feature_flags"] = list(flags.keys())
-        for k, v in flags.items():
-            event["properties"][f"$feature/{k}"] = v
+def _lacks_web_feature_flags(event: Dict[str, Any]) -> bool:
+    return event["properties"].get("$lib") == "web" and "$active_feature_flags" not in event["properties"]
 
 
-@csrf_exempt
-def get_event(request):
-    timer = statsd.timer("posthog_cloud_event_endpoint").start()
-    now = timezone.now()
+def _add_feature_flags_to_properties(event: Dict[str, Any], flags: Dict[str, Any]) -> None:
+    event["properties"]["$active_feature_flags"] = list(flags.keys())
+    for k, v in flags.items():
+        event["properties"][f"$feature/{k}"] = v
+
+
+def _parse_request(request: HttpRequest) -> Union[HttpResponse, Tuple[Any, Optional[datetime], str, bool]]:
+    """Returns the request's payload, sent_at, token and whether it's a test environment – or an error response."""
     try:
         data = load_data_from_request(request)
     except RequestParsingError as error:
@@ -150,43 +246,58 @@ def get_event(request):
             ),
         )
 
-    team = Team.objects.get_team_from_token(token)
+    return data, sent_at, token, is_test_environment
 
-    if team is None:
-        try:
-            project_id = _get_project_id(data, request)
-        except ValueError:
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture", "Invalid Project ID.", code="invalid_project", attr="project_id"
-                ),
-            )
-        if not project_id:
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture",
-                    "Project API key invalid. You can find your project API key in PostHog project settings.",
-                    type="authentication_error",
-                    code="invalid_api_key",
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                ),
-            )
-        user = User.objects.get_from_personal_api_key(token)
-        if user is None:
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture",
-                    "Invalid Personal API key.",
-                    type="authentication_error",
-                    code="invalid_personal_api_key",
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                ),
-            )
-        team = user.teams.get(id=project_id)
 
+def _get_team_from_personal_api_key(request: HttpRequest, data: Any, token: str) -> Union[HttpResponse, Team]:
+    try:
+        project_id = _get_project_id(data, request)
+    except ValueError:
+        return cors_response(
+            request,
+            generate_exception_response("capture", "Invalid Project ID.", code="invalid_project", attr="project_id"),
+        )
+    if not project_id:
+        return cors_response(
+            request,
+            generate_exception_response(
+                "capture",
+                "Project API key invalid. You can find your project API key in PostHog project settings.",
+                type="authentication_error",
+                code="invalid_api_key",
+                status_code=status.HTTP_401_UNAUTHORIZED,
+            ),
+        )
+    user = User.objects.get_from_personal_api_key(token)
+    if user is None:
+        return cors_response(
+            request,
+            generate_exception_response(
+                "capture",
+                "Invalid Personal API key.",
+                type="authentication_error",
+                code="invalid_personal_api_key",
+                status_code=status.HTTP_401_UNAUTHORIZED,
+            ),
+        )
+    return user.teams.get(id=project_id)
+
+
+def _get_team(request: HttpRequest, data: Any, token: str) -> Union[HttpResponse, Team]:
+    team = Team.objects.get_team_from_cache_or_token(token)
+    if team is None:
+        return _get_team_from_personal_api_key(request, data, token)
+    return team
+
+
+def _prepare_events(
+    request: HttpRequest, data: Any, is_test_environment: bool
+) -> Union[HttpResponse, Tuple[List[Tuple[Dict[str, Any], str]], List[Tuple[List[Dict[str, Any]], str]]]]:
+    """
+    Validates the events of the payload – or returns an error response.
+    Returns (event, distinct_id) pairs and, separately, the uncompressed snapshots of each session recording along with
+    the distinct_id of the first one, which the recording's chunks will be captured with.
+    """
     if isinstance(data, dict):
         if data.get("batch"):  # posthog-python and posthog-ruby
             data = data["batch"]
@@ -200,58 +311,167 @@ def get_event(request):
         events = [data]
 
     try:
-        events = preprocess_session_recording_events(events)
+        events, snapshots_by_session = group_session_recording_events(events)
     except ValueError as e:
         return cors_response(
             request, generate_exception_response("capture", f"Invalid payload: {e}", code="invalid_payload")
         )
 
+    events_to_capture: List[Tuple[Dict[str, Any], str]] = []
     for event in events:
+        distinct_id = _validate_event(request, event, is_test_environment)
+        if isinstance(distinct_id, HttpResponse):
+            return distinct_id
+        events_to_capture.append((event, distinct_id))
+
+    session_recordings: List[Tuple[List[Dict[str, Any]], str]] = []
+    for snapshots in snapshots_by_session:
+        # Chunks copy the properties of the session's first snapshot
+        distinct_id = _validate_event(request, snapshots[0], is_test_environment)
+        if isinstance(distinct_id, HttpResponse):
+            return distinct_id
+        session_recordings.append((snapshots, distinct_id))
+
+    return events_to_capture, session_recordings
+
+
+def _validate_event(request: HttpRequest, event: Dict[str, Any], is_test_environment: bool) -> Union[HttpResponse, str]:
+    """Returns the event's distinct_id – or an error response."""
+    try:
+        distinct_id = _get_distinct_id(event)
+    except KeyError:
+        return cors_response(
+            request,
+            generate_exception_response(
+                "capture", "You need to set user distinct ID field `distinct_id`.", code="required", attr="distinct_id",
+            ),
+        )
+    except ValueError:
+        return cors_response(
+            request,
+            generate_exception_response(
+                "capture",
+                "Distinct ID field `distinct_id` must have a non-empty value.",
+                code="required",
+                attr="distinct_id",
+            ),
+        )
+    if not event.get("event"):
+        return cors_response(
+            request,
+            generate_exception_response(
+                "capture", "You need to set user event name, field `event`.", code="required", attr="event"
+            ),
+        )
+
+    if not event.get("properties"):
+        event["properties"] = {}
+
+    # Support test_[apiKey] for users with multiple environments
+    if event["properties"].get("$environment") is None and is_test_environment:
+        event["properties"]["$environment"] = ENVIRONMENT_TEST
+
+    return distinct_id
+
+
+def _ensure_web_feature_flags(events: List[Tuple[Dict[str, Any], str]], team: Team) -> None:
+    """Ensure that events coming from web contain property $active_feature_flags, evaluating flags once per distinct_id."""
+    events_lacking_flags = [(event, distinct_id) for event, distinct_id in events if _lacks_web_feature_flags(event)]
+    if not events_lacking_flags:
+        return
+    flags_by_distinct_id = get_cached_active_feature_flags_for_distinct_ids(
+        team, (distinct_id for _, distinct_id in events_lacking_flags)
+    )
+    for event, distinct_id in events_lacking_flags:
+        _add_feature_flags_to_properties(event, flags_by_distinct_id[distinct_id])
+
+
+def _needs_web_feature_flags(events: List[Tuple[Dict[str, Any], str]]) -> bool:
+    return any(_lacks_web_feature_flags(event) for event, _ in events)
+
+
+def _with_first_snapshots(
+    events: List[Tuple[Dict[str, Any], str]], session_recordings: List[Tuple[List[Dict[str, Any]], str]]
+) -> List[Tuple[Dict[str, Any], str]]:
+    """Adds the first snapshot of each recording, whose properties its chunks get, to the events to enrich."""
+    return events + [(snapshots[0], distinct_id) for snapshots, distinct_id in session_recordings]
+
+
+def _too_many_requests_response(request: HttpRequest, detail: str, retry_after: float) -> HttpResponse:
+    response = cors_response(
+        request,
+        generate_exception_response(
+            "capture", detail, code="throttled", type="throttled_error", status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        ),
+    )
+    response["Retry-After"] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def _rate_limited_response(
+    request: HttpRequest,
+    team: Team,
+    events: List[Tuple[Dict[str, Any], str]],
+    session_recordings: List[Tuple[List[Dict[str, Any]], str]],
+) -> Optional[HttpResponse]:
+    """Returns a 429 response if the team is over its CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND."""
+    event_count = len(events) + sum(len(snapshots) for snapshots, _ in session_recordings)
+    retry_after = get_capture_rate_limit_retry_after(team.pk, event_count)
+    if retry_after is None:
+        return None
+    statsd.incr("posthog_cloud_capture_rate_limited_events", event_count, tags={"team_id": team.pk})
+    return _too_many_requests_response(request, "This project is sending too many events.", retry_after)
+
+
+def _load_shedding_response(request: HttpRequest) -> Optional[HttpResponse]:
+    """Counts the request as in flight – or returns a 429 response if this process is overloaded."""
+    reason = None
+    if (
+        settings.CAPTURE_MAX_PENDING_KAFKA_MESSAGES > 0
+        and is_clickhouse_enabled()
+        and KafkaProducer().pending_messages >= settings.CAPTURE_MAX_PENDING_KAFKA_MESSAGES
+    ):
+        reason = "pending_kafka_messages"
+    elif not acquire_in_flight_request():
+        reason = "in_flight_requests"
+    if reason is None:
+        return None
+    statsd.incr("posthog_cloud_capture_shed_requests", tags={"reason": reason})
+    return _too_many_requests_response(
+        request, "Too many events are being ingested.", settings.CAPTURE_LOAD_SHEDDING_RETRY_AFTER_SECONDS
+    )
+
+
+def _with_load_shedding(view):
+    """Sheds requests beyond CAPTURE_MAX_IN_FLIGHT_REQUESTS in progress or CAPTURE_MAX_PENDING_KAFKA_MESSAGES."""
+    if asyncio.iscoroutinefunction(view):
+
+        @wraps(view)
+        async def _async_view(request):
+            response = _load_shedding_response(request)
+            if response is not None:
+                return response
+            try:
+                return await view(request)
+            finally:
+                release_in_flight_request()
+
+        return _async_view
+
+    @wraps(view)
+    def _view(request):
+        response = _load_shedding_response(request)
+        if response is not None:
+            return response
         try:
-            distinct_id = _get_distinct_id(event)
-        except KeyError:
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture",
-                    "You need to set user distinct ID field `distinct_id`.",
-                    code="required",
-                    attr="distinct_id",
-                ),
-            )
-        except ValueError:
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture",
-                    "Distinct ID field `distinct_id` must have a non-empty value.",
-                    code="required",
-                    attr="distinct_id",
-                ),
-            )
-        if not event.get("event"):
-            return cors_response(
-                request,
-                generate_exception_response(
-                    "capture", "You need to set user event name, field `event`.", code="required", attr="event"
-                ),
-            )
-
-        site_url = request.build_absolute_uri("/")[:-1]
-        ip = None if team.anonymize_ips else get_ip_address(request)
-
-        if not event.get("properties"):
-            event["properties"] = {}
-
-        # Support test_[apiKey] for users with multiple environments
-        if event["properties"].get("$environment") is None and is_test_environment:
-            event["properties"]["$environment"] = ENVIRONMENT_TEST
-
-        _ensure_web_feature_flags_in_properties(event, team, distinct_id)
-
-        statsd.incr("posthog_cloud_plugin_server_ingestion")
-        capture_internal(event, distinct_id, ip, site_url, now, sent_at, team.pk)
+            return view(request)
+        finally:
+            release_in_flight_request()
+
+    return _view
+
 
+def _success_response(request: HttpRequest, timer) -> HttpResponse:
     timer.stop()
     statsd.incr(
         f"posthog_cloud_raw_endpoint_success", tags={"endpoint": "capture",},
@@ -259,6 +479,107 @@ def get_event(request):
     return cors_response(request, JsonResponse({"status": 1}))
 
 
+@csrf_exempt
+@_with_load_shedding
+def get_event(request):
+    timer = statsd.timer("posthog_cloud_event_endpoint").start()
+    now = timezone.now()
+
+    parsed = _parse_request(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    data, sent_at, token, is_test_environment = parsed
+
+    team = _get_team(request, data, token)
+    if isinstance(team, HttpResponse):
+        return team
+
+    prepared = _prepare_events(request, data, is_test_environment)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    events, session_recordings = prepared
+
+    rate_limited = _rate_limited_response(request, team, events, session_recordings)
+    if rate_limited is not None:
+        return rate_limited
+
+    _ensure_web_feature_flags(_with_first_snapshots(events, session_recordings), team)
+
+    site_url = request.build_absolute_uri("/")[:-1]
+    ip = None if team.anonymize_ips else get_ip_address(request)
+    statsd.incr("posthog_cloud_plugin_server_ingestion", len(events))
+    capture_internal_batch(events, ip, site_url, now, sent_at, team.pk)
+    capture_session_recordings(session_recordings, ip, site_url, now, sent_at, team.pk)
+
+    return _success_response(request, timer)
+
+
+def _in_thread_pool(func):
+    """
+    Runs blocking `func` in a thread pool, without serializing calls in the main thread like `sync_to_async` does by
+    default. Django keeps database connections per thread, so stale ones are closed before each call.
+    """
+
+    def _run(*args, **kwargs):
+        close_old_connections()
+        return func(*args, **kwargs)
+
+    return sync_to_async(_run, thread_sensitive=False)
+
+
+@_with_load_shedding
+async def get_event_async(request):
+    """
+    Async variant of `get_event`, used under ASGI (see posthog/asgi.py) if CAPTURE_ASYNC is enabled.
+    Parsing and validation happen on the event loop, only Postgres lookups (skipped for cached teams), rate limiting,
+    feature flag evaluation and Celery task sending block a thread. Producing to Kafka only enqueues the messages to
+    the producer.
+    """
+    timer = statsd.timer("posthog_cloud_event_endpoint").start()
+    now = timezone.now()
+
+    parsed = _parse_request(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    data, sent_at, token, is_test_environment = parsed
+
+    _, cached_team = Team.objects.get_team_from_cache(token)
+    team = cached_team if cached_team is not None else await _in_thread_pool(_get_team)(request, data, token)
+    if isinstance(team, HttpResponse):
+        return team
+
+    prepared = _prepare_events(request, data, is_test_environment)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    events, session_recordings = prepared
+
+    if settings.CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND > 0:
+        # Syncing the team's bucket is a blocking Redis transaction
+        rate_limited = await _in_thread_pool(_rate_limited_response)(request, team, events, session_recordings)
+        if rate_limited is not None:
+            return rate_limited
+
+    events_to_enrich = _with_first_snapshots(events, session_recordings)
+    if _needs_web_feature_flags(events_to_enrich):
+        await _in_thread_pool(_ensure_web_feature_flags)(events_to_enrich, team)
+
+    site_url = request.build_absolute_uri("/")[:-1]
+    ip = None if team.anonymize_ips else get_ip_address(request)
+    statsd.incr("posthog_cloud_plugin_server_ingestion", len(events))
+    if is_clickhouse_enabled():
+        capture_internal_batch(events, ip, site_url, now, sent_at, team.pk)
+    else:
+        await _in_thread_pool(capture_internal_batch)(events, ip, site_url, now, sent_at, team.pk)
+    if session_recordings:
+        await _in_thread_pool(capture_session_recordings)(session_recordings, ip, site_url, now, sent_at, team.pk)
+
+    return _success_response(request, timer)
+
+
+# Not using @csrf_exempt, as up to Django 4.x its wrapper hides that the view is a coroutine function
+get_event_async.csrf_exempt = True  # type: ignore
+
+
 def capture_internal(event, distinct_id, ip, site_url, now, sent_at, team_id):
     event_uuid = UUIDT()
 
@@ -281,3 +602,30 @@ def capture_internal(event, distinct_id, ip, site_url, now, sent_at, team_id):
             queue=celery_queue,
             args=[distinct_id, ip, site_url, event, team_id, now.isoformat(), sent_at,],
         )
+
+
+def capture_internal_batch(events: List[Tuple[Dict[str, Any], str]], ip, site_url, now, sent_at, team_id):
+    if is_clickhouse_enabled():
+        log_events(events, ip=ip, site_url=site_url, team_id=team_id, now=now, sent_at=sent_at)
+    else:
+        for event, distinct_id in events:
+            capture_internal(event, distinct_id, ip, site_url, now, sent_at, team_id)
+
+
+def capture_session_recordings(
+    session_recordings: List[Tuple[List[Dict[str, Any]], str]], ip, site_url, now, sent_at, team_id
+) -> None:
+    """
+    Compresses and chunks the snapshots of each recording, then captures the chunks. With
+    SESSION_RECORDING_COMPRESSION_WORKERS set this happens in other processes, after the request has been responded to.
+    """
+    for snapshots, distinct_id in session_recordings:
+
+        def _capture_chunks(chunks: List[Dict[str, Any]], distinct_id: str = distinct_id) -> None:
+            statsd.incr("posthog_cloud_plugin_server_ingestion", len(chunks))
+            capture_internal_batch([(chunk, distinct_id) for chunk in chunks], ip, site_url, now, sent_at, team_id)
+
+        if settings.SESSION_RECORDING_COMPRESSION_WORKERS > 0:
+            compress_and_chunk_snapshots_in_background(snapshots, _capture_chunks)
+        else:
+            _capture_chunks(list(compress_and_chunk_snapshots(snapshots)))
@@ -94,7 +94,7 @@ def get_decide(request: HttpRequest):
             )
 
         token, _ = get_token(data, request)
-        team = Team.objects.get_team_from_token(token)
+        team = Team.objects.get_team_from_cache_or_token(token)
         if team is None and token:
             project_id = _get_project_id(data, request)
 
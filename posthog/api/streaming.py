@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework_csv.renderers import CSVRenderer
+
+# Lines are sent in chunks of about this size, rather than one by one
+STREAMING_CHUNK_SIZE = 64 * 1024  # bytes
+# The CSV header lists the columns of this many first rows, which are held in memory until it's sent
+CSV_HEADER_SAMPLE_ROWS = 1000
+
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+
+
+class JSONLinesRenderer(renderers.BaseRenderer):
+    """
+    Newline-delimited JSON, one line per result. Mostly there to let `?format=jsonl` through content negotiation, for
+    views streaming their results with `streaming_export_response`.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "jsonl"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        results = data.get("results", [data]) if isinstance(data, dict) else data
+        return b"".join(_jsonl_lines(results))
+
+
+def streaming_export_response(rows: Iterable[Dict[str, Any]], format: str, filename: str) -> StreamingHttpResponse:
+    """
+    Streams rows as an export, which takes the same memory whatever its size. For CSV, nested values are flattened
+    into columns like `properties.$browser`, the same as with `rest_framework_csv`'s renderers. The header has the
+    columns of the first CSV_HEADER_SAMPLE_ROWS rows: values of columns only seen after them have no header.
+    """
+    lines = _csv_lines(rows) if format == "csv" else _jsonl_lines(rows)
+    response = StreamingHttpResponse(_chunked(lines), content_type=CONTENT_TYPES[format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return response
+
+
+def _csv_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    # :TRICKY: The header goes out first, while flattening makes the columns depend on the rows. So it lists the
+    # columns of the first rows only, and columns first seen later get unnamed cells after them, in the order seen
+    flattener = CSVRenderer()
+    flat_rows = (flattener.flatten_item(row) for row in rows)
+    first_rows = list(islice(flat_rows, CSV_HEADER_SAMPLE_ROWS))
+    if not first_rows:
+        return
+
+    columns = sorted(set().union(*(flat_row.keys() for flat_row in first_rows)))
+    known_columns = set(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for flat_row in chain(first_rows, flat_rows):
+        new_columns = [column for column in flat_row.keys() if column not in known_columns]
+        columns.extend(new_columns)
+        known_columns.update(new_columns)
+        writer.writerow([flat_row.get(column) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _jsonl_lines(rows: Iterable[Any]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, cls=DjangoJSONEncoder) + "\n").encode("utf-8")
+
+
+def _chunked(lines: Iterable[bytes]) -> Iterator[bytes]:
+    chunk: List[bytes] = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAMING_CHUNK_SIZE:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
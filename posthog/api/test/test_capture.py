@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import gzip
 import json
@@ -7,14 +8,19 @@ from unittest.mock import patch
 from urllib.parse import quote
 
 import lzstring
-from django.test.client import Client
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+from django.test.client import AsyncRequestFactory, Client
 from django.utils import timezone
 from freezegun import freeze_time
 from rest_framework import status
 
+from posthog.api.capture import get_event_async
 from posthog.constants import ENVIRONMENT_TEST
-from posthog.models import PersonalAPIKey
-from posthog.models.feature_flag import FeatureFlag
+from posthog.models import PersonalAPIKey, Team
+from posthog.models.feature_flag import FeatureFlag, get_active_feature_flags_for_distinct_ids
+from posthog.rate_limiting import acquire_in_flight_request, release_in_flight_request, reset_capture_rate_limits
+from posthog.redis import get_client
 from posthog.test.base import BaseTest
 
 
@@ -86,6 +92,54 @@ class TestCapture(BaseTest):
             },
         )
 
+    @patch("posthog.models.team.TEAM_CACHE", {})
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_capture_event_async(self, patch_process_event_with_plugins):
+        data = {"event": "user signed up", "properties": {"distinct_id": 2, "token": self.team.api_token}}
+        request = AsyncRequestFactory().get("/e/", {"data": self._to_json(data)})
+
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60):
+            # Warm up the cache, as the test transaction isn't visible to the thread pool the view would query from
+            Team.objects.get_team_from_cache_or_token(self.team.api_token)
+            response = async_to_sync(get_event_async)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        arguments = self._to_arguments(patch_process_event_with_plugins)
+        arguments.pop("now")  # can't compare fakedate
+        arguments.pop("sent_at")  # can't compare fakedate
+        self.assertDictEqual(
+            arguments,
+            {
+                "distinct_id": "2",
+                "ip": "127.0.0.1",
+                "site_url": "http://testserver",
+                "data": data,
+                "team_id": self.team.pk,
+            },
+        )
+
+    @override_settings(CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND=1)
+    @patch("posthog.models.team.TEAM_CACHE", {})
+    @patch("posthog.api.capture.get_capture_rate_limit_retry_after")
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_capture_event_async_rate_limits_off_the_event_loop(self, patch_process_event_with_plugins, patch_retry):
+        def retry_after(team_id: int, event_count: int) -> float:
+            with self.assertRaises(RuntimeError):  # No event loop running in this thread
+                asyncio.get_running_loop()
+            return 5
+
+        patch_retry.side_effect = retry_after
+        data = {"event": "user signed up", "properties": {"distinct_id": 2, "token": self.team.api_token}}
+        request = AsyncRequestFactory().get("/e/", {"data": self._to_json(data)})
+
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60):
+            Team.objects.get_team_from_cache_or_token(self.team.api_token)
+            response = async_to_sync(get_event_async)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        patch_retry.assert_called_once_with(self.team.pk, 1)
+        patch_process_event_with_plugins.assert_not_called()
+
     @patch("posthog.models.team.TEAM_CACHE", {})
     @patch("posthog.api.capture.celery_app.send_task")
     def test_test_api_key(self, patch_process_event_with_plugins):
@@ -300,6 +354,88 @@ class TestCapture(BaseTest):
         )
         self.assertEqual(patch_process_event_with_plugins.call_count, 0)
 
+    @patch("posthog.models.team.TEAM_CACHE", {})
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_gzip_over_decompressed_size_limit(self, patch_process_event_with_plugins):
+        data = {
+            "api_key": self.team.api_token,
+            "batch": [
+                {"type": "capture", "event": "user signed up", "distinct_id": "2", "properties": {"x": "y" * 500}}
+            ],
+        }
+
+        with self.settings(DATA_UPLOAD_MAX_DECOMPRESSED_SIZE=100):
+            response = self.client.generic(
+                "POST",
+                "/batch/",
+                data=gzip.compress(json.dumps(data).encode()),
+                content_type="application/json",
+                HTTP_CONTENT_ENCODING="gzip",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            self.validation_error_response(
+                "Malformed request data: Decompressed data exceeds the maximum size of 100 bytes.",
+                code="invalid_payload",
+            ),
+        )
+        self.assertEqual(patch_process_event_with_plugins.call_count, 0)
+
+    @patch("posthog.models.team.TEAM_CACHE", {})
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_gzip_over_body_size_limit(self, patch_process_event_with_plugins):
+        data = {
+            "api_key": self.team.api_token,
+            "batch": [{"type": "capture", "event": "user signed up", "distinct_id": str(i)} for i in range(100)],
+        }
+
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100):
+            response = self.client.generic(
+                "POST",
+                "/batch/",
+                data=gzip.compress(json.dumps(data).encode()),
+                content_type="application/json",
+                HTTP_CONTENT_ENCODING="gzip",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            self.validation_error_response(
+                "Malformed request data: Request body exceeds the maximum size of 100 bytes.", code="invalid_payload",
+            ),
+        )
+        self.assertEqual(patch_process_event_with_plugins.call_count, 0)
+
+    @patch("posthog.models.team.TEAM_CACHE", {})
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_lz64_over_decompressed_size_limit(self, patch_process_event_with_plugins):
+        data = {
+            "api_key": self.team.api_token,
+            "event": "user signed up",
+            "distinct_id": "2",
+            "properties": {"x": "y" * 500},
+        }
+
+        with self.settings(DATA_UPLOAD_MAX_DECOMPRESSED_SIZE=100):
+            response = self.client.post(
+                "/track?compression=lz64",
+                data=lzstring.LZString().compressToBase64(json.dumps(data)),
+                content_type="text/plain",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            self.validation_error_response(
+                "Malformed request data: Decompressed data exceeds the maximum size of 100 bytes.",
+                code="invalid_payload",
+            ),
+        )
+        self.assertEqual(patch_process_event_with_plugins.call_count, 0)
+
     @patch("posthog.models.team.TEAM_CACHE", {})
     @patch("posthog.api.capture.celery_app.send_task")
     def test_invalid_lz64(self, patch_process_event_with_plugins):
@@ -723,6 +859,31 @@ class TestCapture(BaseTest):
         arguments = self._to_arguments(patch_process_event_with_plugins)
         self.assertEqual(arguments["data"]["properties"]["$active_feature_flags"], ["test-ff"])
 
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_add_feature_flags_once_per_distinct_id(self, patch_process_event_with_plugins) -> None:
+        FeatureFlag.objects.create(team=self.team, created_by=self.user, key="test-ff", rollout_percentage=100)
+        events = [
+            {"event": "$pageview", "properties": {"distinct_id": "xxx", "$lib": "web"}},
+            {"event": "$pageview", "properties": {"distinct_id": "yyy", "$lib": "web"}},
+            {"event": "$pageview", "properties": {"distinct_id": "xxx", "$lib": "web"}},
+            {"event": "$pageview", "properties": {"distinct_id": "xxx", "$lib": "web", "$active_feature_flags": []}},
+        ]
+
+        with patch(
+            "posthog.models.feature_flag.get_active_feature_flags_for_distinct_ids",
+            wraps=get_active_feature_flags_for_distinct_ids,
+        ) as get_flags:
+            self.client.post(
+                "/batch/", data={"api_key": self.team.api_token, "batch": events}, content_type="application/json"
+            )
+
+        get_flags.assert_called_once_with(self.team, ["xxx", "yyy"])
+        flags = [
+            call[1]["args"][3]["properties"]["$active_feature_flags"]
+            for call in patch_process_event_with_plugins.call_args_list
+        ]
+        self.assertEqual(flags, [["test-ff"], ["test-ff"], ["test-ff"], []])
+
     def test_handle_lacking_event_name_field(self):
         response = self.client.post(
             "/e/",
@@ -737,6 +898,73 @@ class TestCapture(BaseTest):
             ),
         )
 
+    @override_settings(SESSION_RECORDING_COMPRESSION="zstd-base64")
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_capture_snapshots_compressed_per_session(self, patch_process_event_with_plugins):
+        events = [
+            {"event": "$pageview", "properties": {"distinct_id": "xxx"}},
+            {
+                "event": "$snapshot",
+                "properties": {"distinct_id": "xxx", "$session_id": "1", "$snapshot_data": {"type": 2}},
+            },
+            {
+                "event": "$snapshot",
+                "properties": {"distinct_id": "xxx", "$session_id": "1", "$snapshot_data": {"type": 3}},
+            },
+        ]
+        response = self.client.post(
+            "/batch/", data={"api_key": self.team.api_token, "batch": events}, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        captured = [call[1]["args"] for call in patch_process_event_with_plugins.call_args_list]
+        self.assertEqual(
+            [(args[0], args[3]["event"]) for args in captured], [("xxx", "$pageview"), ("xxx", "$snapshot")]
+        )
+        snapshot_data = captured[1][3]["properties"]["$snapshot_data"]
+        self.assertEqual(snapshot_data["compression"], "zstd-base64")
+        self.assertEqual(snapshot_data["chunk_count"], 1)
+
+    @override_settings(CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND=1, CAPTURE_RATE_LIMIT_BURST=2)
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_rate_limit_team(self, patch_process_event_with_plugins):
+        get_client().flushdb()
+        reset_capture_rate_limits()
+        events = [{"event": "$pageview", "properties": {"distinct_id": "xxx"}}] * 5
+
+        for expected_status in [status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS]:
+            response = self.client.post(
+                "/batch/", data={"api_key": self.team.api_token, "batch": events}, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, expected_status)
+
+        self.assertEqual(response.json()["code"], "throttled")
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(patch_process_event_with_plugins.call_count, 5)
+        reset_capture_rate_limits()
+
+    @override_settings(CAPTURE_MAX_IN_FLIGHT_REQUESTS=1, CAPTURE_LOAD_SHEDDING_RETRY_AFTER_SECONDS=3)
+    @patch("posthog.api.capture.celery_app.send_task")
+    def test_shed_load_over_in_flight_requests(self, patch_process_event_with_plugins):
+        self.assertTrue(acquire_in_flight_request())  # As if another request was in progress
+        try:
+            response = self.client.get(
+                "/e/?data=%s"
+                % quote(self._to_json({"event": "$pageview", "distinct_id": "xxx", "api_key": self.team.api_token}))
+            )
+        finally:
+            release_in_flight_request()
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+        patch_process_event_with_plugins.assert_not_called()
+
+        response = self.client.get(
+            "/e/?data=%s"
+            % quote(self._to_json({"event": "$pageview", "distinct_id": "xxx", "api_key": self.team.api_token}))
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_handle_invalid_snapshot(self):
         response = self.client.post(
             "/e/",
@@ -0,0 +1,29 @@
+import pytest
+
+from posthog.api.capture import get_event
+from posthog.management.commands.benchmark_capture import SCENARIOS, build_request, stubbed_ingestion
+from posthog.models import Organization, Team
+
+pytest.importorskip("pytest_benchmark")
+
+# Few rounds keep the suite quick, while still giving numbers to compare runs with `--benchmark-compare`
+ROUNDS = 20
+
+
+@pytest.fixture
+def team(db):
+    organization = Organization.objects.create(name="Benchmark")
+    return Team.objects.create(organization=organization, api_token="token123")
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS.keys()))
+def test_capture_throughput(benchmark, team, scenario):
+    payload = SCENARIOS[scenario](team)
+    benchmark.extra_info["events"] = payload.event_count
+
+    with stubbed_ingestion():
+        response = benchmark.pedantic(
+            get_event, setup=lambda: ((build_request(payload),), {}), rounds=ROUNDS, warmup_rounds=1
+        )
+
+    assert response.status_code == 200, response.content
@@ -25,6 +25,11 @@ from posthog.test.base import APIBaseTest
 from posthog.utils import relative_date_parse
 
 
+def _response_content(response) -> bytes:
+    # Exports from ClickHouse are streamed
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
 def factory_test_event_api(event_factory, person_factory, _):
     class TestEvents(APIBaseTest):
         ENDPOINT = "event"
@@ -452,7 +457,9 @@ def factory_test_event_api(event_factory, person_factory, _):
                     event_factory(team=self.team, event="5th action", distinct_id="2", properties={"$os": "Windows 95"})
                 response = self.client.get("/api/event.csv?limit=5")
             self.assertEqual(
-                len(response.content.splitlines()), 6, "CSV export should return up to limit=5 events (+ headers row)",
+                len(_response_content(response).splitlines()),
+                6,
+                "CSV export should return up to limit=5 events (+ headers row)",
             )
 
         @patch("posthog.api.event.EventViewSet.CSV_EXPORT_DEFAULT_LIMIT", 10)
@@ -462,7 +469,7 @@ def factory_test_event_api(event_factory, person_factory, _):
                     event_factory(team=self.team, event="5th action", distinct_id="2", properties={"$os": "Windows 95"})
                 response = self.client.get("/api/event.csv")
             self.assertEqual(
-                len(response.content.splitlines()),
+                len(_response_content(response).splitlines()),
                 11,
                 "CSV export should return up to CSV_EXPORT_MAXIMUM_LIMIT events (+ headers row)",
             )
@@ -474,7 +481,7 @@ def factory_test_event_api(event_factory, person_factory, _):
                     event_factory(team=self.team, event="5th action", distinct_id="2", properties={"$os": "Windows 95"})
                 response = self.client.get("/api/event.csv")
             self.assertEqual(
-                len(response.content.splitlines()),
+                len(_response_content(response).splitlines()),
                 11,
                 "CSV export should return up to CSV_EXPORT_MAXIMUM_LIMIT events (+ headers row)",
             )
@@ -486,7 +493,7 @@ def factory_test_event_api(event_factory, person_factory, _):
                     event_factory(team=self.team, event="5th action", distinct_id="2", properties={"$os": "Windows 95"})
                 response = self.client.get("/api/event.csv?limit=100")
             self.assertEqual(
-                len(response.content.splitlines()),
+                len(_response_content(response).splitlines()),
                 11,
                 "CSV export should return up to CSV_EXPORT_MAXIMUM_LIMIT events (+ headers row)",
             )
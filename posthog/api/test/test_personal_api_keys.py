@@ -1,6 +1,8 @@
+from unittest.mock import patch
+
 from rest_framework import status
 
-from posthog.models import PersonalAPIKey
+from posthog.models import PersonalAPIKey, Team, User
 from posthog.test.base import APIBaseTest
 
 
@@ -111,3 +113,63 @@ class TestPersonalAPIKeysAPIAuthentication(APIBaseTest):
         key.save()
         response = self.client.get("/api/users/@me/", HTTP_AUTHORIZATION=f"Bearer {key.value}")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch("posthog.models.personal_api_key.PERSONAL_API_KEY_CACHE", {})
+    def test_key_is_cached_and_last_used_at_throttled(self):
+        key = PersonalAPIKey(label="Test", user=self.user)
+        key.save()
+        with self.settings(PERSONAL_API_KEY_CACHE_TTL_SECONDS=60):
+            with self.assertNumQueries(3):  # key, user, last_used_at
+                self.assertEqual(User.objects.get_from_personal_api_key(key.value), self.user)
+            with self.assertNumQueries(1):  # user
+                self.assertEqual(User.objects.get_from_personal_api_key(key.value), self.user)
+        key.refresh_from_db()
+        self.assertIsNotNone(key.last_used_at)
+
+    @patch("posthog.models.personal_api_key.PERSONAL_API_KEY_CACHE", {})
+    def test_cached_key_stops_working_when_revoked(self):
+        key = PersonalAPIKey(label="Test", user=self.user)
+        key.save()
+        with self.settings(PERSONAL_API_KEY_CACHE_TTL_SECONDS=60):
+            response = self.client.get("/api/users/@me/", HTTP_AUTHORIZATION=f"Bearer {key.value}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            key.delete()
+            response = self.client.get("/api/users/@me/", HTTP_AUTHORIZATION=f"Bearer {key.value}")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch("posthog.models.personal_api_key.PERSONAL_API_KEY_CACHE", {})
+    def test_cached_key_stops_working_when_user_deactivated(self):
+        key = PersonalAPIKey(label="Test", user=self.user)
+        key.save()
+        with self.settings(PERSONAL_API_KEY_CACHE_TTL_SECONDS=60):
+            response = self.client.get("/api/users/@me/", HTTP_AUTHORIZATION=f"Bearer {key.value}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            self.user.is_active = False
+            self.user.save()
+            response = self.client.get("/api/users/@me/", HTTP_AUTHORIZATION=f"Bearer {key.value}")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch("posthog.models.personal_api_key.PERSONAL_API_KEY_CACHE", {})
+    def test_cached_key_authenticates_the_latest_user(self):
+        key = PersonalAPIKey(label="Test", user=self.user)
+        key.save()
+        other_team = Team.objects.create(organization=self.organization)
+        with self.settings(PERSONAL_API_KEY_CACHE_TTL_SECONDS=60):
+            self.assertEqual(User.objects.get_from_personal_api_key(key.value).current_team, self.team)
+
+            self.user.current_team = other_team
+            self.user.save(update_fields=["current_team"])
+            self.assertEqual(User.objects.get_from_personal_api_key(key.value).current_team, other_team)
+
+    @patch("posthog.models.personal_api_key.capture_exception")
+    @patch("posthog.models.personal_api_key.get_client")
+    def test_keys_can_be_saved_without_redis(self, mock_get_client, mock_capture_exception):
+        mock_get_client.return_value.publish.side_effect = ConnectionError
+
+        key = PersonalAPIKey(label="Test", user=self.user)
+        key.save()
+
+        self.assertTrue(PersonalAPIKey.objects.filter(pk=key.pk).exists())
+        self.assertEqual(mock_capture_exception.call_count, 1)
@@ -0,0 +1,53 @@
+import csv
+import io
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from posthog.api import streaming
+from posthog.api.streaming import streaming_export_response
+
+
+def _read_csv(content: bytes):
+    return list(csv.reader(io.StringIO(content.decode("utf-8"))))
+
+
+class TestStreamingExportResponse(SimpleTestCase):
+    def test_csv_flattens_nested_values(self):
+        rows = [{"id": 1, "properties": {"$os": "Mac"}}, {"id": 2, "properties": {"$os": "Windows", "index": 1}}]
+
+        response = streaming_export_response(iter(rows), "csv", filename="events")
+
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="events.csv"')
+        self.assertEqual(
+            _read_csv(b"".join(response.streaming_content)),
+            [["id", "properties.$os", "properties.index"], ["1", "Mac", ""], ["2", "Windows", "1"]],
+        )
+
+    @patch.object(streaming, "STREAMING_CHUNK_SIZE", 1)
+    @patch.object(streaming, "CSV_HEADER_SAMPLE_ROWS", 2)
+    def test_csv_is_sent_before_all_rows_are_read(self):
+        read = []
+
+        def rows():
+            for index in range(10):
+                read.append(index)
+                yield {"id": index}
+
+        content = iter(streaming_export_response(rows(), "csv", filename="events").streaming_content)
+
+        self.assertEqual(next(content), b"id\r\n0\r\n")
+        self.assertEqual(read, [0, 1])
+
+    @patch.object(streaming, "CSV_HEADER_SAMPLE_ROWS", 1)
+    def test_csv_columns_first_seen_after_the_header_are_appended(self):
+        rows = [{"id": 1}, {"id": 2, "properties": {"$os": "Mac"}}, {"id": 3}]
+
+        response = streaming_export_response(iter(rows), "csv", filename="events")
+
+        self.assertEqual(_read_csv(b"".join(response.streaming_content)), [["id"], ["1"], ["2", "Mac"], ["3", ""]])
+
+    def test_jsonl(self):
+        response = streaming_export_response(iter([{"id": 1}, {"id": 2}]), "jsonl", filename="events")
+
+        self.assertEqual(b"".join(response.streaming_content), b'{"id": 1}\n{"id": 2}\n')
@@ -0,0 +1,53 @@
+"""
+ASGI config for posthog project.
+
+Serves the same URLs as posthog.wsgi, but lets the capture endpoints run as async views (see CAPTURE_ASYNC).
+Run with e.g. `gunicorn posthog.asgi -k uvicorn.workers.UvicornWorker`.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+import re
+
+from django.core.asgi import get_asgi_application
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "posthog.settings")
+
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+# Capture endpoints that are exempt from ALLOWED_IP_BLOCKS (see AllowIP), so skipping the middleware changes nothing
+# for them. They are CSRF exempt and set their own CORS headers.
+CAPTURE_PATH_REGEX = re.compile(r"^/(e|engage|track|capture|batch)/?$")
+
+
+class MiddlewareFreeASGIHandler(ASGIHandler):
+    """
+    Serves requests without settings.MIDDLEWARE.
+
+    :TRICKY: None of our middleware is async-capable, so Django adapts the chain to sync and runs it on the single
+    thread shared by every request of the worker. Each capture request would then hop on and off that thread and queue
+    behind the middleware work of every other request, however many of them the event loop is serving at once.
+    """
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        self._middleware_chain = convert_exception_to_response(
+            self._get_response_async if is_async else self._get_response
+        )
+
+
+capture_application = MiddlewareFreeASGIHandler()
+
+
+async def application(scope, receive, send):
+    if settings.CAPTURE_ASYNC and scope["type"] == "http" and CAPTURE_PATH_REGEX.match(scope["path"]):
+        return await capture_application(scope, receive, send)
+    return await django_application(scope, receive, send)
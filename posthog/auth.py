@@ -6,7 +6,6 @@ from urllib.parse import urlsplit
 from django.apps import apps
 from django.contrib.auth.models import AnonymousUser
 from django.http import HttpRequest, JsonResponse
-from django.utils import timezone
 from rest_framework import authentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.request import Request
@@ -62,17 +61,11 @@ class PersonalAPIKeyAuthentication(authentication.BaseAuthentication):
         if not personal_api_key_with_source:
             return None
         personal_api_key, source = personal_api_key_with_source
-        PersonalAPIKey = apps.get_model(app_label="posthog", model_name="PersonalAPIKey")
-        try:
-            personal_api_key_object = (
-                PersonalAPIKey.objects.select_related("user").filter(user__is_active=True).get(value=personal_api_key)
-            )
-        except PersonalAPIKey.DoesNotExist:
+        User = apps.get_model(app_label="posthog", model_name="User")
+        user = User.objects.get_from_personal_api_key(personal_api_key)
+        if user is None:
             raise AuthenticationFailed(detail=f"Personal API key found in request {source} is invalid.")
-        personal_api_key_object.last_used_at = timezone.now()
-        personal_api_key_object.save()
-        assert personal_api_key_object.user is not None
-        return personal_api_key_object.user, None
+        return user, None
 
     @classmethod
     def authenticate_header(cls, request) -> str:
@@ -1,6 +1,7 @@
 import os
 import time
 from random import randrange
+from typing import Any, Dict
 
 from celery import Celery
 from celery.schedules import crontab
@@ -135,20 +136,25 @@ def setup_periodic_tasks(sender: Celery, **kwargs):
 
 
 # Set up clickhouse query instrumentation
+_instrumentation_tokens: Dict[str, Any] = {}
+
+
 @task_prerun.connect
 def set_up_instrumentation(task_id, task, **kwargs):
     if is_clickhouse_enabled() and settings.EE_AVAILABLE:
-        from ee.clickhouse import client
+        from ee.clickhouse.instrumentation import InstrumentationContext, set_instrumentation_context
 
-        client._request_information = {"kind": "celery", "id": task.name}
+        _instrumentation_tokens[task_id] = set_instrumentation_context(InstrumentationContext("celery", task.name))
 
 
 @task_postrun.connect
 def teardown_instrumentation(task_id, task, **kwargs):
     if is_clickhouse_enabled() and settings.EE_AVAILABLE:
-        from ee.clickhouse import client
+        from ee.clickhouse.instrumentation import reset_instrumentation_context
 
-        client._request_information = None
+        token = _instrumentation_tokens.pop(task_id, None)
+        if token is not None:
+            reset_instrumentation_context(token)
 
 
 @app.task(ignore_result=True)
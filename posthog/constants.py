@@ -100,6 +100,7 @@ LIMIT = "limit"
 PERIOD = "period"
 STICKINESS_DAYS = "stickiness_days"
 FORMULA = "formula"
+SAMPLING_FACTOR = "sampling_factor"
 ENTITY_ID = "entity_id"
 ENTITY_TYPE = "entity_type"
 ENTITY_MATH = "entity_math"
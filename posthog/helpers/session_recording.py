@@ -1,9 +1,15 @@
 import base64
 import gzip
 import json
+import multiprocessing
+import os
 from collections import defaultdict
-from typing import Dict, Generator, List
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Generator, List, Optional, Tuple
 
+import django
+import zstandard
+from django.conf import settings
 from sentry_sdk.api import capture_exception, capture_message
 
 from posthog.models import utils
@@ -13,8 +19,23 @@ SnapshotData = Dict
 
 FULL_SNAPSHOT = 2
 
+# Chunk formats: JSON encoded as UTF-16 then gzipped, or encoded as UTF-8 then zstd-compressed. Both base64-encoded
+COMPRESSION_GZIP_BASE64 = "gzip-base64"
+COMPRESSION_ZSTD_BASE64 = "zstd-base64"
+
+_compression_pool: Optional[Tuple[int, ProcessPoolExecutor]] = None
+
 
 def preprocess_session_recording_events(events: List[Event]) -> List[Event]:
+    result, snapshots_by_session = group_session_recording_events(events)
+    for snapshots in snapshots_by_session:
+        result.extend(list(compress_and_chunk_snapshots(snapshots)))
+
+    return result
+
+
+def group_session_recording_events(events: List[Event]) -> Tuple[List[Event], List[List[Event]]]:
+    """Splits unchunked snapshots, grouped by session, from the other events."""
     result = []
     snapshots_by_session = defaultdict(list)
     for event in events:
@@ -23,19 +44,18 @@ def preprocess_session_recording_events(events: List[Event]) -> List[Event]:
             snapshots_by_session[session_recording_id].append(event)
         else:
             result.append(event)
-
-    for session_recording_id, snapshots in snapshots_by_session.items():
-        result.extend(list(compress_and_chunk_snapshots(snapshots)))
-
-    return result
+    return result, list(snapshots_by_session.values())
 
 
-def compress_and_chunk_snapshots(events: List[Event], chunk_size=512 * 1024) -> Generator[Event, None, None]:
+def compress_and_chunk_snapshots(
+    events: List[Event], chunk_size=512 * 1024, compression: Optional[str] = None
+) -> Generator[Event, None, None]:
+    compression = compression or settings.SESSION_RECORDING_COMPRESSION
     data_list = [event["properties"]["$snapshot_data"] for event in events]
     session_id = events[0]["properties"]["$session_id"]
     has_full_snapshot = any(snapshot_data["type"] == FULL_SNAPSHOT for snapshot_data in data_list)
 
-    compressed_data = compress_to_string(json.dumps(data_list))
+    compressed_data = compress_to_string(json.dumps(data_list), compression)
 
     id = str(utils.UUIDT())
     chunks = chunk_string(compressed_data, chunk_size)
@@ -50,13 +70,71 @@ def compress_and_chunk_snapshots(events: List[Event], chunk_size=512 * 1024) ->
                     "chunk_index": index,
                     "chunk_count": len(chunks),
                     "data": chunk,
-                    "compression": "gzip-base64",
+                    "compression": compression,
                     "has_full_snapshot": has_full_snapshot,
                 },
             },
         }
 
 
+def compress_and_chunk_snapshots_in_background(events: List[Event], callback: Callable[[List[Event]], None]) -> None:
+    """
+    Compresses and chunks the snapshots in a pool of SESSION_RECORDING_COMPRESSION_WORKERS processes, then calls
+    `callback` with the chunks from a thread of this process, so the request can return before compression runs.
+
+    If the pool fails, the snapshots are compressed in this process instead so that the recording isn't lost.
+    """
+    # Passing the compression explicitly, as workers don't see settings overridden at runtime
+    compression = settings.SESSION_RECORDING_COMPRESSION
+
+    def _on_done(future: Future) -> None:
+        try:
+            try:
+                chunks = future.result()
+            except Exception as e:
+                # :TRICKY: A broken pool isn't reset here, in its own management thread. Its next submit raises instead
+                capture_exception(e)
+                chunks = _compress_and_chunk_snapshots(events, compression)
+            callback(chunks)
+        except Exception as e:
+            capture_exception(e)
+
+    try:
+        future = _get_compression_pool().submit(_compress_and_chunk_snapshots, events, compression)
+    except RuntimeError as e:  # BrokenProcessPool included
+        _reset_compression_pool()
+        capture_exception(e)
+        callback(_compress_and_chunk_snapshots(events, compression))
+        return
+    future.add_done_callback(_on_done)
+
+
+def _compress_and_chunk_snapshots(events: List[Event], compression: str) -> List[Event]:
+    return list(compress_and_chunk_snapshots(events, compression=compression))
+
+
+def _get_compression_pool() -> ProcessPoolExecutor:
+    global _compression_pool
+    # Forked web server workers must not share the pool of their parent
+    if _compression_pool is None or _compression_pool[0] != os.getpid():
+        pool = ProcessPoolExecutor(
+            max_workers=settings.SESSION_RECORDING_COMPRESSION_WORKERS,
+            # :TRICKY: Not forking, as the pool is created from a request, while other threads may hold locks that
+            # forked workers would inherit locked. Spawned workers set up Django from DJANGO_SETTINGS_MODULE instead
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+        _compression_pool = (os.getpid(), pool)
+    return _compression_pool[1]
+
+
+def _reset_compression_pool() -> None:
+    global _compression_pool
+    if _compression_pool is not None and _compression_pool[0] == os.getpid():
+        _compression_pool[1].shutdown(wait=False)
+    _compression_pool = None
+
+
 def decompress_chunked_snapshot_data(
     team_id: int, session_recording_id: str, snapshot_list: List[SnapshotData]
 ) -> Generator[SnapshotData, None, None]:
@@ -75,7 +153,9 @@ def decompress_chunked_snapshot_data(
             continue
 
         b64_compressed_data = "".join(chunk["data"] for chunk in sorted(chunks, key=lambda c: c["chunk_index"]))
-        decompressed_data = json.loads(decompress(b64_compressed_data))
+        decompressed_data = json.loads(
+            decompress(b64_compressed_data, chunks[0].get("compression", COMPRESSION_GZIP_BASE64))
+        )
 
         yield from decompressed_data
 
@@ -97,11 +177,21 @@ def is_unchunked_snapshot(event: Dict) -> bool:
         raise ValueError('$snapshot events must contain property "$snapshot_data"!')
 
 
-def compress_to_string(json_string: str) -> str:
-    compressed_data = gzip.compress(json_string.encode("utf-16", "surrogatepass"))
+def compress_to_string(json_string: str, compression: str = COMPRESSION_GZIP_BASE64) -> str:
+    if compression == COMPRESSION_GZIP_BASE64:
+        compressed_data = gzip.compress(json_string.encode("utf-16", "surrogatepass"))
+    elif compression == COMPRESSION_ZSTD_BASE64:
+        compressed_data = zstandard.ZstdCompressor().compress(json_string.encode("utf-8", "surrogatepass"))
+    else:
+        raise ValueError(f"Unknown session recording compression {compression}!")
     return base64.b64encode(compressed_data).decode("utf-8")
 
 
-def decompress(base64data: str) -> str:
+def decompress(base64data: str, compression: str = COMPRESSION_GZIP_BASE64) -> str:
     compressed_bytes = base64.b64decode(base64data)
-    return gzip.decompress(compressed_bytes).decode("utf-16", "surrogatepass")
+    if compression == COMPRESSION_GZIP_BASE64:
+        return gzip.decompress(compressed_bytes).decode("utf-16", "surrogatepass")
+    elif compression == COMPRESSION_ZSTD_BASE64:
+        return zstandard.ZstdDecompressor().decompress(compressed_bytes).decode("utf-8", "surrogatepass")
+    else:
+        raise ValueError(f"Unknown session recording compression {compression}!")
@@ -1,8 +1,14 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from queue import Queue
+
 import pytest
+from django.test import override_settings
 from pytest_mock import MockerFixture
 
 from posthog.helpers.session_recording import (
     compress_and_chunk_snapshots,
+    compress_and_chunk_snapshots_in_background,
     decompress_chunked_snapshot_data,
     preprocess_session_recording_events,
 )
@@ -79,6 +85,76 @@ def test_decompression_results_in_same_data(snapshot_events):
     ]
 
 
+def test_zstd_decompression_results_in_same_data(snapshot_events):
+    chunks = list(compress_and_chunk_snapshots(snapshot_events, 100, compression="zstd-base64"))
+    assert [chunk["properties"]["$snapshot_data"]["compression"] for chunk in chunks] == ["zstd-base64"]
+    assert list(decompress_chunked_snapshot_data(1, "someid", [chunks[0]["properties"]["$snapshot_data"]])) == [
+        snapshot_events[0]["properties"]["$snapshot_data"],
+        snapshot_events[1]["properties"]["$snapshot_data"],
+    ]
+
+
+def test_decompress_mixed_compressions(snapshot_events):
+    snapshot_data = [
+        event["properties"]["$snapshot_data"]
+        for compression in ["gzip-base64", "zstd-base64"]
+        for event in compress_and_chunk_snapshots(snapshot_events, 50, compression=compression)
+    ]
+    assert len(list(decompress_chunked_snapshot_data(1, "someid", snapshot_data))) == 4
+
+
+@override_settings(SESSION_RECORDING_COMPRESSION="zstd-base64")
+def test_compression_follows_setting(snapshot_events):
+    chunks = list(compress_and_chunk_snapshots(snapshot_events))
+    assert chunks[0]["properties"]["$snapshot_data"]["compression"] == "zstd-base64"
+
+
+@override_settings(SESSION_RECORDING_COMPRESSION_WORKERS=1, SESSION_RECORDING_COMPRESSION="zstd-base64")
+def test_compress_in_background(snapshot_events):
+    compressed: Queue = Queue()
+    compress_and_chunk_snapshots_in_background(snapshot_events, compressed.put)
+    chunks = compressed.get(timeout=60)
+
+    assert chunks[0]["properties"]["$snapshot_data"]["compression"] == "zstd-base64"
+    assert compress_and_decompress_chunks(chunks) == [
+        snapshot_events[0]["properties"]["$snapshot_data"],
+        snapshot_events[1]["properties"]["$snapshot_data"],
+    ]
+
+
+@override_settings(SESSION_RECORDING_COMPRESSION_WORKERS=1)
+@pytest.mark.parametrize("error", [BrokenProcessPool(), ValueError()])
+def test_compress_in_background_falls_back_to_this_process(snapshot_events, mocker: MockerFixture, error):
+    pool = mocker.patch("posthog.helpers.session_recording._get_compression_pool")
+    failed: Future = Future()
+    failed.set_exception(error)
+    pool.return_value.submit.return_value = failed
+    mock_capture_exception = mocker.patch("posthog.helpers.session_recording.capture_exception")
+    callback = mocker.Mock()
+
+    compress_and_chunk_snapshots_in_background(snapshot_events, callback)
+
+    mock_capture_exception.assert_called_once_with(error)
+    assert compress_and_decompress_chunks(callback.call_args[0][0]) == [
+        snapshot_events[0]["properties"]["$snapshot_data"],
+        snapshot_events[1]["properties"]["$snapshot_data"],
+    ]
+
+
+@override_settings(SESSION_RECORDING_COMPRESSION_WORKERS=1)
+def test_compress_in_background_resets_a_broken_pool(snapshot_events, mocker: MockerFixture):
+    pool = mocker.patch("posthog.helpers.session_recording._get_compression_pool")
+    pool.return_value.submit.side_effect = BrokenProcessPool()
+    mock_reset = mocker.patch("posthog.helpers.session_recording._reset_compression_pool")
+    mocker.patch("posthog.helpers.session_recording.capture_exception")
+    callback = mocker.Mock()
+
+    compress_and_chunk_snapshots_in_background(snapshot_events, callback)
+
+    mock_reset.assert_called_once()
+    assert len(callback.call_args[0][0]) == 1
+
+
 def test_has_full_snapshot_property(snapshot_events):
     compressed = list(compress_and_chunk_snapshots(snapshot_events))
     assert len(compressed) == 1
@@ -134,7 +210,9 @@ def snapshot_events():
 
 
 def compress_and_decompress(events, chunk_size):
-    snapshot_data = [
-        event["properties"]["$snapshot_data"] for event in compress_and_chunk_snapshots(events, chunk_size)
-    ]
+    return compress_and_decompress_chunks(compress_and_chunk_snapshots(events, chunk_size))
+
+
+def compress_and_decompress_chunks(chunks):
+    snapshot_data = [event["properties"]["$snapshot_data"] for event in chunks]
     return list(decompress_chunked_snapshot_data(1, "someid", snapshot_data))
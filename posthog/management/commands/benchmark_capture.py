@@ -0,0 +1,308 @@
+import asyncio
+import gzip
+import json
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from unittest.mock import patch
+
+import lzstring
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+
+from posthog.models import Team
+from posthog.utils import is_clickhouse_enabled
+
+
+class CapturePayload(NamedTuple):
+    path: str
+    body: bytes
+    content_type: str
+    headers: Dict[str, str]
+    event_count: int
+
+
+def _web_event(team: Team, index: int, event: str = "$pageview", **properties) -> Dict[str, Any]:
+    """An event as sent by posthog-js."""
+    return {
+        "event": event,
+        "properties": {
+            "$os": "Mac OS X",
+            "$browser": "Chrome",
+            "$device_type": "Desktop",
+            "$current_url": f"https://example.com/pricing?utm_source=benchmark&page={index}",
+            "$host": "example.com",
+            "$pathname": "/pricing",
+            "$browser_version": 91,
+            "$screen_height": 1120,
+            "$screen_width": 1792,
+            "$viewport_height": 1012,
+            "$viewport_width": 1792,
+            "$lib": "web",
+            "$lib_version": "1.12.1",
+            "$insert_id": f"benchmark{index:08d}",
+            "$time": 1625000000.123 + index,
+            "distinct_id": f"benchmark_{index % 10}",
+            "$device_id": "17a4f3b2c1d-0e8f7a6b5c4d3e-35677e0a-1fa400-17a4f3b2c1e3f1",
+            "$referrer": "https://www.google.com/",
+            "$referring_domain": "www.google.com",
+            "$active_feature_flags": [],
+            "token": team.api_token,
+            **properties,
+        },
+        "timestamp": "2021-06-30T12:00:00.000Z",
+    }
+
+
+def _snapshot_event(team: Team, index: int) -> Dict[str, Any]:
+    """An incremental rrweb snapshot of a few DOM mutations, preceded by a full snapshot."""
+    snapshot_data: Dict[str, Any] = {
+        "type": 3,
+        "data": {
+            "source": 0,
+            "texts": [],
+            "attributes": [{"id": 100 + index, "attributes": {"class": "LemonButton LemonButton--primary"}}],
+            "removes": [{"parentId": 42, "id": 200 + index}],
+            "adds": [
+                {
+                    "parentId": 42,
+                    "nextId": None,
+                    "node": {"type": 2, "tagName": "div", "attributes": {"class": "row"}, "childNodes": [], "id": i},
+                }
+                for i in range(300 + 10 * index, 310 + 10 * index)
+            ],
+        },
+        "timestamp": 1625000000123 + index * 50,
+    }
+    if index == 0:
+        snapshot_data = {
+            "type": 2,
+            "data": {"node": {"type": 0, "childNodes": [], "id": 1}},
+            "timestamp": 1625000000000,
+        }
+    return _web_event(team, 0, "$snapshot", **{"$snapshot_data": snapshot_data, "$session_id": "benchmark_session"})
+
+
+def _json_payload(path: str, data: Any, event_count: int) -> CapturePayload:
+    return CapturePayload(path, json.dumps(data).encode(), "application/json", {}, event_count)
+
+
+def single_event_payload(team: Team) -> CapturePayload:
+    return _json_payload("/e/", _web_event(team, 0), 1)
+
+
+def batch_payload(team: Team, batch_size: int = 100) -> CapturePayload:
+    return _json_payload(
+        "/batch/", {"api_key": team.api_token, "batch": [_web_event(team, i) for i in range(batch_size)]}, batch_size
+    )
+
+
+def gzip_payload(team: Team, batch_size: int = 100) -> CapturePayload:
+    body = gzip.compress(json.dumps([_web_event(team, i) for i in range(batch_size)]).encode())
+    return CapturePayload("/e/?compression=gzip-js", body, "text/plain", {}, batch_size)
+
+
+def lz64_payload(team: Team, batch_size: int = 100) -> CapturePayload:
+    body = lzstring.LZString().compressToBase64(json.dumps([_web_event(team, i) for i in range(batch_size)])).encode()
+    return CapturePayload("/e/", body, "application/json", {"HTTP_CONTENT_ENCODING": "lz64"}, batch_size)
+
+
+def snapshot_payload(team: Team, batch_size: int = 50) -> CapturePayload:
+    return _json_payload("/e/", [_snapshot_event(team, i) for i in range(batch_size)], batch_size)
+
+
+SCENARIOS: Dict[str, Callable[[Team], CapturePayload]] = {
+    "single": single_event_payload,
+    "batch": batch_payload,
+    "gzip": gzip_payload,
+    "lz64": lz64_payload,
+    "snapshot": snapshot_payload,
+}
+
+
+def build_environ(payload: CapturePayload, factory: Optional[RequestFactory] = None) -> Dict[str, Any]:
+    """WSGI environ of a request sending the payload."""
+    factory = factory or RequestFactory()
+    return factory.generic("POST", payload.path, payload.body, payload.content_type, **payload.headers).environ
+
+
+def build_scope(payload: CapturePayload) -> Dict[str, Any]:
+    """ASGI scope of a request sending the payload."""
+    path, _, query_string = payload.path.partition("?")
+    headers = [(b"content-type", payload.content_type.encode()), (b"content-length", str(len(payload.body)).encode())]
+    headers += [(key[5:].lower().replace("_", "-").encode(), value.encode()) for key, value in payload.headers.items()]
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+
+
+def wsgi_request(handler: WSGIHandler, environ: Dict[str, Any]) -> Tuple[int, bytes]:
+    statuses: List[str] = []
+    body = b"".join(handler(environ, lambda status, headers: statuses.append(status)))
+    return int(statuses[0].split()[0]), body
+
+
+async def asgi_request(application: Callable, scope: Dict[str, Any], body: bytes) -> Tuple[int, bytes]:
+    messages: List[Dict[str, Any]] = []
+    received = False
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"], b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def allocated_bytes_per_event(payload: CapturePayload, requests: int = 10) -> float:
+    """Peak memory traced while handling a request, per event. Allocations show up there before being freed."""
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    wsgi_request(handler, build_environ(payload, factory))  # Warm up caches and lazy imports
+    peaks = []
+    for _ in range(requests):
+        environ = build_environ(payload, factory)
+        tracemalloc.start()
+        try:
+            wsgi_request(handler, environ)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return sorted(peaks)[len(peaks) // 2] / payload.event_count
+
+
+def _summarize(name: str, latencies: List[float], total_seconds: float, event_count: int) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "server": name,
+        "requests/s": len(latencies) / total_seconds,
+        "events/s": len(latencies) * event_count / total_seconds,
+        "p50 ms": latencies[len(latencies) // 2] * 1000,
+        "p99 ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def benchmark_wsgi(payload: CapturePayload, requests: int, concurrency: int) -> Dict[str, Any]:
+    """posthog.wsgi on a thread pool, like gunicorn's gthread workers."""
+    handler = WSGIHandler()
+    factory = RequestFactory()
+
+    def send(_: int) -> float:
+        environ = build_environ(payload, factory)
+        start = perf_counter()
+        status, content = wsgi_request(handler, environ)
+        elapsed = perf_counter() - start
+        assert status == 200, content
+        return elapsed
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(send, range(requests)))
+    return _summarize("wsgi", latencies, perf_counter() - start, payload.event_count)
+
+
+async def benchmark_asgi(payload: CapturePayload, requests: int, concurrency: int) -> Dict[str, Any]:
+    """posthog.asgi on a single event loop, like a uvicorn worker."""
+    from posthog.asgi import application
+
+    semaphore = asyncio.Semaphore(concurrency)
+    scope = build_scope(payload)
+
+    async def send() -> float:
+        async with semaphore:
+            start = perf_counter()
+            status, content = await asgi_request(application, dict(scope), payload.body)
+            elapsed = perf_counter() - start
+            assert status == 200, content
+            return elapsed
+
+    start = perf_counter()
+    latencies = await asyncio.gather(*(send() for _ in range(requests)))
+    name = "asgi (async view)" if settings.CAPTURE_ASYNC else "asgi (sync view)"
+    return _summarize(name, list(latencies), perf_counter() - start, payload.event_count)
+
+
+@contextmanager
+def stubbed_ingestion() -> Iterator[None]:
+    """Keeps events from reaching Kafka or Celery, and Redis in memory, like in tests."""
+    import fakeredis
+
+    with ExitStack() as stack:
+        stack.enter_context(patch("posthog.redis._client", fakeredis.FakeRedis()))
+        stack.enter_context(patch("posthog.api.capture.celery_app.send_task"))
+        if is_clickhouse_enabled():
+            from ee.kafka_client.client import KafkaProducer, _KafkaProducer
+
+            with patch("ee.kafka_client.client.TEST", True):
+                producer = _KafkaProducer()
+            stack.enter_context(patch.object(KafkaProducer, "instance", producer))
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the capture endpoint with realistic payloads, through the WSGI and ASGI applications. "
+        "The ASGI one serves the async view if CAPTURE_ASYNC is enabled"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Number of requests per view and scenario")
+        parser.add_argument("--concurrency", type=int, default=50, help="Number of requests in flight at once")
+        parser.add_argument(
+            "--scenario", choices=list(SCENARIOS.keys()), action="append", help="Payloads to send (defaults to all)"
+        )
+        parser.add_argument("--team-id", type=int, help="Project to send events to (defaults to the first one)")
+        parser.add_argument(
+            "--live", action="store_true", help="Produce to the configured Kafka/Celery and Redis instead of stubs"
+        )
+
+    def handle(self, *args, **options):
+        team = Team.objects.get(pk=options["team_id"]) if options["team_id"] else Team.objects.first()
+
+        with ExitStack() as stack:
+            if not options["live"]:
+                stack.enter_context(stubbed_ingestion())
+
+            for scenario in options["scenario"] or SCENARIOS.keys():
+                payload = SCENARIOS[scenario](team)
+                allocated = allocated_bytes_per_event(payload)
+                for result in [
+                    benchmark_wsgi(payload, options["requests"], options["concurrency"]),
+                    async_to_sync(benchmark_asgi)(payload, options["requests"], options["concurrency"]),
+                ]:
+                    result = {"scenario": scenario, **result, "KiB/event": allocated / 1024}
+                    self.stdout.write(
+                        "  ".join(
+                            f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}"
+                            for key, value in result.items()
+                        )
+                    )
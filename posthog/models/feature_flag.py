@@ -1,11 +1,22 @@
 import hashlib
-from typing import Any, Dict, List, Optional, Union, cast
-
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.db import models
 from django.db.models.expressions import ExpressionWrapper, RawSQL, Subquery
 from django.db.models.fields import BooleanField
 from django.db.models.query import QuerySet
+from django.dispatch.dispatcher import receiver
 from django.utils import timezone
 from sentry_sdk.api import capture_exception
 
@@ -13,12 +24,16 @@ from posthog.models.filters.mixins.utils import cached_property
 from posthog.models.team import Team
 from posthog.models.user import User
 from posthog.queries.base import properties_to_Q
+from posthog.utils import local_cache_evict, local_cache_get, local_cache_set
 
 from .filters import Filter
 from .person import Person, PersonDistinctId
 
 __LONG_SCALE__ = float(0xFFFFFFFFFFFFFFF)
 
+# Short-lived in-process cache of active flags per "<team_id>:<distinct_id>", used when enriching captured events
+ACTIVE_FEATURE_FLAGS_CACHE: Dict[str, Tuple[float, Dict[str, Union[bool, str, None]]]] = {}
+
 
 class FeatureFlag(models.Model):
     class Meta:
@@ -99,9 +114,13 @@ class FeatureFlagOverride(models.Model):
 
 
 class FeatureFlagMatcher:
-    def __init__(self, distinct_id: str, feature_flag: FeatureFlag):
+    def __init__(
+        self, distinct_id: str, feature_flag: FeatureFlag, query_groups: Optional[List[List[bool]]] = None,
+    ):
         self.distinct_id = distinct_id
         self.feature_flag = feature_flag
+        # Group matches already fetched for a whole batch of distinct_ids, see `get_query_groups_for_distinct_ids`
+        self._prefetched_query_groups = query_groups
 
     def is_match(self):
         return any(self.is_group_match(group, index) for index, group in enumerate(self.feature_flag.groups))
@@ -144,26 +163,14 @@ class FeatureFlagMatcher:
 
     @cached_property
     def query_groups(self) -> List[List[bool]]:
+        if self._prefetched_query_groups is not None:
+            return self._prefetched_query_groups
         query: QuerySet = Person.objects.filter(
             team_id=self.feature_flag.team_id,
             persondistinctid__distinct_id=self.distinct_id,
             persondistinctid__team_id=self.feature_flag.team_id,
         )
-
-        fields = []
-        for index, group in enumerate(self.feature_flag.groups):
-            key = f"group_{index}"
-
-            if len(group.get("properties", {})) > 0:
-                expr: Any = properties_to_Q(
-                    Filter(data=group).properties, team_id=self.feature_flag.team_id, is_person_query=True
-                )
-            else:
-                expr = RawSQL("true", [])
-
-            query = query.annotate(**{key: ExpressionWrapper(expr, output_field=BooleanField())})
-            fields.append(key)
-
+        query, fields = _annotate_groups(query, self.feature_flag)
         return list(query.values_list(*fields))
 
     # This function takes a distinct_id and a feature flag key and returns a float between 0 and 1.
@@ -184,28 +191,119 @@ class FeatureFlagMatcher:
         return self.get_hash(salt="variant")
 
 
+def _annotate_groups(query: QuerySet, feature_flag: FeatureFlag) -> Tuple[QuerySet, List[str]]:
+    fields = []
+    for index, group in enumerate(feature_flag.groups):
+        key = f"group_{index}"
+
+        if len(group.get("properties", {})) > 0:
+            expr: Any = properties_to_Q(
+                Filter(data=group).properties, team_id=feature_flag.team_id, is_person_query=True
+            )
+        else:
+            expr = RawSQL("true", [])
+
+        query = query.annotate(**{key: ExpressionWrapper(expr, output_field=BooleanField())})
+        fields.append(key)
+    return query, fields
+
+
+def get_query_groups_for_distinct_ids(
+    feature_flag: FeatureFlag, distinct_ids: List[str]
+) -> Dict[str, List[List[bool]]]:
+    """
+    Matches the persons of all given distinct_ids against the flag's property groups in a single query,
+    in the shape of `FeatureFlagMatcher.query_groups` per distinct_id.
+    """
+    query: QuerySet = Person.objects.filter(
+        team_id=feature_flag.team_id,
+        persondistinctid__distinct_id__in=distinct_ids,
+        persondistinctid__team_id=feature_flag.team_id,
+    )
+    query, fields = _annotate_groups(query, feature_flag)
+    query_groups: Dict[str, List[List[bool]]] = {distinct_id: [] for distinct_id in distinct_ids}
+    for distinct_id, *groups in query.values_list("persondistinctid__distinct_id", *fields):
+        query_groups[distinct_id].append(groups)
+    return query_groups
+
+
 # Return a Dict with all active flags and their values
 def get_active_feature_flags(team: Team, distinct_id: str) -> Dict[str, Union[bool, str, None]]:
-    flags_enabled: Dict[str, Union[bool, str, None]] = {}
+    return get_active_feature_flags_for_distinct_ids(team, [distinct_id])[distinct_id]
+
+
+# Return all active flags and their values for each of the distinct_ids, evaluating every flag once for the batch
+def get_active_feature_flags_for_distinct_ids(
+    team: Team, distinct_ids: Iterable[str]
+) -> Dict[str, Dict[str, Union[bool, str, None]]]:
+    unique_distinct_ids = list(dict.fromkeys(distinct_ids))
+    flags_enabled: Dict[str, Dict[str, Union[bool, str, None]]] = {
+        distinct_id: {} for distinct_id in unique_distinct_ids
+    }
+    if not unique_distinct_ids:
+        return flags_enabled
     feature_flags = FeatureFlag.objects.filter(team=team, active=True, deleted=False).only(
         "id", "team_id", "filters", "key", "rollout_percentage",
     )
 
     for feature_flag in feature_flags:
         try:
-            if not feature_flag.distinct_id_matches(distinct_id):
-                continue
-            if len(feature_flag.variants) > 0:
-                variant = feature_flag.get_variant_for_distinct_id(distinct_id)
-                if variant is not None:
-                    flags_enabled[feature_flag.key] = variant
-            else:
-                flags_enabled[feature_flag.key] = True
+            query_groups: Dict[str, List[List[bool]]] = {}
+            if any(len(group.get("properties", [])) > 0 for group in feature_flag.groups):
+                query_groups = get_query_groups_for_distinct_ids(feature_flag, unique_distinct_ids)
+            for distinct_id in unique_distinct_ids:
+                matcher = FeatureFlagMatcher(distinct_id, feature_flag, query_groups.get(distinct_id, []))
+                if not matcher.is_match():
+                    continue
+                if len(feature_flag.variants) > 0:
+                    variant = matcher.get_matching_variant()
+                    if variant is not None:
+                        flags_enabled[distinct_id][feature_flag.key] = variant
+                else:
+                    flags_enabled[distinct_id][feature_flag.key] = True
         except Exception as err:
             capture_exception(err)
     return flags_enabled
 
 
+def get_cached_active_feature_flags_for_distinct_ids(
+    team: Team, distinct_ids: Iterable[str]
+) -> Dict[str, Dict[str, Union[bool, str, None]]]:
+    """
+    Like `get_active_feature_flags_for_distinct_ids`, but reusing results computed in this process within the last
+    `ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS`. Flag changes made in this process evict the team's entries,
+    changes to persons are only picked up once entries expire.
+    """
+    flags_enabled: Dict[str, Dict[str, Union[bool, str, None]]] = {}
+    missing_distinct_ids: List[str] = []
+    for distinct_id in dict.fromkeys(distinct_ids):
+        found, flags = local_cache_get(ACTIVE_FEATURE_FLAGS_CACHE, f"{team.pk}:{distinct_id}")
+        if found:
+            flags_enabled[distinct_id] = dict(flags)
+        else:
+            missing_distinct_ids.append(distinct_id)
+
+    if missing_distinct_ids:
+        computed = get_active_feature_flags_for_distinct_ids(team, missing_distinct_ids)
+        if settings.ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS > 0:
+            for distinct_id, flags in computed.items():
+                local_cache_set(
+                    ACTIVE_FEATURE_FLAGS_CACHE,
+                    f"{team.pk}:{distinct_id}",
+                    dict(flags),
+                    settings.ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS,
+                    settings.ACTIVE_FEATURE_FLAGS_CACHE_MAX_SIZE,
+                )
+        flags_enabled.update(computed)
+    return flags_enabled
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=FeatureFlag)
+def invalidate_active_feature_flags_cache(sender, instance: FeatureFlag, **kwargs):
+    team_prefix = f"{instance.team_id}:"
+    local_cache_evict(ACTIVE_FEATURE_FLAGS_CACHE, lambda key, _: key.startswith(team_prefix))
+
+
 # Return feature flags with per-user overrides
 def get_overridden_feature_flags(team: Team, distinct_id: str,) -> Dict[str, Union[bool, str, None]]:
     feature_flags = get_active_feature_flags(team, distinct_id)
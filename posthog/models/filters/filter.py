@@ -22,6 +22,7 @@ from posthog.models.filters.mixins.common import (
     IntervalMixin,
     LimitMixin,
     OffsetMixin,
+    SamplingFactorMixin,
     SelectorMixin,
     SessionMixin,
     ShownAsMixin,
@@ -60,6 +61,7 @@ class Filter(
     LimitMixin,
     DateMixin,
     FormulaMixin,
+    SamplingFactorMixin,
     FunnelWindowDaysMixin,
     FunnelWindowMixin,
     FunnelFromToStepsMixin,
@@ -6,6 +6,7 @@ from typing import Dict, List, Literal, Optional, Union, cast
 from dateutil.relativedelta import relativedelta
 from django.db.models.query_utils import Q
 from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 
 from posthog.constants import (
     ACTIONS,
@@ -27,6 +28,7 @@ from posthog.constants import (
     INTERVAL,
     LIMIT,
     OFFSET,
+    SAMPLING_FACTOR,
     SELECTOR,
     SESSION,
     SHOWN_AS,
@@ -109,6 +111,30 @@ class FormulaMixin(BaseParamMixin):
         return {"formula": self.formula} if self.formula else {}
 
 
+class SamplingFactorMixin(BaseParamMixin):
+    """
+    Fraction of events to compute a ClickHouse insight over, e.g. 0.1 for a tenth of them, which makes its results
+    approximate. A factor of 1 is the same as none.
+    """
+
+    @cached_property
+    def sampling_factor(self) -> Optional[float]:
+        factor_raw = self._data.get(SAMPLING_FACTOR)
+        if factor_raw is None or factor_raw == "":
+            return None
+        try:
+            factor = float(factor_raw)
+        except (TypeError, ValueError):
+            factor = float("nan")
+        if not 0 < factor <= 1:
+            raise ValidationError(f"Sampling factor must be greater than 0 and at most 1, not {factor_raw}!")
+        return factor if factor < 1 else None
+
+    @include_dict
+    def sampling_factor_to_dict(self):
+        return {"sampling_factor": self.sampling_factor} if self.sampling_factor else {}
+
+
 class BreakdownMixin(BaseParamMixin):
     def _process_breakdown_param(self, breakdown: Optional[str]) -> Optional[Union[str, List[Union[str, int]]]]:
         if not isinstance(breakdown, str):
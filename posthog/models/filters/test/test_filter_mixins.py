@@ -1,3 +1,6 @@
+from rest_framework.exceptions import ValidationError
+
+from posthog.models.filters import Filter
 from posthog.models.filters.mixins.funnel import FunnelWindowDaysMixin
 from posthog.test.base import BaseTest
 
@@ -15,3 +18,15 @@ class TestFilterMixins(BaseTest):
     def test_funnel_window_days_to_milliseconds(self):
         one_day = FunnelWindowDaysMixin.milliseconds_from_days(1)
         self.assertEqual(one_day, 86_400_000)
+
+    def test_sampling_factor(self):
+        self.assertEqual(Filter(data={"sampling_factor": "0.1"}).sampling_factor, 0.1)
+        self.assertEqual(Filter(data={"sampling_factor": 0.1}).to_dict()["sampling_factor"], 0.1)
+        # Sampling all events is the same as not sampling
+        self.assertIsNone(Filter(data={"sampling_factor": 1}).sampling_factor)
+        self.assertNotIn("sampling_factor", Filter(data={"sampling_factor": 1}).to_dict())
+        self.assertIsNone(Filter(data={}).sampling_factor)
+
+        for invalid in [0, 2, "abc", "nan", [0.1]]:
+            with self.assertRaises(ValidationError):
+                Filter(data={"sampling_factor": invalid}).sampling_factor
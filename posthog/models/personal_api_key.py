@@ -1,8 +1,58 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
 from django.db import models
+from django.dispatch.dispatcher import receiver
 from django.utils import timezone
+from sentry_sdk import capture_exception
+
+from posthog.redis import get_client, subscribe_in_background
+from posthog.utils import local_cache_evict, local_cache_get, local_cache_set
 
 from .utils import generate_random_token, generate_random_token_personal
 
+# In-process cache of SHA-256 hashed key value -> (expiry, key or None for invalid values), see `local_cache_get`
+PERSONAL_API_KEY_CACHE: Dict[str, Tuple[float, Optional["PersonalAPIKey"]]] = {}
+
+
+def hash_key_value(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class PersonalAPIKeyManager(models.Manager):
+    def get_from_value(self, value: str) -> Optional["PersonalAPIKey"]:
+        """
+        Returns the key with the given value, without its user: see `User.objects.get_from_personal_api_key`.
+        Results are cached in-process for PERSONAL_API_KEY_CACHE_TTL_SECONDS, so that frequent API calls don't look
+        the key up in Postgres every time.
+        """
+        key_hash = hash_key_value(value)
+        found, personal_api_key = False, None
+        if settings.PERSONAL_API_KEY_CACHE_TTL_SECONDS:
+            subscribe_in_background(
+                settings.PERSONAL_API_KEY_CACHE_INVALIDATION_PUBSUB_CHANNEL, _on_personal_api_key_cache_invalidation
+            )
+            found, personal_api_key = local_cache_get(PERSONAL_API_KEY_CACHE, key_hash)
+
+        if not found:
+            try:
+                personal_api_key = self.get(value=value)
+            except PersonalAPIKey.DoesNotExist:
+                personal_api_key = None
+            if settings.PERSONAL_API_KEY_CACHE_TTL_SECONDS:
+                local_cache_set(
+                    PERSONAL_API_KEY_CACHE,
+                    key_hash,
+                    personal_api_key,
+                    settings.PERSONAL_API_KEY_CACHE_TTL_SECONDS,
+                    settings.PERSONAL_API_KEY_CACHE_MAX_SIZE,
+                )
+
+        return personal_api_key
+
 
 class PersonalAPIKey(models.Model):
     id: models.CharField = models.CharField(primary_key=True, max_length=50, default=generate_random_token)
@@ -18,3 +68,45 @@ class PersonalAPIKey(models.Model):
     team = models.ForeignKey(
         "posthog.Team", on_delete=models.SET_NULL, related_name="personal_api_keys+", null=True, blank=True
     )
+
+    objects: PersonalAPIKeyManager = PersonalAPIKeyManager()
+
+    def mark_used(self) -> None:
+        """
+        Updates `last_used_at`, unless it was already updated within PERSONAL_API_KEY_LAST_USED_AT_INTERVAL_SECONDS,
+        so that frequent API calls don't write to Postgres every time.
+        """
+        now = timezone.now()
+        if self.last_used_at is not None and now - self.last_used_at < timedelta(
+            seconds=settings.PERSONAL_API_KEY_LAST_USED_AT_INTERVAL_SECONDS
+        ):
+            return
+        self.last_used_at = now
+        # Not using save() so that the cache entry (which this very instance may be) isn't invalidated
+        PersonalAPIKey.objects.filter(pk=self.pk).update(last_used_at=now)
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=PersonalAPIKey)
+def invalidate_personal_api_key_cache(sender, instance: PersonalAPIKey, **kwargs):
+    invalidate_personal_api_keys(hash_key_value(instance.value))
+
+
+def invalidate_personal_api_keys(key_hash: str) -> None:
+    """Evicts a personal API key by key hash from the caches of all workers."""
+    evict_personal_api_keys_from_cache(key_hash)
+    try:
+        get_client().publish(
+            settings.PERSONAL_API_KEY_CACHE_INVALIDATION_PUBSUB_CHANNEL, json.dumps({"key_hash": key_hash}),
+        )
+    except Exception as e:
+        # Other workers' caches expire after PERSONAL_API_KEY_CACHE_TTL_SECONDS anyway, saving mustn't depend on redis
+        capture_exception(e)
+
+
+def evict_personal_api_keys_from_cache(key_hash: str) -> None:
+    local_cache_evict(PERSONAL_API_KEY_CACHE, lambda cached_hash, personal_api_key: cached_hash == key_hash)
+
+
+def _on_personal_api_key_cache_invalidation(message: Dict[str, Any]) -> None:
+    payload = json.loads(message["data"])
+    evict_personal_api_keys_from_cache(payload["key_hash"])
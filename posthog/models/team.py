@@ -1,5 +1,6 @@
+import json
 import re
-from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import pytz
 from django.conf import settings
@@ -8,10 +9,12 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinLengthValidator
 from django.db import models
 from django.dispatch.dispatcher import receiver
+from sentry_sdk import capture_exception
 
 from posthog.constants import AvailableFeature
 from posthog.helpers.dashboard_templates import create_dashboard_from_template
-from posthog.utils import GenericEmails
+from posthog.redis import get_client, subscribe_in_background
+from posthog.utils import GenericEmails, local_cache_evict, local_cache_get, local_cache_set
 
 from .dashboard import Dashboard
 from .utils import UUIDClassicModel, generate_random_token_project, sane_repr
@@ -20,7 +23,8 @@ if TYPE_CHECKING:
     from posthog.models.organization import OrganizationMembership
     from posthog.models.user import User
 
-TEAM_CACHE: Dict[str, "Team"] = {}
+# In-process cache of api_token -> (expiry as time.monotonic(), team or None for invalid tokens), in LRU order
+TEAM_CACHE: Dict[str, Tuple[float, Optional["Team"]]] = {}
 
 TIMEZONES = [(tz, tz) for tz in pytz.common_timezones]
 
@@ -81,6 +85,32 @@ class TeamManager(models.Manager):
         except Team.DoesNotExist:
             return None
 
+    def get_team_from_cache(self, token: str) -> Tuple[bool, Optional["Team"]]:
+        """Cache-only part of `get_team_from_cache_or_token`, never touches the database. Returns (found, team)."""
+        if not settings.TEAM_CACHE_TTL_SECONDS:
+            return False, None
+        subscribe_in_background(settings.TEAM_CACHE_INVALIDATION_PUBSUB_CHANNEL, _on_team_cache_invalidation)
+        return local_cache_get(TEAM_CACHE, token)
+
+    def get_team_from_cache_or_token(self, token: Optional[str]) -> Optional["Team"]:
+        """
+        Same as `get_team_from_token`, but cached in-process for TEAM_CACHE_TTL_SECONDS (including invalid tokens).
+        Meant for the hot ingestion endpoints – the returned Team is shared between requests, so don't modify it.
+        """
+        if not token:
+            return None
+        if not settings.TEAM_CACHE_TTL_SECONDS:
+            return self.get_team_from_token(token)
+
+        found, team = self.get_team_from_cache(token)
+        if found:
+            return team
+
+        team = self.get_team_from_token(token)
+        ttl = settings.TEAM_CACHE_TTL_SECONDS if team is not None else settings.TEAM_CACHE_NEGATIVE_TTL_SECONDS
+        local_cache_set(TEAM_CACHE, token, team, ttl, settings.TEAM_CACHE_MAX_SIZE)
+        return team
+
 
 def get_default_data_attributes() -> Any:
     return ["data-attr"]
@@ -172,3 +202,28 @@ class Team(UUIDClassicModel):
 def team_deleted(sender, instance, **kwargs):
     instance.event_set.all().delete()
     instance.elementgroup_set.all().delete()
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=Team)
+def invalidate_team_cache(sender, instance: Team, **kwargs):
+    evict_team_from_cache(instance.pk, instance.api_token)
+    try:
+        get_client().publish(
+            settings.TEAM_CACHE_INVALIDATION_PUBSUB_CHANNEL,
+            json.dumps({"team_id": instance.pk, "api_token": instance.api_token}),
+        )
+    except Exception as e:
+        # Other workers' caches expire after TEAM_CACHE_TTL_SECONDS anyway, saving mustn't depend on redis
+        capture_exception(e)
+
+
+def evict_team_from_cache(team_id: Optional[int], api_token: str) -> None:
+    # The token may have just been reset, so entries under the previous token have to go too
+    local_cache_evict(
+        TEAM_CACHE, lambda token, team: token == api_token or (team is not None and team.pk == team_id),
+    )
+
+
+def _on_team_cache_invalidation(message: Dict[str, Any]) -> None:
+    payload = json.loads(message["data"])
+    evict_team_from_cache(payload["team_id"], payload["api_token"])
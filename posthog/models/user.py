@@ -3,7 +3,6 @@ from typing import Any, Callable, Dict, List, Optional, Tuple
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models, transaction
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import ValidationError
 
@@ -73,16 +72,15 @@ class UserManager(BaseUserManager):
             return user
 
     def get_from_personal_api_key(self, key_value: str) -> Optional["User"]:
-        try:
-            personal_api_key: PersonalAPIKey = (
-                PersonalAPIKey.objects.select_related("user").filter(user__is_active=True).get(value=key_value)
-            )
-        except PersonalAPIKey.DoesNotExist:
+        personal_api_key = PersonalAPIKey.objects.get_from_value(key_value)
+        if personal_api_key is None:
+            return None
+        # Only the key is cached. The user is loaded every time, so that changes to it or its memberships apply at once
+        user = self.filter(pk=personal_api_key.user_id, is_active=True).first()
+        if user is None:
             return None
-        else:
-            personal_api_key.last_used_at = timezone.now()
-            personal_api_key.save()
-            return personal_api_key.user
+        personal_api_key.mark_used()
+        return user
 
 
 def events_column_config_default() -> Dict[str, Any]:
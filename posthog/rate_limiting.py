@@ -0,0 +1,105 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from django.conf import settings
+from sentry_sdk import capture_exception
+
+from posthog.redis import get_client
+
+CAPTURE_RATE_LIMIT_KEY_PREFIX = "capture_rate_limit/"
+
+
+@dataclass
+class _LocalBucket:
+    pending: int = 0  # Events consumed in this process since the last sync
+    synced_at: float = float("-inf")
+    limited_until: float = float("-inf")
+
+
+_local_buckets: Dict[int, _LocalBucket] = {}
+_local_buckets_lock = threading.Lock()
+_in_flight_requests = 0
+_in_flight_requests_lock = threading.Lock()
+
+
+def get_capture_rate_limit_retry_after(team_id: int, event_count: int) -> Optional[float]:
+    """
+    Consumes `event_count` tokens from the team's bucket, refilled at CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND up to
+    CAPTURE_RATE_LIMIT_BURST. Returns the number of seconds to retry after if the team is over its limit.
+
+    Buckets are shared by all processes through Redis, but each process only adds up its consumption locally and
+    syncs every CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS per team, so a limit can be exceeded by that much traffic.
+    """
+    rate = settings.CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND
+    if rate <= 0:
+        return None
+
+    now = time.monotonic()
+    with _local_buckets_lock:
+        bucket = _local_buckets.setdefault(team_id, _LocalBucket())
+        if bucket.limited_until > now:
+            return bucket.limited_until - now
+        bucket.pending += event_count
+        if now - bucket.synced_at < settings.CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS:
+            return None
+        consumed, bucket.pending = bucket.pending, 0
+        bucket.synced_at = now
+
+    try:
+        tokens = _take_tokens(team_id, consumed, rate, settings.CAPTURE_RATE_LIMIT_BURST)
+    except Exception as e:
+        # Rather let everything through than stop ingestion when Redis is unavailable
+        capture_exception(e)
+        return None
+
+    if tokens < 0:
+        with _local_buckets_lock:
+            bucket.limited_until = now + -tokens / rate
+    return None
+
+
+def _take_tokens(team_id: int, count: int, rate: float, burst: int) -> float:
+    """Refills the team's bucket in Redis and takes `count` tokens from it, returning how many are left."""
+    key = f"{CAPTURE_RATE_LIMIT_KEY_PREFIX}{team_id}"
+
+    def _update(pipe) -> float:
+        tokens, updated_at = pipe.hmget(key, "tokens", "updated_at")
+        now = time.time()
+        if tokens is None or updated_at is None:
+            available = float(burst)
+        else:
+            available = min(float(burst), float(tokens) + max(now - float(updated_at), 0) * rate)
+        # Not going below -burst bounds how long a team can be locked out after a spike
+        remaining = max(available - count, -float(burst))
+        pipe.multi()
+        pipe.hmset(key, {"tokens": remaining, "updated_at": now})
+        pipe.expire(key, int(2 * burst / rate) + 60)
+        return remaining
+
+    return get_client().transaction(_update, key, value_from_callable=True)
+
+
+def reset_capture_rate_limits() -> None:
+    with _local_buckets_lock:
+        _local_buckets.clear()
+
+
+def acquire_in_flight_request() -> bool:
+    """
+    Counts a capture request as in progress in this process, unless CAPTURE_MAX_IN_FLIGHT_REQUESTS are already.
+    Every successful call has to be followed by `release_in_flight_request`.
+    """
+    global _in_flight_requests
+    with _in_flight_requests_lock:
+        if 0 < settings.CAPTURE_MAX_IN_FLIGHT_REQUESTS <= _in_flight_requests:
+            return False
+        _in_flight_requests += 1
+        return True
+
+
+def release_in_flight_request() -> None:
+    global _in_flight_requests
+    with _in_flight_requests_lock:
+        _in_flight_requests -= 1
@@ -1,10 +1,13 @@
-from typing import Optional
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import redis
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from sentry_sdk import capture_exception
 
 _client = None  # type: Optional[redis.Redis]
+_subscriptions: Dict[Tuple[str, int], Any] = {}
 
 
 def get_client() -> redis.Redis:
@@ -24,3 +27,21 @@ def get_client() -> redis.Redis:
         raise ImproperlyConfigured("Redis not configured!")
 
     return _client
+
+
+def subscribe_in_background(channel: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    Calls `handler` with every message published to `channel`, from a daemon thread.
+    Safe to call repeatedly – each process (forked workers included) subscribes only once.
+    """
+    key = (channel, os.getpid())
+    if key in _subscriptions:
+        return
+
+    try:
+        pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: handler})
+        _subscriptions[key] = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    except Exception as e:
+        _subscriptions[key] = None  # Don't retry on every call, messages are an optimization only
+        capture_exception(e)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import json
 import os
 import sys
 from datetime import timedelta
@@ -176,6 +177,38 @@ CLICKHOUSE_CONN_POOL_MAX = get_from_env("CLICKHOUSE_CONN_POOL_MAX", 1000, type_c
 
 CLICKHOUSE_STABLE_HOST = get_from_env("CLICKHOUSE_STABLE_HOST", CLICKHOUSE_HOST)
 
+# Replicas to spread read queries across, comma-separated. Inserts and other statements always go to CLICKHOUSE_HOST
+CLICKHOUSE_READ_HOSTS = get_list(os.getenv("CLICKHOUSE_READ_HOSTS", ""))
+# How long a replica that couldn't be connected to is left out of read queries for
+CLICKHOUSE_REPLICA_FAILURE_COOLDOWN_SECONDS = get_from_env(
+    "CLICKHOUSE_REPLICA_FAILURE_COOLDOWN_SECONDS", 30, type_cast=int
+)
+# Mutations, e.g. materialized column backfills, get connections of their own, so they can't use up those for queries
+CLICKHOUSE_MUTATIONS_CONN_POOL_MAX = get_from_env("CLICKHOUSE_MUTATIONS_CONN_POOL_MAX", 10, type_cast=int)
+
+# Overrides of ClickHouse settings by query profile as JSON, see QUERY_PROFILES in ee/clickhouse/query_profiles.py
+CLICKHOUSE_QUERY_PROFILES = get_from_env("CLICKHOUSE_QUERY_PROFILES", {}, type_cast=json.loads)
+
+# How many queries of an insight, e.g. one per series, can run at once in a process. 1 runs them one after another
+CLICKHOUSE_MAX_CONCURRENT_QUERIES = get_from_env("CLICKHOUSE_MAX_CONCURRENT_QUERIES", 10, type_cast=int)
+
+# Identical read queries of query profiles, e.g. insights, running at the same time across all processes are only run
+# once, with the others waiting up to this long for the result before running it themselves. 0 disables deduplication
+CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS = get_from_env(
+    "CLICKHOUSE_SINGLE_FLIGHT_TIMEOUT_SECONDS", 0 if TEST else 60, type_cast=int
+)
+
+# How long results of event property values and custom events queries are cached in Redis. 0 disables the cache
+CLICKHOUSE_VALUES_CACHE_TTL_SECONDS = get_from_env(
+    "CLICKHOUSE_VALUES_CACHE_TTL_SECONDS", 0 if TEST else 60, type_cast=int
+)
+
+# Relative date bounds with a time part, e.g. `-24h` or hourly insights up to now, are rounded to this many seconds,
+# so that the same insight requested within that window runs the same query and shares its cache entries
+CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS = get_from_env(
+    "CLICKHOUSE_QUERY_TIME_GRANULARITY_SECONDS", 0 if TEST else 60, type_cast=int
+)
+
 _clickhouse_http_protocol = "http://"
 _clickhouse_http_port = "8123"
 if CLICKHOUSE_SECURE:
@@ -191,6 +224,15 @@ KAFKA_URL = os.getenv("KAFKA_URL", "kafka://kafka")
 KAFKA_HOSTS_LIST = [urlparse(host).netloc for host in KAFKA_URL.split(",")]
 KAFKA_HOSTS = ",".join(KAFKA_HOSTS_LIST)
 KAFKA_BASE64_KEYS = get_from_env("KAFKA_BASE64_KEYS", False, type_cast=str_to_bool)
+# Producer batching, used to cut down broker requests for batched capture traffic.
+# See https://kafka-python.readthedocs.io/en/2.0.1/apidoc/KafkaProducer.html for what these do
+KAFKA_PRODUCER_LINGER_MS = get_from_env("KAFKA_PRODUCER_LINGER_MS", 0, type_cast=int)
+KAFKA_PRODUCER_BATCH_SIZE = get_from_env("KAFKA_PRODUCER_BATCH_SIZE", 16384, type_cast=int)
+# One of "gzip", "snappy" or "lz4" – unset means no compression
+KAFKA_PRODUCER_COMPRESSION_TYPE = get_from_env("KAFKA_PRODUCER_COMPRESSION_TYPE", optional=True)
+# How capture encodes messages to the plugin server ingestion topic: "json", with the event JSON-encoded again inside,
+# or "protobuf", an ingestion_event.proto envelope (ee/idl) carrying the event JSON once. Consumers must support it
+KAFKA_EVENTS_PLUGIN_INGESTION_ENCODING = os.getenv("KAFKA_EVENTS_PLUGIN_INGESTION_ENCODING", "json")
 
 _primary_db = os.getenv("PRIMARY_DB", "postgres")
 PRIMARY_DB: AnalyticsDBMS
@@ -212,6 +254,49 @@ UPDATE_CACHED_DASHBOARD_ITEMS_INTERVAL_SECONDS = get_from_env(
     "UPDATE_CACHED_DASHBOARD_ITEMS_INTERVAL_SECONDS", 90, type_cast=int
 )
 
+# In-process cache of project API tokens used by capture and /decide. 0 disables the cache
+TEAM_CACHE_TTL_SECONDS = get_from_env("TEAM_CACHE_TTL_SECONDS", 0 if TEST else 300, type_cast=int)
+TEAM_CACHE_NEGATIVE_TTL_SECONDS = get_from_env("TEAM_CACHE_NEGATIVE_TTL_SECONDS", 30, type_cast=int)
+TEAM_CACHE_MAX_SIZE = get_from_env("TEAM_CACHE_MAX_SIZE", 10000, type_cast=int)
+TEAM_CACHE_INVALIDATION_PUBSUB_CHANNEL = os.getenv("TEAM_CACHE_INVALIDATION_PUBSUB_CHANNEL", "invalidate-team-cache")
+
+# In-process cache of personal API keys, keyed by their hash. 0 disables the cache
+PERSONAL_API_KEY_CACHE_TTL_SECONDS = get_from_env(
+    "PERSONAL_API_KEY_CACHE_TTL_SECONDS", 0 if TEST else 300, type_cast=int
+)
+PERSONAL_API_KEY_CACHE_MAX_SIZE = get_from_env("PERSONAL_API_KEY_CACHE_MAX_SIZE", 10000, type_cast=int)
+PERSONAL_API_KEY_CACHE_INVALIDATION_PUBSUB_CHANNEL = os.getenv(
+    "PERSONAL_API_KEY_CACHE_INVALIDATION_PUBSUB_CHANNEL", "invalidate-personal-api-key-cache"
+)
+# How often at most to write a personal API key's last_used_at
+PERSONAL_API_KEY_LAST_USED_AT_INTERVAL_SECONDS = get_from_env(
+    "PERSONAL_API_KEY_LAST_USED_AT_INTERVAL_SECONDS", 60, type_cast=int
+)
+
+# In-process cache of the flags active for each distinct_id, used to enrich web events at capture. 0 disables the cache
+ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS = get_from_env(
+    "ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS", 0 if TEST else 10, type_cast=int
+)
+ACTIVE_FEATURE_FLAGS_CACHE_MAX_SIZE = get_from_env("ACTIVE_FEATURE_FLAGS_CACHE_MAX_SIZE", 50000, type_cast=int)
+
+# Per-team token bucket of events accepted by capture, shared between processes through Redis. 0 disables the limit
+CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND = get_from_env("CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND", 0, type_cast=float)
+CAPTURE_RATE_LIMIT_BURST = get_from_env("CAPTURE_RATE_LIMIT_BURST", 10000, type_cast=int)
+# How often each process adds the events it accepted to the shared buckets, per team
+CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS = get_from_env("CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS", 1, type_cast=float)
+# Capture responds 429 once a process has this many requests in progress, or this many messages not yet acknowledged
+# by Kafka. 0 disables the respective limit
+CAPTURE_MAX_IN_FLIGHT_REQUESTS = get_from_env("CAPTURE_MAX_IN_FLIGHT_REQUESTS", 0, type_cast=int)
+CAPTURE_MAX_PENDING_KAFKA_MESSAGES = get_from_env("CAPTURE_MAX_PENDING_KAFKA_MESSAGES", 0, type_cast=int)
+CAPTURE_LOAD_SHEDDING_RETRY_AFTER_SECONDS = get_from_env("CAPTURE_LOAD_SHEDDING_RETRY_AFTER_SECONDS", 5, type_cast=int)
+
+# Format session recording snapshots are compressed to at capture: "gzip-base64" or "zstd-base64" (UTF-8 JSON, smaller
+# and cheaper to compress). Switch only once all instances reading recordings can decompress the new format
+SESSION_RECORDING_COMPRESSION = os.getenv("SESSION_RECORDING_COMPRESSION", "gzip-base64")
+# Number of processes compressing session recordings after capture has responded, off the GIL of the web server.
+# 0 compresses in the request thread before responding
+SESSION_RECORDING_COMPRESSION_WORKERS = get_from_env("SESSION_RECORDING_COMPRESSION_WORKERS", 0, type_cast=int)
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
@@ -309,6 +394,13 @@ CORS_ORIGIN_ALLOW_ALL = True
 
 # Max size of a POST body (for event ingestion)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 20971520  # 20 MB
+# Limit for compressed capture payloads once decompressed, to protect against zip bombs
+DATA_UPLOAD_MAX_DECOMPRESSED_SIZE = get_from_env(
+    "DATA_UPLOAD_MAX_DECOMPRESSED_SIZE", 5 * DATA_UPLOAD_MAX_MEMORY_SIZE, type_cast=int
+)
+
+# Whether to route capture requests to the async view – only set this when serving posthog.asgi
+CAPTURE_ASYNC = get_from_env("CAPTURE_ASYNC", False, type_cast=str_to_bool)
 
 ROOT_URLCONF = "posthog.urls"
 
@@ -2,7 +2,17 @@ import importlib
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from contextlib import nullcontext
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 from celery import group
 from dateutil.relativedelta import relativedelta
@@ -50,6 +60,7 @@ if is_clickhouse_enabled():
     )
     from ee.clickhouse.queries.sessions.clickhouse_sessions import ClickhouseSessions
     from ee.clickhouse.queries.trends.clickhouse_trends import ClickhouseTrends
+    from ee.clickhouse.query_profiles import query_profile
 
     CACHE_TYPE_TO_INSIGHT_CLASS = {
         CacheType.TRENDS: ClickhouseTrends,
@@ -58,6 +69,12 @@ if is_clickhouse_enabled():
         CacheType.RETENTION: ClickhouseRetention,
         CacheType.PATHS: ClickhousePaths,
     }
+    CACHE_TYPE_TO_QUERY_PROFILE = {
+        CacheType.TRENDS: "trends",
+        CacheType.STICKINESS: "trends",
+        CacheType.FUNNEL: "funnels",
+        CacheType.PATHS: "paths",
+    }
 else:
     from posthog.queries.funnel import Funnel
     from posthog.queries.paths import Paths
@@ -80,15 +97,22 @@ def update_cache_item(key: str, cache_type: CacheType, payload: dict) -> None:
     filter_dict = json.loads(payload["filter"])
     team_id = int(payload["team_id"])
     filter = get_filter(data=filter_dict, team=Team(pk=team_id))
-    if cache_type == CacheType.FUNNEL:
-        result = _calculate_funnel(filter, key, team_id)
-    else:
-        result = _calculate_by_filter(filter, key, team_id, cache_type)
+    with _query_profile(cache_type):
+        if cache_type == CacheType.FUNNEL:
+            result = _calculate_funnel(filter, key, team_id)
+        else:
+            result = _calculate_by_filter(filter, key, team_id, cache_type)
 
     if result:
         cache.set(key, {"result": result, "type": cache_type, "last_refresh": timezone.now()}, CACHED_RESULTS_TTL)
 
 
+def _query_profile(cache_type: CacheType) -> ContextManager:
+    if not is_clickhouse_enabled():
+        return nullcontext()
+    return query_profile(CACHE_TYPE_TO_QUERY_PROFILE.get(cache_type, "default"))
+
+
 def update_dashboard_items_cache(dashboard: Dashboard) -> None:
     for item in DashboardItem.objects.filter(dashboard=dashboard, filters__isnull=False).exclude(filters={}):
         update_dashboard_item_cache(item, dashboard)
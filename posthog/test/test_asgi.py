@@ -0,0 +1,41 @@
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from posthog import asgi
+
+
+def _call(path: str):
+    scope = {"type": "http", "method": "POST", "path": path}
+    with patch.object(asgi, "capture_application", AsyncMock()) as capture_application, patch.object(
+        asgi, "django_application", AsyncMock()
+    ) as django_application:
+        async_to_sync(asgi.application)(scope, AsyncMock(), AsyncMock())
+    return capture_application, django_application
+
+
+class TestASGI(SimpleTestCase):
+    @override_settings(CAPTURE_ASYNC=True)
+    def test_capture_skips_middleware(self):
+        for path in ["/e/", "/e", "/batch/", "/capture/", "/track/", "/engage/"]:
+            capture_application, django_application = _call(path)
+            self.assertEqual(capture_application.call_count, 1, path)
+            django_application.assert_not_called()
+
+    @override_settings(CAPTURE_ASYNC=True)
+    def test_other_paths_go_through_middleware(self):
+        for path in ["/decide/", "/s/", "/api/event/", "/e/x", "/events"]:
+            capture_application, django_application = _call(path)
+            capture_application.assert_not_called()
+            self.assertEqual(django_application.call_count, 1, path)
+
+    @override_settings(CAPTURE_ASYNC=False)
+    def test_capture_goes_through_middleware_without_capture_async(self):
+        capture_application, django_application = _call("/e/")
+        capture_application.assert_not_called()
+        self.assertEqual(django_application.call_count, 1)
+
+    def test_capture_handler_has_no_middleware(self):
+        self.assertEqual(asgi.capture_application._view_middleware, [])
+        self.assertEqual(asgi.capture_application._exception_middleware, [])
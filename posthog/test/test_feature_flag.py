@@ -1,4 +1,13 @@
+from unittest.mock import patch
+
+from django.test import override_settings
+
 from posthog.models import Cohort, FeatureFlag, Person
+from posthog.models.feature_flag import (
+    get_active_feature_flags,
+    get_active_feature_flags_for_distinct_ids,
+    get_cached_active_feature_flags_for_distinct_ids,
+)
 from posthog.test.base import BaseTest
 
 
@@ -130,6 +139,46 @@ class TestFeatureFlag(BaseTest):
         self.assertTrue(feature_flag.distinct_id_matches("example_id"))
         self.assertFalse(feature_flag.distinct_id_matches("another_id"))
 
+    def test_active_feature_flags_for_distinct_ids(self):
+        Person.objects.create(team=self.team, distinct_ids=["example_id"], properties={"email": "tim@posthog.com"})
+        Person.objects.create(team=self.team, distinct_ids=["another_id"], properties={"email": "example@example.com"})
+        self.create_feature_flag(filters={"groups": [{"properties": [{"key": "email", "value": "tim@posthog.com"}]}]})
+        FeatureFlag.objects.create(
+            team=self.team, key="half", created_by=self.user, filters={"groups": [{"rollout_percentage": 50}]}
+        )
+        distinct_ids = ["example_id", "another_id", "false_id", "example_id"]
+
+        # One query for the flags and one for the persons matching the property flag, regardless of batch size
+        with self.assertNumQueries(2):
+            flags = get_active_feature_flags_for_distinct_ids(self.team, distinct_ids)
+
+        self.assertEqual(
+            flags, {distinct_id: get_active_feature_flags(self.team, distinct_id) for distinct_id in flags}
+        )
+        self.assertEqual(list(flags.keys()), ["example_id", "another_id", "false_id"])
+        self.assertTrue(flags["example_id"]["beta-feature"])
+        self.assertNotIn("beta-feature", flags["another_id"])
+
+    @override_settings(ACTIVE_FEATURE_FLAGS_CACHE_TTL_SECONDS=60)
+    @patch("posthog.models.feature_flag.ACTIVE_FEATURE_FLAGS_CACHE", {})
+    def test_cached_active_feature_flags(self):
+        feature_flag = self.create_feature_flag()
+
+        self.assertEqual(
+            get_cached_active_feature_flags_for_distinct_ids(self.team, ["example_id"]),
+            {"example_id": {"beta-feature": True}},
+        )
+        with self.assertNumQueries(1):
+            flags = get_cached_active_feature_flags_for_distinct_ids(self.team, ["example_id", "another_id"])
+        self.assertEqual(flags, {"example_id": {"beta-feature": True}, "another_id": {"beta-feature": True}})
+
+        # Changing a flag evicts the team's cached results
+        feature_flag.active = False
+        feature_flag.save()
+        self.assertEqual(
+            get_cached_active_feature_flags_for_distinct_ids(self.team, ["example_id"]), {"example_id": {}},
+        )
+
     def create_feature_flag(self, **kwargs):
         return FeatureFlag.objects.create(
             team=self.team, name="Beta feature", key="beta-feature", created_by=self.user, **kwargs
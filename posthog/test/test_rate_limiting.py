@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from posthog.rate_limiting import (
+    acquire_in_flight_request,
+    get_capture_rate_limit_retry_after,
+    release_in_flight_request,
+    reset_capture_rate_limits,
+)
+from posthog.redis import get_client
+
+
+@override_settings(
+    CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND=10, CAPTURE_RATE_LIMIT_BURST=20, CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS=0
+)
+class TestCaptureRateLimit(TestCase):
+    def setUp(self):
+        super().setUp()
+        get_client().flushdb()
+        reset_capture_rate_limits()
+
+    def test_limits_team_over_its_bucket(self):
+        with patch("time.time", return_value=1000), patch("time.monotonic", return_value=1000):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 15))
+            # This request empties the bucket, so it's still accepted, but the next ones aren't
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 15))
+            self.assertEqual(get_capture_rate_limit_retry_after(1, 1), 1)
+            # Other teams have buckets of their own
+            self.assertIsNone(get_capture_rate_limit_retry_after(2, 15))
+
+        with patch("time.time", return_value=1001.5), patch("time.monotonic", return_value=1001.5):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 1))
+
+    def test_buckets_are_shared_between_processes(self):
+        with patch("time.time", return_value=1000), patch("time.monotonic", return_value=1000):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 25))
+            reset_capture_rate_limits()  # As if another process
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 1))
+            self.assertAlmostEqual(get_capture_rate_limit_retry_after(1, 1), 0.6)  # type: ignore
+
+    @override_settings(CAPTURE_RATE_LIMIT_SYNC_INTERVAL_SECONDS=10)
+    def test_consumption_is_synced_in_intervals(self):
+        with patch("time.time", return_value=1000), patch("time.monotonic", return_value=1000):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 1))
+            for _ in range(5):
+                self.assertIsNone(get_capture_rate_limit_retry_after(1, 10))
+
+        with patch("time.time", return_value=1010), patch("time.monotonic", return_value=1010):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 1))
+            self.assertIsNotNone(get_capture_rate_limit_retry_after(1, 1))
+
+    @override_settings(CAPTURE_RATE_LIMIT_EVENTS_PER_SECOND=0)
+    def test_disabled(self):
+        for _ in range(5):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 100))
+
+    def test_redis_errors_let_events_through(self):
+        with patch("posthog.rate_limiting._take_tokens", side_effect=ConnectionError):
+            self.assertIsNone(get_capture_rate_limit_retry_after(1, 100))
+
+
+class TestInFlightRequests(TestCase):
+    @override_settings(CAPTURE_MAX_IN_FLIGHT_REQUESTS=2)
+    def test_in_flight_requests_limit(self):
+        self.assertTrue(acquire_in_flight_request())
+        self.assertTrue(acquire_in_flight_request())
+        self.assertFalse(acquire_in_flight_request())
+        release_in_flight_request()
+        self.assertTrue(acquire_in_flight_request())
+        release_in_flight_request()
+        release_in_flight_request()
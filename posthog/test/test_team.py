@@ -1,9 +1,11 @@
+import json
 import random
 from unittest import mock
 
 from django.conf import settings
 
 from posthog.models import EventDefinition, Organization, PluginConfig, PropertyDefinition, Team, User
+from posthog.models.team import _on_team_cache_invalidation
 from posthog.plugins.test.mock import mocked_plugin_requests_get
 
 from .base import BaseTest
@@ -57,3 +59,63 @@ class TestTeam(BaseTest):
         self.assertEqual(PluginConfig.objects.filter(team=new_team, enabled=True).count(), 1)
         self.assertEqual(PluginConfig.objects.filter(team=new_team, enabled=True).get().plugin.name, "helloworldplugin")
         self.assertEqual(mock_get.call_count, 2)
+
+    @mock.patch("posthog.models.team.TEAM_CACHE", {})
+    def test_get_team_from_cache_or_token(self):
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60):
+            with self.assertNumQueries(1):
+                self.assertEqual(Team.objects.get_team_from_cache_or_token(self.team.api_token), self.team)
+            with self.assertNumQueries(0):
+                self.assertEqual(Team.objects.get_team_from_cache_or_token(self.team.api_token), self.team)
+
+            # Invalid tokens are cached too
+            with self.assertNumQueries(1):
+                self.assertIsNone(Team.objects.get_team_from_cache_or_token("invalid"))
+            with self.assertNumQueries(0):
+                self.assertIsNone(Team.objects.get_team_from_cache_or_token("invalid"))
+
+    @mock.patch("posthog.models.team.TEAM_CACHE", {})
+    def test_team_cache_is_evicted_on_save(self):
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60):
+            Team.objects.get_team_from_cache_or_token(self.team.api_token)
+            old_token = self.team.api_token
+            self.team.api_token = "new_token_after_reset"
+            self.team.save()
+
+            with self.assertNumQueries(1):
+                self.assertIsNone(Team.objects.get_team_from_cache_or_token(old_token))
+            with self.assertNumQueries(1):
+                self.assertEqual(Team.objects.get_team_from_cache_or_token("new_token_after_reset"), self.team)
+
+    @mock.patch("posthog.models.team.TEAM_CACHE", {})
+    def test_team_cache_is_evicted_on_invalidation_from_other_worker(self):
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60):
+            Team.objects.get_team_from_cache_or_token(self.team.api_token)
+            _on_team_cache_invalidation(
+                {"data": json.dumps({"team_id": self.team.pk, "api_token": self.team.api_token}).encode()}
+            )
+
+            with self.assertNumQueries(1):
+                Team.objects.get_team_from_cache_or_token(self.team.api_token)
+
+    @mock.patch("posthog.models.team.TEAM_CACHE", {})
+    def test_team_cache_is_bounded(self):
+        with self.settings(TEAM_CACHE_TTL_SECONDS=60, TEAM_CACHE_MAX_SIZE=2):
+            for token in ["a", "b", "c"]:
+                Team.objects.get_team_from_cache_or_token(token)
+
+            with self.assertNumQueries(0):
+                Team.objects.get_team_from_cache_or_token("c")
+            with self.assertNumQueries(1):
+                Team.objects.get_team_from_cache_or_token("a")
+
+    @mock.patch("posthog.models.team.capture_exception")
+    @mock.patch("posthog.models.team.get_client")
+    def test_team_can_be_saved_without_redis(self, mock_get_client, mock_capture_exception):
+        mock_get_client.return_value.publish.side_effect = ConnectionError
+
+        self.team.name = "Saved anyway"
+        self.team.save()
+
+        self.assertEqual(Team.objects.get(pk=self.team.pk).name, "Saved anyway")
+        mock_capture_exception.assert_called_once()
@@ -1,9 +1,17 @@
+import gzip
+import random
+import string
+
+import lzstring
 from django.test import TestCase
 from freezegun import freeze_time
 
+from posthog.exceptions import RequestParsingError
 from posthog.models import EventDefinition
 from posthog.test.base import BaseTest
 from posthog.utils import (
+    decompress_gzip,
+    decompress_lz64,
     get_available_timezones_with_offsets,
     get_default_event_name,
     mask_email_address,
@@ -29,6 +37,68 @@ class TestGeneralUtils(TestCase):
         self.assertEqual(timezones.get("Europe/Moscow"), 3)
 
 
+class TestDecompressGzip(TestCase):
+    def test_decompress_in_chunks(self):
+        compressed = gzip.compress(b"foo" * 10000)
+        chunks = [compressed[i : i + 10] for i in range(0, len(compressed), 10)]
+        self.assertEqual(decompress_gzip(chunks, 30000), b"foo" * 10000)
+
+    def test_decompress_multiple_members(self):
+        self.assertEqual(decompress_gzip([gzip.compress(b"foo") + gzip.compress(b"bar")], 100), b"foobar")
+
+    def test_decompress_over_max_size(self):
+        with self.assertRaises(RequestParsingError):
+            decompress_gzip([gzip.compress(b"0" * 1_000_000)], 1000)
+
+    def test_decompress_truncated(self):
+        with self.assertRaises(RequestParsingError):
+            decompress_gzip([gzip.compress(b"foo")[:-5]], 100)
+
+
+class TestDecompressLz64(TestCase):
+    def test_decompress(self):
+        data = '{"event": "$pageview", "properties": {"$current_url": "https://example.com/ä"}}' * 100
+        self.assertEqual(decompress_lz64(lzstring.LZString().compressToBase64(data), len(data)), data)
+
+    def test_decompress_over_max_size(self):
+        # Fails while decompressing, before the (much larger) output is all in memory
+        with self.assertRaises(RequestParsingError):
+            decompress_lz64(lzstring.LZString().compressToBase64("0" * 1_000_000), 1000)
+
+    def test_decompress_invalid(self):
+        for data in ["", "!!!", "Zm9v"]:
+            with self.assertRaises(RequestParsingError):
+                decompress_lz64(data, 100)
+
+    def test_decompress_same_as_lzstring(self):
+        # Differential test against the lzstring package, on valid, truncated, corrupted and random inputs
+        rng = random.Random(0)
+        alphabet = lzstring.keyStrBase64[:64]
+        inputs = []
+        for _ in range(300):
+            text = "".join(rng.choice(string.printable + "éü中") for _ in range(rng.randint(1, 300)))
+            compressed = lzstring.LZString().compressToBase64(text)
+            index = rng.randrange(len(compressed))
+            inputs += [
+                compressed,
+                compressed[:-1],
+                compressed[: rng.randint(1, len(compressed))],
+                compressed[:index] + rng.choice(alphabet) + compressed[index + 1 :],
+                "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60))),
+            ]
+
+        for data in inputs:
+            try:
+                expected = lzstring.LZString().decompressFromBase64(data) or None
+            except Exception:
+                expected = None
+            try:
+                result = decompress_lz64(data, 1_000_000)
+            except RequestParsingError:
+                result = None
+            self.assertEqual(result, expected, data)
+
+
 class TestRelativeDateParse(TestCase):
     @freeze_time("2020-01-31T12:22:23")
     def test_hour(self):
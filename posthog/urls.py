@@ -76,6 +76,9 @@ def opt_slash_path(route: str, view: Callable, name: Optional[str] = None) -> UR
     return re_path(fr"^{route}/?(?:[?#].*)?$", view, name=name)  # type: ignore
 
 
+# The async capture view only makes sense when served by ASGI (posthog.asgi)
+capture_view = capture.get_event_async if settings.CAPTURE_ASYNC else capture.get_event
+
 urlpatterns = [
     # internals
     opt_slash_path("_health", health),
@@ -99,12 +102,12 @@ urlpatterns = [
     re_path(r"^demo.*", login_required(demo)),
     # ingestion
     opt_slash_path("decide", decide.get_decide),
-    opt_slash_path("e", capture.get_event),
-    opt_slash_path("engage", capture.get_event),
-    opt_slash_path("track", capture.get_event),
-    opt_slash_path("capture", capture.get_event),
-    opt_slash_path("batch", capture.get_event),
-    opt_slash_path("s", capture.get_event),  # session recordings
+    opt_slash_path("e", capture_view),
+    opt_slash_path("engage", capture_view),
+    opt_slash_path("track", capture_view),
+    opt_slash_path("capture", capture_view),
+    opt_slash_path("batch", capture_view),
+    opt_slash_path("s", capture_view),  # session recordings
     # auth
     path("logout", authentication.logout, name="login"),
     path("signup/finish/", signup.finish_social_signup, name="signup_finish"),
@@ -1,7 +1,6 @@
 import base64
 import datetime
 import datetime as dt
-import gzip
 import hashlib
 import json
 import os
@@ -9,13 +8,17 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 import uuid
+import zlib
 from itertools import count
 from typing import (
     Any,
+    Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     Mapping,
     Optional,
@@ -375,12 +378,149 @@ def base64_decode(data):
     return data.decode("utf8", "surrogatepass").encode("utf-16", "surrogatepass")
 
 
+def decompress_gzip(chunks: Iterable[bytes], max_size: int) -> bytearray:
+    """
+    Incrementally decompresses (possibly multi-member) gzip data, failing as soon as the output exceeds `max_size`
+    bytes. Neither the whole compressed input nor an arbitrarily large output (zip bomb) is ever held in memory.
+    """
+    output = bytearray()
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    member_started = False
+    try:
+        for chunk in chunks:
+            while chunk:
+                member_started = True
+                output += decompressor.decompress(chunk, max_size + 1 - len(output))
+                if len(output) > max_size:
+                    raise RequestParsingError(f"Decompressed data exceeds the maximum size of {max_size} bytes.")
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    member_started = False
+                else:
+                    chunk = decompressor.unconsumed_tail
+    except zlib.error as error:
+        raise RequestParsingError("Failed to decompress data. %s" % (str(error)))
+    if member_started:
+        raise RequestParsingError(
+            "Failed to decompress data. Compressed file ended before the end-of-stream marker was reached"
+        )
+    return output
+
+
+def _iter_request_body(request: HttpRequest, chunk_size: int = 64 * 1024) -> Generator[bytes, None, None]:
+    """
+    Reads the body in chunks, enforcing DATA_UPLOAD_MAX_MEMORY_SIZE on it as Django does when reading `request.body`.
+    """
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    if max_size is not None and int(request.META.get("CONTENT_LENGTH") or 0) > max_size:
+        raise RequestParsingError(f"Request body exceeds the maximum size of {max_size} bytes.")
+    size = 0
+    while True:
+        chunk = request.read(chunk_size)
+        if not chunk:
+            return
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise RequestParsingError(f"Request body exceeds the maximum size of {max_size} bytes.")
+        yield chunk
+
+
+LZ64_ALPHABET = {character: index for index, character in enumerate(lzstring.keyStrBase64)}
+
+
+def decompress_lz64(compressed: str, max_size: int) -> str:
+    """
+    Same as `lzstring.LZString().decompressFromBase64`, but failing as soon as the output exceeds `max_size`
+    characters. lz-string output can grow quadratically with its input, so it mustn't be decompressed in full first.
+    """
+    try:
+        values = [LZ64_ALPHABET[character] for character in compressed]
+    except KeyError:
+        raise RequestParsingError("Failed to decompress data.")
+    if not values:
+        raise RequestParsingError("Failed to decompress data.")
+
+    # Bits are read from the lowest of each character's 6 bits upwards. Running out of characters is an error, as
+    # with the lzstring package
+    reader = {"value": values[0], "position": 32, "index": 1}
+
+    def read_bits(count: int) -> int:
+        bits = 0
+        for power in range(count):
+            if reader["value"] & reader["position"]:
+                bits |= 1 << power
+            reader["position"] >>= 1
+            if reader["position"] == 0:
+                if reader["index"] >= len(values):
+                    raise RequestParsingError("Failed to decompress data.")
+                reader["position"] = 32
+                reader["value"] = values[reader["index"]]
+                reader["index"] += 1
+        return bits
+
+    first = read_bits(2)
+    if first not in (0, 1):
+        raise RequestParsingError("Failed to decompress data.")
+    w = chr(read_bits(8 if first == 0 else 16))
+    dictionary: Dict[int, str] = {3: w}
+    dictionary_size, bits_per_code, enlarge_in = 4, 3, 4
+    result, size = [w], len(w)
+
+    while True:
+        if reader["index"] > len(values):
+            raise RequestParsingError("Failed to decompress data.")
+        code = read_bits(bits_per_code)
+        if code == 0 or code == 1:
+            dictionary[dictionary_size] = chr(read_bits(8 if code == 0 else 16))
+            code = dictionary_size
+            dictionary_size += 1
+            enlarge_in -= 1
+        elif code == 2:
+            return "".join(result)
+
+        if enlarge_in == 0:
+            enlarge_in = 2 ** bits_per_code
+            bits_per_code += 1
+
+        if code in dictionary:
+            entry = dictionary[code]
+        elif code == dictionary_size:
+            entry = w + w[0]
+        else:
+            raise RequestParsingError("Failed to decompress data.")
+        result.append(entry)
+        size += len(entry)
+        if size > max_size:
+            raise RequestParsingError(f"Decompressed data exceeds the maximum size of {max_size} bytes.")
+
+        dictionary[dictionary_size] = w + entry[0]
+        dictionary_size += 1
+        enlarge_in -= 1
+        w = entry
+
+        if enlarge_in == 0:
+            enlarge_in = 2 ** bits_per_code
+            bits_per_code += 1
+
+
 # Used by non-DRF endpoins from capture.py and decide.py (/decide, /batch, /capture, etc)
 def load_data_from_request(request):
+    compression = (
+        request.GET.get("compression") or request.POST.get("compression") or request.headers.get("content-encoding", "")
+    )
+    compression = compression.lower()
+    max_size = settings.DATA_UPLOAD_MAX_DECOMPRESSED_SIZE
+
     data = None
     if request.method == "POST":
         if request.content_type in ["", "text/plain", "application/json"]:
-            data = request.body
+            if compression == "gzip" or compression == "gzip-js":
+                # Decompress straight from the request stream instead of loading the compressed body first
+                data = decompress_gzip(_iter_request_body(request), max_size)
+                compression = ""
+            else:
+                data = request.body
         else:
             data = request.POST.get("data")
     else:
@@ -393,23 +533,17 @@ def load_data_from_request(request):
     with push_scope() as scope:
         scope.set_context("data", data)
 
-    compression = (
-        request.GET.get("compression") or request.POST.get("compression") or request.headers.get("content-encoding", "")
-    )
-    compression = compression.lower()
-
     if compression == "gzip" or compression == "gzip-js":
-        try:
-            data = gzip.decompress(data)
-        except (EOFError, OSError) as error:
-            raise RequestParsingError("Failed to decompress data. %s" % (str(error)))
+        if isinstance(data, str):
+            data = data.encode()
+        data = decompress_gzip([data], max_size)
 
     if compression == "lz64":
         if not isinstance(data, str):
             data = data.decode()
         data = data.replace(" ", "+")
 
-        data = lzstring.LZString().decompressFromBase64(data)
+        data = decompress_lz64(data, max_size)
 
         if not data:
             raise RequestParsingError("Failed to decompress data.")
@@ -426,6 +560,7 @@ def load_data_from_request(request):
         data = base64_decoded
 
     try:
+        # The payload is parsed as a whole, which DATA_UPLOAD_MAX_DECOMPRESSED_SIZE bounds, rather than event by event
         # parse_constant gets called in case of NaN, Infinity etc
         # default behaviour is to put those into the DB directly
         # but we just want it to return None
@@ -437,6 +572,36 @@ def load_data_from_request(request):
     return data
 
 
+_local_cache_lock = threading.Lock()
+
+
+def local_cache_get(cache: Dict[str, Tuple[float, Any]], key: str) -> Tuple[bool, Any]:
+    """
+    Looks up `key` in an in-process TTL + LRU cache dict, as filled by `local_cache_set`.
+    Returns whether there was a fresh entry along with its value.
+    """
+    with _local_cache_lock:
+        entry = cache.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        cache[key] = entry  # Re-inserting marks the entry as most recently used
+        return True, entry[1]
+
+
+def local_cache_set(cache: Dict[str, Tuple[float, Any]], key: str, value: Any, ttl: float, max_size: int) -> None:
+    with _local_cache_lock:
+        cache.pop(key, None)
+        cache[key] = (time.monotonic() + ttl, value)
+        while len(cache) > max_size:
+            cache.pop(next(iter(cache)))
+
+
+def local_cache_evict(cache: Dict[str, Tuple[float, Any]], should_evict: Callable[[str, Any], bool]) -> None:
+    with _local_cache_lock:
+        for key in [key for key, (_, value) in cache.items() if should_evict(key, value)]:
+            cache.pop(key, None)
+
+
 class SingletonDecorator:
     def __init__(self, klass):
         self.klass = klass